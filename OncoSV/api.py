@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import os
+from argparse import Namespace
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+import pandas as pd
+from .consensus_calling import consensus_calling
+from .contigs import resolve_contigs
+from .main_consensus import (CALLER_LABELS, clustering_options, consensus_header_lines, consensus_output_filename,
+                             filter_clusters, parse_caller_vcfs)
+from .main_somatic import annotate_population, classify_variants, pair_output_filenames, write_pair_outputs
+from .parallel_ingest import parse_vcfs
+from .prepare_vcf_output_file import generate_vcf_from_dataframe
+from .process_vcf_to_dataframe import calls_from_dataframe, process_vcf_to_dataframe
+from .profiling import StageProfiler
+
+# Library API: the consensus, pair and complexSV stages as functions that take
+# VCF paths or in-memory frames and return their results as DataFrames, so a
+# workflow can chain them in one process without argparse namespaces or
+# intermediate files. Writing the usual output files is optional (out_file /
+# out_dir), and the progress messages the CLI prints are swallowed unless
+# quiet=False.
+#
+#   result = api.consensus('T.sniffles.vcf', 'T.cutesv.vcf', 'T.svim.vcf')
+#   normal = api.consensus('N.sniffles.vcf', 'N.cutesv.vcf', 'N.svim.vcf')
+#   paired = api.pair(result, normal)
+#   networks = api.complex_sv(paired, output_dir='complex/')
+#
+# Frames passed in are used as they are: caller frames as returned by
+# process_vcf_to_dataframe, consensus calls as in ConsensusResult.calls (or
+# PairResult.somatic), which are re-typed with calls_from_dataframe as the
+# pipeline command does.
+
+VcfInput = Union[str, os.PathLike, pd.DataFrame]
+HeaderLines = Tuple[List[str], List[str]]
+
+@dataclass
+class ConsensusResult:
+    """Filtered consensus calls, with the contig/FILTER header lines of their VCF."""
+    calls: pd.DataFrame
+    contigs: List[str]
+    header: HeaderLines
+    vcf_path: Optional[str] = None
+
+@dataclass
+class PairResult:
+    """The four classify_variants frames."""
+    somatic: pd.DataFrame
+    germline: pd.DataFrame
+    germline_normal: pd.DataFrame
+    mosaic_normal: pd.DataFrame
+    contigs: List[str]
+    vcf_paths: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class ComplexSVResult:
+    """Shared-read SV pairs with breakpoint overlaps, and the complex SV groups and networks."""
+    shared_counts: pd.DataFrame
+    networks: pd.DataFrame
+    contigs: List[str]
+    csv_paths: Dict[str, str] = field(default_factory=dict)
+
+def _is_path(value):
+    return isinstance(value, (str, os.PathLike))
+
+def _output(quiet):
+    return contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+
+def _minimal_header(contigs):
+    return [f'##contig=<ID={contig}>' for contig in contigs], ['##FILTER=<ID=PASS,Description="All filters passed">']
+
+def consensus(sniffles: VcfInput, cutesv: VcfInput, svim: VcfInput, chrom: str = 'all',
+              exclude_chrom: Optional[str] = None, quality_threshold: int = 10, minimum_sv_size: int = 50,
+              maximum_sv_size: int = 1000000, sample_id: Optional[str] = None, apply_af_filtering: bool = True,
+              large_sv_matching: str = 'start', reciprocal_overlap: float = 0.5, exclude_bed: Optional[str] = None,
+              threads: int = 1, out_file: Optional[str] = None, compress: bool = False, quiet: bool = True) -> ConsensusResult:
+    """
+    Consensus calls of the three callers (VCF paths or caller frames), as
+    `OncoSV consensus`. The VCF is written only when out_file is given.
+    """
+    args = Namespace(chrom=chrom, exclude_chrom=exclude_chrom, quality_threshold=quality_threshold,
+                     minimum_sv_size=minimum_sv_size, maximum_sv_size=maximum_sv_size, sample_id=sample_id,
+                     apply_af_filtering=str(apply_af_filtering), large_sv_matching=large_sv_matching,
+                     reciprocal_overlap=reciprocal_overlap, exclude_bed=exclude_bed, threads=threads)
+    inputs = dict(zip(CALLER_LABELS, (sniffles, cutesv, svim)))
+    paths = {caller: os.fspath(value) for caller, value in inputs.items() if _is_path(value)}
+    profiler = StageProfiler('consensus')
+    with _output(quiet):
+        options = clustering_options(args)
+        chroms = resolve_contigs(chrom, list(paths.values()), exclude_chrom)
+        frames = parse_caller_vcfs(paths, chroms, args, profiler, callers=list(paths)) if paths else {}
+        frames.update({caller: value[value['CHROM'].isin(chroms)]
+                       for caller, value in inputs.items() if caller not in paths})
+        with profiler.stage('cluster'):
+            clusters = consensus_calling(*(frames[caller] for caller in CALLER_LABELS), chroms=chroms, **options)
+        calls = filter_clusters(clusters, profiler)
+
+        if 'sniffles' in paths and 'cutesv' in paths:
+            header = consensus_header_lines(paths, chroms)
+        else:
+            header = _minimal_header(chroms)
+        vcf_path = None
+        if out_file:
+            vcf_path = consensus_output_filename(out_file, compress)
+            generate_vcf_from_dataframe(calls, *header, vcf_path, compress, threads=threads)
+    return ConsensusResult(calls, chroms, header, vcf_path)
+
+def _pair_input(value, chroms, qual, minimum_sv_size, maximum_sv_size, apply_af_filtering, vcf_format, sample_id,
+                exclude_bed, threads):
+    """Frame and header template of a pair input: a VCF path, ConsensusResult or consensus-call frame."""
+    if _is_path(value):
+        job = dict(vcf_file=os.fspath(value), chromosomes=chroms, qual=qual, vcf_format=vcf_format,
+                   lower_sv_size=minimum_sv_size, upper_sv_size=maximum_sv_size, sample_id=sample_id,
+                   apply_af_filtering=apply_af_filtering, exclude_bed=exclude_bed)
+        frame, = parse_vcfs([job], threads=threads)
+        return frame, os.fspath(value)
+    header = value.header if isinstance(value, ConsensusResult) else _minimal_header(chroms)
+    calls = value.calls if isinstance(value, ConsensusResult) else value
+    frame = calls_from_dataframe(calls, chroms, qual=qual, lower_sv_size=minimum_sv_size,
+                                 upper_sv_size=maximum_sv_size, apply_af_filtering=apply_af_filtering)
+    return frame, header
+
+def pair(tumour: Union[VcfInput, ConsensusResult], normal: Union[VcfInput, ConsensusResult], chrom: str = 'all',
+         exclude_chrom: Optional[str] = None, quality_threshold: int = 10, minimum_sv_size: int = 50,
+         maximum_sv_size: int = 1000000, vcf_format: str = 'consensus', tumour_id: str = 'Sample',
+         normal_id: str = 'Sample', exclude_bed: Optional[str] = None, threads: int = 1,
+         out_dir: Optional[str] = None, svcaller: str = 'consensus', only_somatic: bool = False, compress: bool = False, patient_id: Optional[str] = None,
+         population_catalogue: Optional[str] = None, population_index: Optional[str] = None,
+         quiet: bool = True) -> PairResult:
+    """
+    Somatic/germline classification of a tumour against one normal (VCF
+    paths, ConsensusResults or consensus-call frames), as `OncoSV pair`. The
+    VCFs are written only when out_dir is given; with population_catalogue
+    the frames carry POP_AF.
+    """
+    paths = [os.fspath(value) for value in (tumour, normal) if _is_path(value)]
+    chroms = resolve_contigs(chrom, paths, exclude_chrom)
+    profiler = StageProfiler('pair')
+    with _output(quiet):
+        tumour_df, tumour_header = _pair_input(tumour, chroms, quality_threshold, minimum_sv_size, maximum_sv_size,
+                                               True, vcf_format, tumour_id, exclude_bed, threads)
+        normal_df, normal_header = _pair_input(normal, chroms, 0, minimum_sv_size, maximum_sv_size,
+                                               False, vcf_format, normal_id, exclude_bed, threads)
+        frames = classify_variants(tumour_df, normal_df, chroms, profiler)
+        frames = annotate_population(frames, Namespace(population_catalogue=population_catalogue,
+                                                       population_index=population_index, threads=threads), profiler)
+
+        vcf_paths = {}
+        if out_dir:
+            args = Namespace(out_dir=out_dir, svcaller=svcaller, only_somatic=only_somatic, compress=compress,
+                             patient_id=patient_id, threads=threads)
+            write_pair_outputs(frames, tumour_header, normal_header, args, profiler)
+            vcf_paths = pair_output_filenames(args)
+    return PairResult(*frames, chroms, vcf_paths)
+
+def complex_sv(calls: Union[VcfInput, PairResult], output_dir: str, chrom: str = 'all',
+               exclude_chrom: Optional[str] = None, qual: int = 10, minimum_sv_size: int = 50,
+               maximum_sv_size: int = 1000000, sample_id: Optional[str] = None, vcf_format: str = 'consensus',
+               label_prefix: Optional[str] = None, exclude_bed: Optional[str] = None, threads: int = 1,
+               quiet: bool = True) -> ComplexSVResult:
+    """
+    Shared-read networks of somatic calls (a VCF path, PairResult or
+    consensus-call frame), as `OncoSV complexSV`. The shared-read and
+    network tables are also written to output_dir as CSV.
+    """
+    from .main_complexSV import analyse_complex_svs
+
+    chroms = resolve_contigs(chrom, [os.fspath(calls)] if _is_path(calls) else [], exclude_chrom)
+    os.makedirs(output_dir, exist_ok=True)
+    with _output(quiet):
+        if _is_path(calls):
+            vcf = process_vcf_to_dataframe(os.fspath(calls), chroms, qual=qual, vcf_format=vcf_format,
+                                           lower_sv_size=minimum_sv_size, upper_sv_size=maximum_sv_size,
+                                           sample_id=sample_id, apply_af_filtering=False, threads=threads,
+                                           exclude_bed=exclude_bed)
+        else:
+            frame = calls.somatic if isinstance(calls, PairResult) else calls
+            vcf = calls_from_dataframe(frame, chroms, qual=qual, lower_sv_size=minimum_sv_size,
+                                       upper_sv_size=maximum_sv_size, sample_id=sample_id,
+                                       apply_af_filtering=False, include_variant_ID=True)
+        shared_counts, networks = analyse_complex_svs(vcf, output_dir, label_prefix, StageProfiler('complexSV'))
+    prefix = f"{label_prefix}_" if label_prefix else ''
+    csv_paths = {'shared_counts': os.path.join(output_dir, f'{prefix}shared_sv_counts_breakopints_overlap.csv'),
+                 'networks': os.path.join(output_dir, f'{prefix}complexSV_groups_networks.csv')}
+    return ComplexSVResult(shared_counts, networks, chroms, csv_paths)
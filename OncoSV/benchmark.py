@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from argparse import Namespace
+
+from .contigs import PRIMARY_CHROMS
+from .profiling import StageProfiler
+from .simulate_vcf import CALLER_IDS, simulate_tumour_normal, write_sample_vcfs
+
+# Benchmark harness: simulated tumour/normal caller VCFs at fixed sizes, timed
+# per core function and per subcommand. Every measurement is appended to a
+# JSON-lines results file together with the git commit, so runs on different
+# commits can be compared with `OncoSV benchmark --compare BASE CANDIDATE`.
+
+BENCHMARK_SIZES = (10000, 100000, 1000000)
+
+def git_revision(path=None):
+    """(commit, dirty) of the checkout containing `path`; ('unknown', None) outside git."""
+    path = path or os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=path, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', None
+
+def parse_type_mix(text):
+    """'DEL=0.4,INS=0.35,...' -> {'DEL': 0.4, 'INS': 0.35, ...}"""
+    if not text:
+        return None
+    mix = {}
+    for item in text.split(','):
+        svtype, weight = item.split('=')
+        mix[svtype.strip().upper()] = float(weight)
+    return mix
+
+def prepare_dataset(n_svs, work_dir, seed=0, overlap_rate=0.5, **simulation):
+    """
+    Simulate (once) tumour and normal VCFs for the three callers and return
+    {'dir': ..., 'tumour': {caller: path}, 'normal': {caller: path}}.
+    Datasets are cached under work_dir, keyed by size and generator settings.
+    """
+    settings = dict(simulation, seed=seed, overlap_rate=overlap_rate)
+    key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:8]
+    data_dir = os.path.join(work_dir, f'n{n_svs}_{key}')
+    stamp = os.path.join(data_dir, 'dataset.json')
+    paths = {
+        sample: {caller: os.path.join(data_dir, f'{sample}.{caller}.vcf.gz') for caller in CALLER_IDS}
+        for sample in ('tumour', 'normal')
+    }
+    if not os.path.exists(stamp):
+        print(f"Simulating {n_svs} SVs in {data_dir}...")
+        tumour, normal = simulate_tumour_normal(n_svs, overlap_rate=overlap_rate, seed=seed, **simulation)
+        write_sample_vcfs(tumour, data_dir, 'tumour', seed=seed)
+        write_sample_vcfs(normal, data_dir, 'normal', seed=seed + 10)
+        with open(stamp, 'w') as file:
+            json.dump(dict(settings, n_svs=n_svs), file, indent=2)
+    return dict(paths, dir=data_dir)
+
+# ─── setup helpers (run untimed, cached per dataset) ─────────────────────────
+def _caller_frames(data, cache, sample):
+    key = ('frames', sample)
+    if key not in cache:
+        from .process_vcf_to_dataframe import process_vcf_to_dataframe
+        cache[key] = [
+            process_vcf_to_dataframe(data[sample][caller], PRIMARY_CHROMS, qual=10, vcf_format=caller)
+            for caller in CALLER_IDS
+        ]
+    return cache[key]
+
+def _consensus_frame(data, cache, sample, filtered=True):
+    key = ('consensus', sample)
+    if key not in cache:
+        from .consensus_calling import consensus_calling
+        cache[key] = consensus_calling(*_caller_frames(data, cache, sample), chroms=PRIMARY_CHROMS)
+    if not filtered:
+        return cache[key]
+    if ('filtered', sample) not in cache:
+        from .filter_consensus_calls import filter_consensus_calls
+        cache[('filtered', sample)] = filter_consensus_calls(cache[key])
+    return cache[('filtered', sample)]
+
+def _consensus_args(data, sample):
+    return Namespace(
+        sniffles=data[sample]['sniffles'], cutesv=data[sample]['cutesv'], svim=data[sample]['svim'],
+        out_file=os.path.join(data['dir'], 'out', f'{sample}_consensus'), chrom='all', sample_id='Sample',
+        quality_threshold=10, minimum_sv_size=50, maximum_sv_size=1000000, compress=False, threads=1,
+        apply_af_filtering=None)
+
+def _consensus_vcf(data, cache, sample):
+    key = ('consensus_vcf', sample)
+    if key not in cache:
+        from .main_consensus import run_consensus
+        args = _consensus_args(data, sample)
+        os.makedirs(os.path.dirname(args.out_file), exist_ok=True)
+        run_consensus(args)
+        cache[key] = args.out_file + '.vcf'
+    return cache[key]
+
+# ─── benchmarks: each takes (data, cache) and returns the callable to time ───
+def bench_process_vcf_to_dataframe(data, cache):
+    from .process_vcf_to_dataframe import process_vcf_to_dataframe
+    return lambda: process_vcf_to_dataframe(data['tumour']['sniffles'], PRIMARY_CHROMS, qual=10, vcf_format='sniffles')
+
+def bench_consensus_calling(data, cache):
+    from .consensus_calling import consensus_calling
+    frames = _caller_frames(data, cache, 'tumour')
+    return lambda: consensus_calling(*frames, chroms=PRIMARY_CHROMS)
+
+def bench_filter_consensus_calls(data, cache):
+    from .filter_consensus_calls import filter_consensus_calls
+    consensus_df = _consensus_frame(data, cache, 'tumour', filtered=False)
+    return lambda: filter_consensus_calls(consensus_df.copy())
+
+def bench_identify_variants(data, cache):
+    from .identify_variants_withID_proximity import identify_variants
+    tumour, normal = _consensus_frame(data, cache, 'tumour'), _consensus_frame(data, cache, 'normal')
+    return lambda: identify_variants(tumour, normal, PRIMARY_CHROMS, window_size=200)
+
+def bench_format_vcf_records(data, cache):
+    from .prepare_vcf_output_file import format_vcf_records
+    consensus_df = _consensus_frame(data, cache, 'tumour')
+    return lambda: format_vcf_records(consensus_df)
+
+def bench_process_shared_reads(data, cache):
+    from .shared_reads_sv import process_shared_reads
+    consensus_df = _consensus_frame(data, cache, 'tumour')
+    return lambda: process_shared_reads(consensus_df)
+
+def bench_consensus(data, cache):
+    from .main_consensus import run_consensus
+    args = _consensus_args(data, 'tumour')
+    os.makedirs(os.path.dirname(args.out_file), exist_ok=True)
+    return lambda: run_consensus(args)
+
+def bench_pair(data, cache):
+    from .main_somatic import run_pair
+    args = Namespace(
+        tumour_consensus=_consensus_vcf(data, cache, 'tumour'), normal_sample=_consensus_vcf(data, cache, 'normal'),
+        out_dir=os.path.join(data['dir'], 'out'), normal_mode='single', chrom='all', vcf_format='consensus',
+        tumour_id='Sample', normal_id='Sample', quality_threshold=10, minimum_sv_size=50, maximum_sv_size=1000000,
+        only_somatic=False, compress=False, threads=1, patient_id=None, svcaller='consensus', save_merged_normal='false')
+    return lambda: run_pair(args)
+
+def bench_complexSV(data, cache):
+    from .main_complexSV import run_complexSV
+    args = Namespace(
+        vcf=_consensus_vcf(data, cache, 'tumour'), output_dir=os.path.join(data['dir'], 'out'), chrom='all',
+        sample_id='Sample', qual=10, minimum_sv_size=50, maximum_sv_size=1000000, vcf_format='consensus',
+        label_prefix='benchmark', svcaller='consensus')
+    return lambda: run_complexSV(args)
+
+BENCHMARKS = {
+    'functions': {
+        'process_vcf_to_dataframe': bench_process_vcf_to_dataframe,
+        'consensus_calling': bench_consensus_calling,
+        'filter_consensus_calls': bench_filter_consensus_calls,
+        'identify_variants': bench_identify_variants,
+        'format_vcf_records': bench_format_vcf_records,
+        'process_shared_reads': bench_process_shared_reads,
+    },
+    'commands': {
+        'consensus': bench_consensus,
+        'pair': bench_pair,
+        'complexSV': bench_complexSV,
+    },
+}
+
+def _result_rows(result):
+    if isinstance(result, tuple):
+        return sum(len(part) for part in result if hasattr(part, '__len__'))
+    return len(result) if hasattr(result, '__len__') else None
+
+def select_benchmarks(suite='all', only=None):
+    suites = list(BENCHMARKS) if suite == 'all' else [suite]
+    selected = [(name, BENCHMARKS[s][name], s) for s in suites for name in BENCHMARKS[s]]
+    if only:
+        unknown = set(only) - {name for name, _, _ in selected}
+        if unknown:
+            raise ValueError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+        selected = [entry for entry in selected if entry[0] in only]
+    return selected
+
+def run_benchmarks(sizes, work_dir, results_file, suite='all', only=None, repeat=1, verbose=False, **simulation):
+    """
+    Time the selected benchmarks at each size and append one JSON line per
+    measurement to results_file. A failing benchmark is recorded with its
+    error and does not stop the run.
+    """
+    selected = select_benchmarks(suite, only)
+    commit, dirty = git_revision()
+    profiler = StageProfiler('benchmark')
+    os.makedirs(work_dir, exist_ok=True)
+
+    for n_svs in sizes:
+        data = prepare_dataset(n_svs, work_dir, **simulation)
+        cache = {}
+        for name, factory, suite_name in selected:
+            for attempt in range(repeat):
+                status, stage = 'ok', None
+                output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+                try:
+                    with output:
+                        call = factory(data, cache)
+                        with profiler.stage(name) as stage:
+                            stage.rows = _result_rows(call())
+                except Exception as error:
+                    status = f"error: {type(error).__name__}: {error}"
+                # only keep timings of a call that actually ran
+                measurement = stage if stage is not None and stage.wall_s is not None else None
+                _append_result(results_file, commit, dirty, n_svs, suite_name, name, attempt, measurement, status)
+                if measurement is None:
+                    print(f"{name} @ {n_svs}: {status}")
+                else:
+                    print(f"{name} @ {n_svs}: {measurement.wall_s:.3f} s wall, {measurement.cpu_s:.3f} s CPU, "
+                          f"{measurement.rows} rows ({status})")
+    print(f"Benchmark results appended to {results_file}")
+
+def _append_result(results_file, commit, dirty, n_svs, suite, name, attempt, measurement, status):
+    record = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'n_svs': n_svs,
+        'suite': suite,
+        'benchmark': name,
+        'repeat': attempt,
+        'status': status,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    if measurement is not None:
+        timings = measurement.as_dict()
+        del timings['command'], timings['stage']
+        record.update(timings)
+    with open(results_file, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+def load_results(results_file):
+    with open(results_file) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def compare_results(results_file, baseline, candidate):
+    """Print median wall time per (benchmark, size) for two commits (prefixes allowed) and their ratio."""
+    def medians(prefix):
+        times = {}
+        for record in load_results(results_file):
+            if record['commit'].startswith(prefix) and record['status'] == 'ok':
+                times.setdefault((record['benchmark'], record['n_svs']), []).append(record['wall_s'])
+        return {key: sorted(values)[len(values) // 2] for key, values in times.items()}
+
+    base, cand = medians(baseline), medians(candidate)
+    keys = sorted(set(base) | set(cand), key=lambda key: (key[1], key[0]))
+    print(f"{'benchmark':<28}{'n_svs':>10}{baseline[:10]:>14}{candidate[:10]:>14}{'ratio':>9}")
+    for name, n_svs in keys:
+        b, c = base.get((name, n_svs)), cand.get((name, n_svs))
+        ratio = f"{c / b:.2f}" if b and c else '-'
+        print(f"{name:<28}{n_svs:>10}{'-' if b is None else f'{b:.3f}':>14}{'-' if c is None else f'{c:.3f}':>14}{ratio:>9}")
+
+def run_benchmark(args):
+    if getattr(args, 'compare', None):
+        compare_results(args.results, *args.compare)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    simulation = {
+        'seed': args.seed,
+        'overlap_rate': args.overlap_rate,
+        'bnd_fraction': args.bnd_fraction,
+        'rnames_depth': args.rnames_depth,
+        'type_mix': parse_type_mix(args.type_mix),
+    }
+    if args.prepare_only:
+        for n_svs in sizes:
+            data = prepare_dataset(n_svs, args.work_dir, **simulation)
+            print(f"Dataset for {n_svs} SVs: {data['dir']}")
+        return
+
+    run_benchmarks(
+        sizes,
+        args.work_dir,
+        args.results,
+        suite=args.suite,
+        only=args.only.split(',') if args.only else None,
+        repeat=args.repeat,
+        verbose=args.verbose,
+        **simulation
+    )
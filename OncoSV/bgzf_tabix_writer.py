@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import struct
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# BGZF (SAM spec section 4.1): gzip members of at most 64 KiB carrying their
+# compressed size in a 'BC' extra field. 0xff00 bytes of input always deflate
+# to less than that, which is also the block size htslib uses.
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# Tabix binning scheme (min_shift 14, depth 5) and its pseudo-bin for stats
+TBI_MIN_SHIFT = 14
+TBI_META_BIN = 37450
+TBI_FORMAT_VCF = 2
+
+
+def compress_block(data, level=6):
+    """One complete BGZF block for up to BGZF_BLOCK_SIZE bytes of data."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2,
+                         len(payload) + 25)
+    return header + payload + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def reg2bin(beg, end):
+    """Smallest tabix bin containing the 0-based half-open interval [beg, end)."""
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return 4681 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return 585 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return 73 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return 9 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return 1 + (beg >> 26)
+    return 0
+
+
+def vcf_interval(line):
+    """
+    (CHROM, beg, end) of a VCF data line the way tabix's vcf preset sees it:
+    0-based POS-1, end from len(REF) or INFO/END when that lies past POS.
+    """
+    fields = line.split("\t", 8)
+    beg = int(fields[1]) - 1
+    end = beg + max(len(fields[3]), 1)
+    info = fields[7]
+    if info.startswith("END="):
+        start = 4
+    else:
+        start = info.find(";END=")
+        start = start + 5 if start >= 0 else -1
+    if start >= 0:
+        stop = info.find(";", start)
+        value = info[start:] if stop < 0 else info[start:stop]
+        try:
+            info_end = int(value)
+        except ValueError:
+            info_end = None
+        if info_end is not None and info_end > beg:
+            end = info_end
+    return fields[0], beg, end
+
+
+class _ContigIndex:
+    """Tabix bins, linear index and stats for one contig, built record by record."""
+
+    def __init__(self):
+        self.bins = {}
+        self.linear = []
+        self.current_bin = None
+        self.save_off = None
+        self.last_off = None
+        self.first_off = None
+        self.last_beg = -1
+        self.n_records = 0
+
+    def push(self, beg, end, off_beg, off_end):
+        if beg < self.last_beg:
+            raise ValueError(f"Records are not sorted by position (POS {beg + 1} after {self.last_beg + 1})")
+        self.last_beg = beg
+        if self.first_off is None:
+            self.first_off = off_beg
+
+        # Records arrive sorted by beg, so every window up to the furthest one
+        # reached so far already has its first overlapping record.
+        last_window = (end - 1) >> TBI_MIN_SHIFT
+        first_unset = max(beg >> TBI_MIN_SHIFT, len(self.linear))
+        if last_window >= len(self.linear):
+            self.linear.extend([None] * (last_window + 1 - len(self.linear)))
+        for window in range(first_unset, last_window + 1):
+            self.linear[window] = off_beg
+
+        bin_number = reg2bin(beg, end)
+        if bin_number != self.current_bin:
+            if self.current_bin is not None:
+                self.bins.setdefault(self.current_bin, []).append([self.save_off, off_beg])
+            self.current_bin = bin_number
+            self.save_off = off_beg
+        self.last_off = off_end
+        self.n_records += 1
+
+    def finish(self):
+        if self.current_bin is not None:
+            self.bins.setdefault(self.current_bin, []).append([self.save_off, self.last_off])
+            self.current_bin = None
+        for chunks in self.bins.values():
+            merged = [chunks[0]]
+            for chunk in chunks[1:]:
+                if chunk[0] <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], chunk[1])
+                else:
+                    merged.append(chunk)
+            chunks[:] = merged
+        previous = self.first_off
+        for window, offset in enumerate(self.linear):
+            if offset is None:
+                self.linear[window] = previous
+            else:
+                previous = offset
+
+
+class BGZFTabixWriter:
+    """
+    Write a bgzipped VCF and its .tbi in a single pass.
+
+    Text is cut into full BGZF blocks that are deflated by a pool of `threads`
+    workers (zlib releases the GIL) and written in order. Data lines passed to
+    write_records() are indexed as they go, keyed by their uncompressed
+    position; those positions are translated to virtual file offsets on
+    close(), so the index never needs a second read of the output.
+    """
+
+    def __init__(self, filename, threads=1, level=6, index=True):
+        self.filename = filename
+        self.level = level
+        self.index = index
+        self._file = open(filename, "wb")
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._max_pending = 4 * threads
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._position = 0                 # uncompressed bytes written so far
+        self._block_offsets = array("q")   # file offset of every data block
+        self._contigs = {}
+        self._contig = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(write_index=exc_type is None)
+
+    def write(self, text):
+        """Append header text (not indexed)."""
+        self._append(text.encode("utf-8"))
+
+    def write_records(self, lines):
+        """Append newline-terminated VCF data lines, indexing each one."""
+        if not lines:
+            return
+        data = "".join(lines).encode("utf-8")
+        if self.index:
+            position = self._position
+            exact = len(data) == sum(map(len, lines))   # ASCII: chars == bytes
+            for line in lines:
+                line_end = position + (len(line) if exact else len(line.encode("utf-8")))
+                self._index_record(line, position, line_end)
+                position = line_end
+        self._append(data)
+
+    def _index_record(self, line, off_beg, off_end):
+        chrom, beg, end = vcf_interval(line)
+        if chrom != self._contig:
+            if self._contig is not None:
+                self._contigs[self._contig].finish()
+            if chrom in self._contigs:
+                raise ValueError(f"Records are not grouped by contig: {chrom} appears in two blocks")
+            self._contigs[chrom] = _ContigIndex()
+            self._contig = chrom
+        self._contigs[chrom].push(beg, end, off_beg, off_end)
+
+    def _append(self, data):
+        self._buffer += data
+        self._position += len(data)
+        full = len(self._buffer) - len(self._buffer) % BGZF_BLOCK_SIZE
+        for start in range(0, full, BGZF_BLOCK_SIZE):
+            self._submit(bytes(self._buffer[start:start + BGZF_BLOCK_SIZE]))
+        del self._buffer[:full]
+
+    def _submit(self, data):
+        if self._executor is None:
+            self._write_block(compress_block(data, self.level))
+            return
+        self._pending.append(self._executor.submit(compress_block, data, self.level))
+        if len(self._pending) > self._max_pending:
+            self._write_block(self._pending.popleft().result())
+
+    def _write_block(self, block):
+        self._block_offsets.append(self._file.tell())
+        self._file.write(block)
+
+    def _virtual_offsets(self, positions):
+        """Uncompressed positions -> BGZF virtual offsets (block start << 16 | offset in block)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        block_starts = np.append(np.frombuffer(self._block_offsets, dtype=np.int64), self._file_end)
+        blocks = positions // BGZF_BLOCK_SIZE
+        # the very end of the data points at the EOF marker
+        return ((block_starts[blocks] << 16) | (positions % BGZF_BLOCK_SIZE)).astype(np.uint64)
+
+    def close(self, write_index=True):
+        if self._closed:
+            return
+        self._closed = True
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_block(self._pending.popleft().result())
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._file_end = self._file.tell()
+        self._file.write(BGZF_EOF)
+        self._file.close()
+
+        if self.index and write_index:
+            if self._contig is not None:
+                self._contigs[self._contig].finish()
+            write_bgzf(self.filename + ".tbi", self._tbi_bytes(), level=self.level)
+
+    def _tbi_bytes(self):
+        names = b"".join(name.encode("utf-8") + b"\0" for name in self._contigs)
+        out = [b"TBI\1", struct.pack("<8i", len(self._contigs), TBI_FORMAT_VCF, 1, 2, 0, ord("#"), 0, len(names)), names]
+        voff = self._virtual_offsets
+        for contig in self._contigs.values():
+            out.append(struct.pack("<i", len(contig.bins) + 1))
+            for bin_number in sorted(contig.bins):
+                chunks = contig.bins[bin_number]
+                out.append(struct.pack("<Ii", bin_number, len(chunks)))
+                out.append(voff(chunks).astype("<u8").tobytes())
+            first_off, last_off = voff([contig.first_off, contig.last_off])
+            out.append(struct.pack("<IiQQQQ", TBI_META_BIN, 2, first_off, last_off, contig.n_records, 0))
+            out.append(struct.pack("<i", len(contig.linear)))
+            out.append(voff(contig.linear).astype("<u8").tobytes())
+        out.append(struct.pack("<Q", 0))
+        return b"".join(out)
+
+
+def write_bgzf(filename, data, level=6):
+    """Write bytes as a complete BGZF file (used for the small .tbi)."""
+    with open(filename, "wb") as file:
+        for start in range(0, len(data), BGZF_BLOCK_SIZE):
+            file.write(compress_block(data[start:start + BGZF_BLOCK_SIZE], level))
+        file.write(BGZF_EOF)
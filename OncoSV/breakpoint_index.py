@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from .consensus_state import _contig_filename
+from .contigs import contigs_from_args
+from .main_consensus import consensus_output_filename
+from .process_vcf_to_dataframe import process_vcf_to_dataframe
+from .shard_merge import read_vcf_text, sort_records
+from .prepare_vcf_output_file import write_vcf_file
+
+# Cohort breakpoint index for `OncoSV cohort-index`: the somatic calls of
+# every sample added, partitioned by CHROM and sorted by POS, so a new
+# sample's calls can be checked for recurrence without re-matching VCFs
+# pairwise.
+#
+#   DIR/index.json          format version, match window and the samples
+#                           added (patient, VCF, number of calls)
+#   DIR/contigs/<contig>.pkl  the indexed calls of each contig, by POS
+#
+# A query matches each call against every indexed sample the way
+# identify_variants matches a tumour call against a normal: SVTYPE, POS
+# within the window of a breakpoint (both breakpoints, in either
+# orientation, except for DEL/DUP over 1 kb), the closest candidate, and
+# the SVLEN agreement checks for INS and large DEL/DUP. The windows are
+# binary-searched in the POS-sorted partitions, so a lookup costs
+# O(log n + k) in the cohort size. Re-adding a sample replaces its calls.
+
+INDEX_VERSION = 1
+LARGE_SV = 1000
+INDEX_COLUMNS = ('POS', 'END', 'CHROM2', 'SVTYPE', 'SVLEN', 'sample')
+
+def _match_frame(calls):
+    """CHROM, the INDEX_COLUMNS but sample, numeric and with absolute DEL SVLEN as identify_variants uses them."""
+    frame = pd.DataFrame({
+        'CHROM': calls['CHROM'].astype(str),
+        'POS': pd.to_numeric(calls['POS'], errors='coerce'),
+        'END': pd.to_numeric(calls['END'], errors='coerce'),
+        'CHROM2': calls['CHROM2'].astype(str),
+        'SVTYPE': calls['SVTYPE'].astype(str),
+        'SVLEN': pd.to_numeric(calls['SVLEN'], errors='coerce'),
+    })
+    frame.loc[frame['SVTYPE'] == 'DEL', 'SVLEN'] = frame['SVLEN'].abs()
+    return frame
+
+def _discordant_size(svtype, tumour_svlen, normal_svlen):
+    """identify_variants' SVLEN check: True when the closest match still counts as a different SV."""
+    if svtype == 'INS' and tumour_svlen > 0 and normal_svlen > 0:
+        threshold = 0.3
+    elif svtype in ('DUP', 'DEL') and tumour_svlen > LARGE_SV:
+        threshold = 0.2
+    else:
+        return False
+    mean_svlen = (tumour_svlen + normal_svlen) / 2
+    svlen_sd = ((tumour_svlen - mean_svlen)**2 + (normal_svlen - mean_svlen)**2)**0.5 / 2
+    return svlen_sd > threshold * normal_svlen
+
+class Partition:
+    """The indexed calls of one contig as POS-sorted arrays."""
+
+    def __init__(self, frame):
+        frame = frame.sort_values('POS', kind='stable')
+        self.frame = frame.reset_index(drop=True)
+        self.pos = self.frame['POS'].to_numpy(dtype=np.float64)
+        self.end = self.frame['END'].to_numpy(dtype=np.float64)
+        self.chrom2 = self.frame['CHROM2'].to_numpy(dtype=object)
+        self.svtype = self.frame['SVTYPE'].to_numpy(dtype=object)
+        self.svlen = self.frame['SVLEN'].to_numpy(dtype=np.float64)
+        self.sample = self.frame['sample'].to_numpy(dtype=np.int64)
+
+    def window(self, low, high, svtype):
+        """Row numbers with POS in [low, high] and the given SVTYPE."""
+        first = np.searchsorted(self.pos, low, side='left')
+        last = np.searchsorted(self.pos, high, side='right')
+        rows = np.arange(first, last)
+        return rows[self.svtype[first:last] == svtype]
+
+class BreakpointIndex:
+    """The files of a cohort index directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.partitions = {}
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def exists(self):
+        return os.path.exists(self._path('index.json'))
+
+    def create(self, window_size):
+        os.makedirs(self._path('contigs'), exist_ok=True)
+        self.meta = {'version': INDEX_VERSION, 'window_size': window_size, 'samples': [], 'contigs': []}
+        self._save_meta()
+
+    def load(self):
+        with open(self._path('index.json')) as file:
+            self.meta = json.load(file)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported cohort index version in {self.directory}: {self.meta.get('version')}")
+        return self
+
+    def _save_meta(self):
+        with open(self._path('index.json.tmp'), 'w') as file:
+            json.dump(self.meta, file, indent=1)
+        os.replace(self._path('index.json.tmp'), self._path('index.json'))
+
+    @property
+    def window_size(self):
+        return self.meta['window_size']
+
+    def _stored(self, contig):
+        if contig not in self.meta['contigs']:
+            return pd.DataFrame({column: [] for column in INDEX_COLUMNS})
+        return pd.read_pickle(self._path('contigs', _contig_filename(contig)))
+
+    def partition(self, contig):
+        if contig not in self.partitions:
+            self.partitions[contig] = Partition(self._stored(contig)) if contig in self.meta['contigs'] else None
+        return self.partitions[contig]
+
+    def add(self, calls, sample_id, patient_id=None, vcf=None):
+        """Add (or replace) the calls of a sample; returns the number indexed."""
+        samples = [sample['sample_id'] for sample in self.meta['samples']]
+        if sample_id in samples:
+            code = samples.index(sample_id)
+        else:
+            code = len(samples)
+            self.meta['samples'].append(None)
+        frame = _match_frame(calls)
+        frame['sample'] = code
+
+        for contig in dict.fromkeys(self.meta['contigs'] + list(frame['CHROM'].unique())):
+            stored = self._stored(contig)
+            added = frame.loc[frame['CHROM'] == contig, list(INDEX_COLUMNS)]
+            merged = pd.concat([stored[stored['sample'] != code], added], ignore_index=True)
+            merged = merged.sort_values('POS', kind='stable').reset_index(drop=True)
+            merged.to_pickle(self._path('contigs', _contig_filename(contig)))
+            if contig not in self.meta['contigs']:
+                self.meta['contigs'].append(contig)
+            self.partitions.pop(contig, None)
+
+        self.meta['samples'][code] = {'sample_id': sample_id, 'patient_id': patient_id or sample_id,
+                                      'vcf': os.path.abspath(vcf) if vcf else None, 'calls': len(frame)}
+        self._save_meta()
+        return len(frame)
+
+    def _sample_matches(self, call):
+        """Codes of the indexed samples with a call identify_variants would match `call` to."""
+        window_size = self.window_size
+        chrom1, pos1, chrom2, pos2 = call.CHROM, call.POS, call.CHROM2, call.END
+        svtype, svlen = call.SVTYPE, call.SVLEN
+        if pd.isna(pos1):
+            return set()
+        large = svtype in ('DUP', 'DEL') and svlen > LARGE_SV
+
+        # (partition, rows) per orientation: forward on CHROM, reverse on CHROM2
+        sides = []
+        forward = self.partition(chrom1)
+        reverse = self.partition(chrom2) if not pd.isna(pos2) else None
+        if forward is not None:
+            rows = forward.window(pos1 - window_size, pos1 + window_size, svtype)
+            if not large:
+                end = forward.end[rows]
+                rows = rows[(forward.chrom2[rows] == chrom2) & (end >= pos2 - window_size) & (end <= pos2 + window_size)]
+            sides.append((forward, rows))
+        if reverse is not None:
+            rows = reverse.window(pos2 - window_size, pos2 + window_size, svtype)
+            if not large:
+                end = reverse.end[rows]
+                rows = rows[(reverse.chrom2[rows] == chrom1) & (end >= pos1 - window_size) & (end <= pos1 + window_size)]
+            sides.append((reverse, rows))
+
+        # Per sample: forward matches if any, else reverse ones; the closest by POS decides
+        closest = {}
+        for side, (partition, rows) in enumerate(sides):
+            for row in rows:
+                sample = partition.sample[row]
+                proximity = abs(partition.pos[row] - pos1)
+                if sample not in closest or (closest[sample][0] == side and proximity < closest[sample][1]):
+                    closest[sample] = (side, proximity, partition.svlen[row])
+        return {sample for sample, (_, _, normal_svlen) in closest.items()
+                if not _discordant_size(svtype, svlen, normal_svlen)}
+
+    def recurrence(self, calls, exclude_sample=None, exclude_patient=None):
+        """
+        (samples, patients): per call, the number of other indexed samples and
+        patients with a matching call; exclude_sample/exclude_patient leave
+        out the query's own sample or patient.
+        """
+        patients = [sample['patient_id'] for sample in self.meta['samples']]
+        excluded = {code for code, sample in enumerate(self.meta['samples'])
+                    if sample['sample_id'] == exclude_sample or sample['patient_id'] == exclude_patient}
+        sample_counts, patient_counts = [], []
+        for call in _match_frame(calls).itertuples(index=False):
+            matched = self._sample_matches(call) - excluded
+            sample_counts.append(len(matched))
+            patient_counts.append(len({patients[code] for code in matched}))
+        return (pd.Series(sample_counts, index=calls.index, dtype='int64'),
+                pd.Series(patient_counts, index=calls.index, dtype='int64'))
+
+RECURRENCE_INFO = [
+    '##INFO=<ID=COHORT_SAMPLES,Number=1,Type=Integer,Description="Other samples of the cohort index with a matching somatic SV">',
+    '##INFO=<ID=COHORT_PATIENTS,Number=1,Type=Integer,Description="Other patients of the cohort index with a matching somatic SV">',
+]
+
+def annotate_vcf_lines(header, records, calls, samples, patients):
+    """
+    VCF header and data lines with COHORT_SAMPLES/COHORT_PATIENTS added to
+    the INFO of every record in `calls` (matched by CHROM, POS and ID).
+    """
+    counts = {(str(chrom), int(pos), str(record_id)): (n_samples, n_patients)
+              for chrom, pos, record_id, n_samples, n_patients
+              in zip(calls['CHROM'], calls['POS'], calls['ID'], samples, patients)}
+    header = [line for line in header if not line.startswith(('##INFO=<ID=COHORT_SAMPLES,', '##INFO=<ID=COHORT_PATIENTS,'))]
+    info_lines = [i for i, line in enumerate(header) if line.startswith('##INFO=')]
+    position = info_lines[-1] + 1 if info_lines else len(header) - 1
+    header = header[:position] + RECURRENCE_INFO + header[position:]
+
+    annotated = []
+    for line in records:
+        fields = line.rstrip('\n').split('\t')
+        key = (fields[0], int(fields[1]), fields[2])
+        if key in counts and len(fields) > 7:
+            info = [part for part in fields[7].split(';')
+                    if part not in ('', '.') and not part.startswith(('COHORT_SAMPLES=', 'COHORT_PATIENTS='))]
+            info += [f"COHORT_SAMPLES={counts[key][0]}", f"COHORT_PATIENTS={counts[key][1]}"]
+            fields[7] = ';'.join(info)
+        annotated.append('\t'.join(fields) + '\n')
+    return header, annotated
+
+def read_somatic_calls(args):
+    """The calls of args.vcf, parsed as a pair output."""
+    chroms = contigs_from_args(args, [args.vcf])
+    return process_vcf_to_dataframe(args.vcf, chroms, qual=args.quality_threshold, vcf_format=args.vcf_format,
+                                    lower_sv_size=args.minimum_sv_size, upper_sv_size=args.maximum_sv_size,
+                                    apply_af_filtering=False, threads=args.threads, exclude_bed=args.exclude_bed)
+
+def run_cohort_index(args):
+    index = BreakpointIndex(args.index)
+    if args.action == 'add':
+        if not args.sample_id:
+            raise ValueError("cohort-index add needs --sample-id")
+        if not index.exists():
+            print(f"Creating cohort index {args.index} (window {args.window_size} bp)")
+            index.create(args.window_size)
+        else:
+            index.load()
+            if args.window_size != index.window_size:
+                print(f"Using the index's window of {index.window_size} bp")
+        calls = read_somatic_calls(args)
+        n_calls = index.add(calls, args.sample_id, args.patient_id, args.vcf)
+        print(f"{n_calls} calls of {args.sample_id} indexed; {len(index.meta['samples'])} sample(s) in {args.index}")
+    elif args.action == 'query':
+        if not index.exists():
+            raise ValueError(f"No cohort index in {args.index}")
+        index.load()
+        calls = read_somatic_calls(args)
+        samples, patients = index.recurrence(calls, args.sample_id, args.patient_id)
+        print(f"{int((samples > 0).sum())} of {len(calls)} calls recur in the cohort index")
+
+        header, records = read_vcf_text(args.vcf)
+        header, records = annotate_vcf_lines(header, records, calls, samples, patients)
+        output_filename = consensus_output_filename(args.out_file, args.compress)
+        if args.compress:
+            # tabix needs the records grouped by contig and sorted by POS
+            records = [line for _, line in sort_records([(0, line) for line in records])]
+        if os.path.dirname(output_filename):
+            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+        write_vcf_file(output_filename, header, records, args.compress, args.threads)
+        print(f"Annotated VCF written to {output_filename}")
@@ -1,11 +1,37 @@
 #!/usr/bin/env python3
 
 import argparse
-from .main_consensus import run_consensus
-from .main_somatic import run_pair
-from .main_complexSV import run_complexSV
 
-def main():
+# Subcommand implementations are imported only once the subcommand is known,
+# so `--help` and short per-chromosome jobs do not pay for pandas/pysam (and,
+# for complexSV, networkx/matplotlib) start-up unless they actually run them.
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile-report', type=str, help='Write per-stage wall/CPU time, RSS and row counts to this file (.json or .tsv)')
+    parser.add_argument('--profile-hook', type=str, choices=["cprofile", "pyinstrument"], help='Also profile each stage, saved next to the report')
+
+def add_read_name_store_argument(parser):
+    parser.add_argument('--read-name-store', type=str, metavar='DIR', help='Keep RNAMES in a memory-mapped pool under DIR instead of in memory (lowers memory for deep read sets)')
+
+def add_ingest_workers_argument(parser):
+    parser.add_argument('--ingest-workers', type=int, default=1, help='Processes parsing the input VCFs concurrently (default: 1)')
+
+def add_exclude_bed_argument(parser):
+    parser.add_argument('--exclude-bed', type=str, metavar='BED', help='Drop calls with a breakpoint in these regions (e.g. centromeres, telomeres, blacklists) right after parsing')
+
+def add_large_sv_matching_arguments(parser):
+    parser.add_argument('--large-sv-matching', type=str, choices=["start", "overlap"], default='start', help='Cluster large DEL/DUP by start position and SVLEN spread (start) or by reciprocal overlap of their spans (overlap)')
+    parser.add_argument('--reciprocal-overlap', type=float, default=0.5, help='Minimum reciprocal overlap for --large-sv-matching overlap (default: 0.5)')
+
+def add_population_arguments(parser):
+    parser.add_argument('--population-catalogue', type=str, metavar='VCF', help='SV catalogue VCF with AF (e.g. gnomAD-SV); adds the closest matching SV\'s AF as INFO POP_AF')
+    parser.add_argument('--population-index', type=str, metavar='DIR', help='Where the catalogue\'s breakpoint index is kept (default: <catalogue>.popindex)')
+
+def add_parquet_arguments(parser):
+    parser.add_argument('--parquet', type=str, choices=["off", "alongside", "instead"], default='off', help='Also (alongside) or only (instead) write the outputs as typed Parquet tables (needs pyarrow)')
+    parser.add_argument('--arrow', action='store_true', help='Write Arrow IPC (.arrow, memory-mappable) instead of Parquet tables')
+
+def build_parser():
     parser = argparse.ArgumentParser(description="ComplexSVnet Package CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -20,13 +46,24 @@ def main():
     parser_consensus.add_argument('-o', '--out-file', type=str, required=True, help='Output VCF file')
 
     # Optional arguments for 'consensus'
-    parser_consensus.add_argument('-x', '--chrom', type=str, help='Which chromosomes to query', default='all')
+    parser_consensus.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+    parser_consensus.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
     parser_consensus.add_argument('--sample-id', type=str, help='Sample ID', default='Sample')
     parser_consensus.add_argument('-q', '--quality-threshold', type=int, help='Minimum quality of SVs', default=10)
     parser_consensus.add_argument('-m', '--minimum-sv-size', type=int, help='Minimum SV size', default=50)
     parser_consensus.add_argument('-M', '--maximum-sv-size', type=int, help='Maximum SV size', default=1000000)
     parser_consensus.add_argument('--compress', action='store_true', help='Compress the VCF file')
+    parser_consensus.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression (default: 1)')
     parser_consensus.add_argument('--apply-af-filtering', type=str, choices=["true", "false"], help='AF filtering')
+    parser_consensus.add_argument('--shard', action='store_true', help='Write a shard of a per-chromosome run (-x) for `merge`')
+    add_profile_arguments(parser_consensus)
+    add_parquet_arguments(parser_consensus)
+    add_read_name_store_argument(parser_consensus)
+    add_ingest_workers_argument(parser_consensus)
+    add_large_sv_matching_arguments(parser_consensus)
+    add_exclude_bed_argument(parser_consensus)
+    parser_consensus.add_argument('--state-dir', type=str, metavar='DIR', help='Save the parsed inputs and clusters to DIR for later --update runs')
+    parser_consensus.add_argument('--update', action='store_true', help='Re-parse only changed inputs and re-cluster only affected contigs, starting from --state-dir')
 
     # Subparser for the 'pair' command
     parser_pair = subparsers.add_parser('pair', help='Run somatic and germline variant calling for paired samples')
@@ -51,7 +88,8 @@ def main():
     parser_pair.add_argument('--save-merged-normal', type=str, choices=["true", "false"], default="false", help="Save merged normal samples as CSV (default: false)")
 
     # Optional arguments for 'pair'
-    parser_pair.add_argument('-x', '--chrom', type=str, help='Chromosomes to query', default='all')
+    parser_pair.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+    parser_pair.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
     parser_pair.add_argument('--vcf-format', type=str, help='VCF format', default='consensus')
     parser_pair.add_argument('--tumour-id', type=str, help='Tumour sample ID', default='Sample')
     parser_pair.add_argument('--normal-id', type=str, help='Normal sample ID', default='Sample')
@@ -60,8 +98,17 @@ def main():
     parser_pair.add_argument('-M', '--maximum-sv-size', type=int, help='Maximum SV size', default=1000000)
     parser_pair.add_argument('--only-somatic', action='store_true', help='Only generate VCF for somatic variants')
     parser_pair.add_argument('--compress', action='store_true', help='Compress VCF file')
+    parser_pair.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression (default: 1)')
     parser_pair.add_argument('--patient-id', type=str, help='Patient ID label')
     parser_pair.add_argument('--svcaller', type=str, choices=["consensus", "sniffles", "cutesv", "svim"], help="SV caller", default="consensus")
+    parser_pair.add_argument('--shard', action='store_true', help='Write a shard of a per-chromosome run (-x) for `merge`')
+    add_profile_arguments(parser_pair)
+    add_parquet_arguments(parser_pair)
+    add_read_name_store_argument(parser_pair)
+    add_ingest_workers_argument(parser_pair)
+    add_population_arguments(parser_pair)
+    add_exclude_bed_argument(parser_pair)
+    parser_pair.add_argument('--stream-normal', action='store_true', help='Read only the normal calls near tumour breakpoints from a tabix-indexed normal VCF (single normal mode; mosaic-normal output is then partial)')
 
     # Subparser for the 'complexSV' command
     parser_complexSV = subparsers.add_parser('complexSV', help='Run complex SV analysis')
@@ -71,7 +118,8 @@ def main():
     parser_complexSV.add_argument("--output_dir", type=str, required=True, help="Output directory")
 
     # Optional arguments for 'complexSV'
-    parser_complexSV.add_argument('-x', '--chrom', type=str, help='Chromosomes to query', default='all')
+    parser_complexSV.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+    parser_complexSV.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
     parser_complexSV.add_argument("--sample_id", type=str, help="Sample ID")
     parser_complexSV.add_argument("--qual", type=int, default=10, help="Quality threshold")
     parser_complexSV.add_argument('-sv', '--minimum-sv-size', type=int, help='Minimum SV size', default=50)
@@ -79,18 +127,159 @@ def main():
     parser_complexSV.add_argument("--vcf_format", default='consensus', help="VCF file format")
     parser_complexSV.add_argument("--label_prefix", type=str, default='', help="Label prefix for output filenames")
     parser_complexSV.add_argument('--svcaller', type=str, choices=["consensus", "sniffles", "cutesv", "svim"], help="SV caller", default="consensus")
+    parser_complexSV.add_argument('--threads', type=int, default=1, help='Threads for BGZF decompression (default: 1)')
+    add_profile_arguments(parser_complexSV)
+    add_parquet_arguments(parser_complexSV)
+    add_read_name_store_argument(parser_complexSV)
+    add_exclude_bed_argument(parser_complexSV)
 
-    args = parser.parse_args()
+    # Subparser for the 'pipeline' command
+    parser_pipeline = subparsers.add_parser('pipeline', help='Run consensus, pair and complexSV in one process without intermediate VCFs')
+    parser_pipeline.add_argument('-s', '--sniffles', type=str, required=True, help='Tumour Sniffles VCF file')
+    parser_pipeline.add_argument('-c', '--cutesv', type=str, required=True, help='Tumour CuteSV VCF file')
+    parser_pipeline.add_argument('-v', '--svim', type=str, required=True, help='Tumour SVIM VCF file')
+    parser_pipeline.add_argument('-o', '--out-dir', type=str, required=True, help='Output directory')
+    parser_pipeline.add_argument('-n', '--normal-consensus', type=str, help='Normal consensus VCF file')
+    parser_pipeline.add_argument('--normal-sniffles', type=str, help='Normal Sniffles VCF file (instead of --normal-consensus)')
+    parser_pipeline.add_argument('--normal-cutesv', type=str, help='Normal CuteSV VCF file (instead of --normal-consensus)')
+    parser_pipeline.add_argument('--normal-svim', type=str, help='Normal SVIM VCF file (instead of --normal-consensus)')
+    parser_pipeline.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+    parser_pipeline.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
+    parser_pipeline.add_argument('--sample-id', type=str, help='Sample ID in the caller VCFs', default='Sample')
+    parser_pipeline.add_argument('-q', '--quality-threshold', type=int, help='Minimum quality of SVs', default=10)
+    parser_pipeline.add_argument('-m', '--minimum-sv-size', type=int, help='Minimum SV size', default=50)
+    parser_pipeline.add_argument('-M', '--maximum-sv-size', type=int, help='Maximum SV size', default=1000000)
+    parser_pipeline.add_argument('--apply-af-filtering', type=str, choices=["true", "false"], help='AF filtering')
+    parser_pipeline.add_argument('--only-somatic', action='store_true', help='Only generate VCF for somatic variants')
+    parser_pipeline.add_argument('--patient-id', type=str, help='Patient ID label')
+    parser_pipeline.add_argument('--label-prefix', type=str, default='', help='Label prefix for output filenames')
+    parser_pipeline.add_argument('--stop-after', type=str, choices=["consensus", "pair", "complexSV"], default='complexSV', help='Last stage to run (default: complexSV)')
+    parser_pipeline.add_argument('--skip-consensus-vcf', action='store_true', help='Do not write the consensus VCFs')
+    parser_pipeline.add_argument('--compress', action='store_true', help='Compress the VCF files')
+    parser_pipeline.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression (default: 1)')
+    parser_pipeline.set_defaults(svcaller='consensus')
+    add_profile_arguments(parser_pipeline)
+    add_parquet_arguments(parser_pipeline)
+    add_read_name_store_argument(parser_pipeline)
+    add_ingest_workers_argument(parser_pipeline)
+    add_large_sv_matching_arguments(parser_pipeline)
+    add_population_arguments(parser_pipeline)
+    add_exclude_bed_argument(parser_pipeline)
 
+    # Subparser for the 'merge' command
+    parser_merge = subparsers.add_parser('merge', help='Merge per-chromosome consensus or pair shards into one indexed VCF per output')
+    parser_merge.add_argument('shards', type=str, nargs='+', help='Shard manifests (*.shard.json) written with --shard')
+    parser_merge.add_argument('-o', '--out', type=str, required=True, help='Output VCF file (consensus shards) or directory (pair shards)')
+    parser_merge.add_argument('--uncompressed', action='store_true', help='Write plain VCF instead of bgzipped, tabix-indexed VCF')
+    parser_merge.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression (default: 1)')
+    parser_merge.add_argument('--verify-against', type=str, metavar='PATH', help='Whole-genome output (consensus VCF, or pair output directory) the merged records must equal, IDs aside')
+
+    # Subparser for the 'benchmark' command
+    parser_benchmark = subparsers.add_parser('benchmark', help='Time core functions and subcommands on simulated VCFs')
+    parser_benchmark.add_argument('--sizes', type=str, default='10000,100000,1000000', help='Comma-separated numbers of simulated SVs (default: 10000,100000,1000000)')
+    parser_benchmark.add_argument('--suite', type=str, choices=["functions", "commands", "all"], default='all', help='Which benchmarks to run (default: all)')
+    parser_benchmark.add_argument('--only', type=str, help='Comma-separated benchmark names to run')
+    parser_benchmark.add_argument('--repeat', type=int, default=1, help='Repetitions per benchmark (default: 1)')
+    parser_benchmark.add_argument('--work-dir', type=str, default='oncosv_benchmark', help='Directory for simulated VCFs and outputs')
+    parser_benchmark.add_argument('--results', type=str, default='benchmark_results.jsonl', help='JSON-lines file the results are appended to')
+    parser_benchmark.add_argument('--compare', type=str, nargs=2, metavar=('BASE', 'CANDIDATE'), help='Compare stored results of two commits instead of running')
+    parser_benchmark.add_argument('--prepare-only', action='store_true', help='Only simulate the VCFs')
+    parser_benchmark.add_argument('--verbose', action='store_true', help='Show pipeline progress messages')
+    parser_benchmark.add_argument('--seed', type=int, default=0, help='Random seed for the simulation')
+    parser_benchmark.add_argument('--type-mix', type=str, help='SV type weights, e.g. DEL=0.4,INS=0.35,DUP=0.1,INV=0.05')
+    parser_benchmark.add_argument('--bnd-fraction', type=float, default=0.1, help='Fraction of breakend SVs (default: 0.1)')
+    parser_benchmark.add_argument('--rnames-depth', type=int, default=10, help='Mean supporting reads per SV (default: 10)')
+    parser_benchmark.add_argument('--overlap-rate', type=float, default=0.5, help='Fraction of tumour SVs also present in the normal (default: 0.5)')
+
+    # Subparser for the 'batch' command
+    parser_batch = subparsers.add_parser('batch', help='Run consensus, pair and complexSV over a sample manifest')
+    parser_batch.add_argument('--manifest', type=str, required=True, help='Tab-separated manifest: sample_id, sniffles, cutesv, svim, normal, patient_id')
+    parser_batch.add_argument('-o', '--out-dir', type=str, required=True, help='Output directory (one sub-directory per sample)')
+    parser_batch.add_argument('-j', '--jobs', type=int, default=1, help='Stages run concurrently (default: 1)')
+    parser_batch.add_argument('--stages', type=str, default='consensus,pair', help='Stages to run: consensus, pair, complexSV (default: consensus,pair)')
+    parser_batch.add_argument('--force', action='store_true', help='Re-run stages even if their outputs are up to date')
+    parser_batch.add_argument('--dry-run', action='store_true', help='Only print which stages would run')
+    parser_batch.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+    parser_batch.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
+    parser_batch.add_argument('-q', '--quality-threshold', type=int, help='Minimum quality of SVs', default=10)
+    parser_batch.add_argument('-m', '--minimum-sv-size', type=int, help='Minimum SV size', default=50)
+    parser_batch.add_argument('-M', '--maximum-sv-size', type=int, help='Maximum SV size', default=1000000)
+    parser_batch.add_argument('--only-somatic', action='store_true', help='Only generate VCF for somatic variants')
+    parser_batch.add_argument('--compress', action='store_true', help='Compress the VCF files')
+    parser_batch.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression per stage (default: 1)')
+    add_read_name_store_argument(parser_batch)
+    add_ingest_workers_argument(parser_batch)
+    add_large_sv_matching_arguments(parser_batch)
+    add_population_arguments(parser_batch)
+    add_exclude_bed_argument(parser_batch)
+
+    # Subparser for the 'serve' command
+    parser_serve = subparsers.add_parser('serve', help='Run a local job server for consensus, pair, complexSV and pipeline jobs')
+    parser_serve.add_argument('--socket', type=str, help='Listen on this Unix socket instead of loopback HTTP')
+    parser_serve.add_argument('--port', type=int, default=8765, help='Loopback HTTP port (default: 8765; 0 picks a free one)')
+    parser_serve.add_argument('-w', '--workers', type=int, default=1, help='Jobs run concurrently (default: 1)')
+    parser_serve.add_argument('--max-queued', type=int, default=100, help='Jobs waiting at most; further submissions are refused (default: 100)')
+    parser_serve.add_argument('--cache-size', type=int, default=8, help='Parsed VCFs each worker keeps in memory for reuse (default: 8; 0 disables)')
+    parser_serve.add_argument('--log-dir', type=str, default='oncosv_serve_logs', help='Directory for the per-job logs (default: oncosv_serve_logs)')
+
+    # Subparser for the 'cohort-index' command
+    parser_cohort = subparsers.add_parser('cohort-index', help='Index somatic calls across a cohort and annotate new samples with their recurrence')
+    cohort_actions = parser_cohort.add_subparsers(dest='action', required=True)
+    parser_cohort_add = cohort_actions.add_parser('add', help="Add (or replace) a sample's somatic calls in the index")
+    parser_cohort_query = cohort_actions.add_parser('query', help="Annotate a sample's calls with COHORT_SAMPLES/COHORT_PATIENTS recurrence counts")
+    for cohort_parser in (parser_cohort_add, parser_cohort_query):
+        cohort_parser.add_argument('-i', '--index', type=str, required=True, help='Cohort index directory')
+        cohort_parser.add_argument('--vcf', type=str, required=True, help='Somatic variants VCF (pair output)')
+        cohort_parser.add_argument('--sample-id', type=str, help='Sample label in the index (query: leave this sample out)')
+        cohort_parser.add_argument('--patient-id', type=str, help='Patient label (query: leave this patient\'s samples out)')
+        cohort_parser.add_argument('-x', '--chrom', type=str, help="Contigs to query: 'all' (chr1-22,X,Y), 'header' (every ##contig) or comma-separated names/patterns", default='all')
+        cohort_parser.add_argument('--exclude-chrom', type=str, help='Comma-separated contig names/patterns to leave out, e.g. "*_alt,chrUn*"')
+        cohort_parser.add_argument('--vcf-format', type=str, help='VCF format', default='consensus')
+        cohort_parser.add_argument('-q', '--quality-threshold', type=int, help='Minimum quality of SVs', default=10)
+        cohort_parser.add_argument('-sv', '--minimum-sv-size', type=int, help='Minimum SV size', default=50)
+        cohort_parser.add_argument('-M', '--maximum-sv-size', type=int, help='Maximum SV size', default=1000000)
+        cohort_parser.add_argument('--threads', type=int, default=1, help='Threads for BGZF compression and decompression (default: 1)')
+        add_exclude_bed_argument(cohort_parser)
+    parser_cohort_add.add_argument('--window-size', type=int, default=200, help='Breakpoint match window in bp, fixed when the index is created (default: 200, as pair)')
+    parser_cohort_query.add_argument('-o', '--out-file', type=str, required=True, help='Annotated output VCF')
+    parser_cohort_query.add_argument('--compress', action='store_true', help='Compress VCF file')
+
+    return parser
+
+def run_command(args, parser=None):
     if args.command == "consensus":
+        from .main_consensus import run_consensus
         run_consensus(args)
     elif args.command == "pair":
+        from .main_somatic import run_pair
         run_pair(args)
     elif args.command == "complexSV":
+        from .main_complexSV import run_complexSV
         run_complexSV(args)
-    else:
+    elif args.command == "pipeline":
+        from .main_pipeline import run_pipeline
+        run_pipeline(args)
+    elif args.command == "merge":
+        from .shard_merge import run_merge
+        run_merge(args)
+    elif args.command == "benchmark":
+        from .benchmark import run_benchmark
+        run_benchmark(args)
+    elif args.command == "batch":
+        from .main_batch import run_batch
+        run_batch(args)
+    elif args.command == "serve":
+        from .server import run_serve
+        run_serve(args)
+    elif args.command == "cohort-index":
+        from .breakpoint_index import run_cohort_index
+        run_cohort_index(args)
+    elif parser is not None:
         parser.print_help()
 
+def main():
+    parser = build_parser()
+    run_command(parser.parse_args(), parser)
+
 if __name__ == "__main__":
     main()
-
@@ -2,12 +2,35 @@
 
 import pandas as pd
 import numpy as np
+from .contigs import encode_contigs
+from .interval_index import IntervalIndex
+from .schema import concat_frames, enforce_schema
 
 def remove_empty_columns(df):
     """Remove columns that are entirely empty or all-NA."""
     return df.dropna(axis=1, how='all')
     
-def consensus_calling(sniffle, cutesv, svim, chroms, length=20, sd_threshold=0.2):
+LARGE_SV_MATCHING = ('start', 'overlap')
+
+def consensus_calling(sniffle, cutesv, svim, chroms, length=20, sd_threshold=0.2, mate_chroms=None, start_id=0,
+                      passes=None, pass_ids=False, large_sv_matching='start', reciprocal_overlap=0.5):
+    """
+    Cluster the calls of the three callers into consensus SVs, one pass per
+    contig of chroms. A breakend is seen by the passes of both its contigs;
+    the later pass may re-assign it. An incremental update runs only the
+    passes of `passes` (in chroms order), numbering new clusters from
+    start_id: records whose earlier pass is skipped start out as already
+    clustered. pass_ids keeps the IDs each record got from the pass of its
+    CHROM and of its CHROM2 (chrom_pass_id, chrom2_pass_id).
+
+    Large DEL/DUP (|SVLEN| > 1000) are clustered first. With
+    large_sv_matching='start' a seed collects the calls of its type starting
+    within `length` bp, kept when their SVLEN spread is below sd_threshold;
+    with 'overlap' it collects the calls of its type whose span overlaps its
+    own by at least reciprocal_overlap of both lengths (IntervalIndex).
+    """
+    if large_sv_matching not in LARGE_SV_MATCHING:
+        raise ValueError(f"Unknown large SV matching mode: {large_sv_matching}")
 
     # Save original setting
     original_setting = pd.options.mode.chained_assignment
@@ -20,46 +43,76 @@ def consensus_calling(sniffle, cutesv, svim, chroms, length=20, sd_threshold=0.2
     cutesv = remove_empty_columns(cutesv)
     svim = remove_empty_columns(svim)
 
-    merged_df = pd.concat([sniffle, cutesv, svim], ignore_index=True)
-    merged_df = merged_df[(merged_df['CHROM'].isin(chroms)) & (merged_df['CHROM2'].isin(chroms))]
+    merged_df = concat_frames([sniffle, cutesv, svim], ignore_index=True)
+    # Records are owned by their CHROM; a shard passes the genome-wide list as
+    # mate_chroms so breakends whose mate lies in another shard are kept here
+    mate_chroms = chroms if mate_chroms is None else mate_chroms
+    merged_df = merged_df[(merged_df['CHROM'].isin(chroms)) & (merged_df['CHROM2'].isin(mate_chroms))]
+
+    # Integer contig codes: chroms come first, so chroms[code] is the code's contig
+    contigs = list(dict.fromkeys(list(chroms) + list(mate_chroms)))
+    merged_df['chrom_code'] = encode_contigs(merged_df['CHROM'], contigs)
+    merged_df['chrom2_code'] = encode_contigs(merged_df['CHROM2'], contigs)
 
     # Consensus_ID and flag columns
     merged_df['ConsensusSV_ID'] = None
     merged_df['flag'] = 0
+    if passes is not None:
+        pass_codes = [code for code, chr in enumerate(chroms) if chr in passes]
+        merged_df = merged_df[merged_df['chrom_code'].isin(pass_codes) | merged_df['chrom2_code'].isin(pass_codes)]
+        first_pass = np.minimum(merged_df['chrom_code'], merged_df['chrom2_code'])
+        merged_df['flag'] = (~first_pass.isin(pass_codes)).astype(int)
+    if pass_ids:
+        merged_df['chrom_pass_id'] = None
+        merged_df['chrom2_pass_id'] = None
 
-    n = 0  # Resetting SV number
+    n = start_id  # Resetting SV number (an incremental update continues after the stored IDs)
 
     # Process each chromosome
-    for chr in chroms:
-        chr_df = merged_df[(merged_df['CHROM'] == chr) | (merged_df['CHROM2'] == chr)]
-
-        # Assign values for sorting and applying the new condition
-        chr_df[['chrom_sort', 'chrom2_sort', 'pos_sort', 'end_sort']] = \
-            chr_df.apply(lambda row: pd.Series({
-                'chrom_sort': row['CHROM'] if row['CHROM'] == chr else row['CHROM2'],
-                'chrom2_sort': row['CHROM2'] if row['CHROM'] == chr else row['CHROM'],
-                'pos_sort': row['POS'] if row['CHROM'] == chr else row['END'],
-                'end_sort': row['END'] if row['CHROM'] == chr else row['POS']
-            }), axis=1)
-
-        chr_df = chr_df.sort_values(by='pos_sort')
+    for code, chr in enumerate(chroms):
+        if passes is not None and chr not in passes:
+            continue
+        chr_df = merged_df[(merged_df['chrom_code'] == code) | (merged_df['chrom2_code'] == code)]
+        chr_df['ConsensusSV_ID'] = None    # IDs assigned by this pass
+
+        # Orient every record from this chromosome's side for sorting and matching
+        on_chrom = (chr_df['chrom_code'] == code).to_numpy()
+        chr_df['chrom2_sort'] = np.where(on_chrom, chr_df['chrom2_code'], chr_df['chrom_code'])
+        chr_df['pos_sort'] = np.where(on_chrom, chr_df['POS'], chr_df['END'])
+        chr_df['end_sort'] = np.where(on_chrom, chr_df['END'], chr_df['POS'])
+
+        # Stable, so POS ties keep frame order whatever else the frame holds:
+        # seeding is greedy, and shards and --update passes see fewer rows
+        chr_df = chr_df.sort_values(by='pos_sort', kind='stable')
 
         # First check for large DEL and DUP based on the new condition
         large_del_dup = chr_df[(chr_df['SVTYPE'].isin(['DEL', 'DUP'])) & (chr_df['SVLEN'].abs() > 1000)]
+        if large_sv_matching == 'overlap':
+            spans = {svtype: IntervalIndex(rows['pos_sort'], rows['end_sort'], rows.index)
+                     for svtype, rows in chr_df[chr_df['SVTYPE'].isin(['DEL', 'DUP'])].groupby('SVTYPE', observed=True)}
         for i in large_del_dup.index:
             if chr_df.loc[i, 'flag'] == 0:  # Ensure not already processed
-                # Find overlapping variants
-                overlapping = chr_df[(chr_df['pos_sort'] >= chr_df.loc[i, 'pos_sort'] - length) & 
-                                     (chr_df['pos_sort'] <= chr_df.loc[i, 'pos_sort'] + length) &
-                                     (chr_df['SVTYPE'] == chr_df.loc[i, 'SVTYPE'])]
-                # Calculate the standard deviation of lengths
-                if (overlapping['SVLEN'].std() / abs(chr_df.loc[i, 'SVLEN']) < sd_threshold):
+                # Numbered before use, like the other clusters: a contig's first
+                # large DEL/DUP cluster used to take the number of the previous
+                # contig's last cluster, and filtering kept only one of them
+                n += 1
+                if large_sv_matching == 'overlap':
+                    # Calls of the same type whose spans reciprocally overlap the seed's
+                    overlapping = chr_df.loc[spans[chr_df.loc[i, 'SVTYPE']].reciprocal_overlaps(
+                        chr_df.loc[i, 'pos_sort'], chr_df.loc[i, 'end_sort'], reciprocal_overlap)]
+                else:
+                    # Find overlapping variants
+                    overlapping = chr_df[(chr_df['pos_sort'] >= chr_df.loc[i, 'pos_sort'] - length) & 
+                                         (chr_df['pos_sort'] <= chr_df.loc[i, 'pos_sort'] + length) &
+                                         (chr_df['SVTYPE'] == chr_df.loc[i, 'SVTYPE'])]
+                # Calculate the standard deviation of lengths (reciprocal overlap already bounds them)
+                if (large_sv_matching == 'overlap' or
+                        overlapping['SVLEN'].astype(float).std() / abs(chr_df.loc[i, 'SVLEN']) < sd_threshold):
                     # Assign the same consensus ID if the condition is met
                     consensus_id = f"consensusSV.type.{n}"
                     for idx in overlapping.index:
                         chr_df.at[idx, 'ConsensusSV_ID'] = consensus_id
                         chr_df.at[idx, 'flag'] = 1
-                n += 1
 
         # Process other variants not yet flagged
         for i in chr_df.index:
@@ -77,15 +130,21 @@ def consensus_calling(sniffle, cutesv, svim, chroms, length=20, sd_threshold=0.2
                 chr_df.loc[overlapping_rows.index, 'flag'] = 1
 
         # Update the main DataFrame with the results from this chromosome
-        merged_df.loc[chr_df.index, 'ConsensusSV_ID'] = chr_df['ConsensusSV_ID']
+        assigned = chr_df['ConsensusSV_ID'].notna()
+        merged_df.loc[chr_df.index[assigned], 'ConsensusSV_ID'] = chr_df.loc[assigned, 'ConsensusSV_ID']
         merged_df.loc[chr_df.index, 'flag'] = chr_df['flag']
+        if pass_ids:
+            from_chrom = assigned & (chr_df['chrom_code'] == code)
+            merged_df.loc[chr_df.index[from_chrom], 'chrom_pass_id'] = chr_df.loc[from_chrom, 'ConsensusSV_ID']
+            from_chrom2 = assigned & (chr_df['chrom_code'] != code)
+            merged_df.loc[chr_df.index[from_chrom2], 'chrom2_pass_id'] = chr_df.loc[from_chrom2, 'ConsensusSV_ID']
 
     # Remove unnecessary columns
-    merged_df = merged_df.drop(columns=['flag'])
+    merged_df = merged_df.drop(columns=['flag', 'chrom_code', 'chrom2_code'])
     id_column = merged_df.pop('ConsensusSV_ID')
     merged_df.insert(5, 'ConsensusSV_ID', id_column)
 
-    return merged_df
+    return enforce_schema(merged_df)
 
 # Usage:
 # result = consensus_calling(df_sniffle, df_cutesv, df_svim, chroms)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+from collections import defaultdict
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+# Persisted consensus state for `consensus --state-dir DIR [--update]`.
+#
+#   DIR/state.json          format version, contigs, parse options, a
+#                           fingerprint (path, size, mtime) of each caller VCF
+#                           and the next free consensus cluster number
+#   DIR/callers/<caller>.pkl  the parsed caller frames
+#   DIR/clusters/<contig>.pkl consensus_calling's rows of each contig, sorted
+#                           by POS, with their ConsensusSV_IDs and pass IDs
+#
+# An update re-parses only the callers whose VCF (or the parse options)
+# changed; all of them when contigs are added to -x, since a parse orders rows
+# across contigs. consensus_calling clusters contig by
+# contig, a breakend in the pass of each of its two contigs, and a pass only
+# depends on the records it sees and on which of them an earlier pass already
+# clustered. That holds because each pass sorts its records stably: with an
+# unstable sort the order of POS ties, and with it the greedy clusters,
+# changed with the number of rows in the frame. So a contig's pass is re-run when its records (both ends
+# selected, CHROM or CHROM2 on the contig) differ from the stored ones, and
+# the stored rows keep the cluster ID each pass gave them (chrom_pass_id,
+# chrom2_pass_id): a breakend between a re-run and a kept contig takes the
+# kept pass's ID from the state, and, as in a full run, the later pass's ID
+# wins. Re-run clusters with exactly the same records as before keep their
+# ConsensusSV_ID, new ones are numbered after the stored IDs.
+
+# 2: large DEL/DUP clusters no longer share a number with the previous contig's last cluster
+# 3: contig passes sort POS ties stably
+STATE_VERSION = 3
+CLUSTER_NUMBER = re.compile(r'\.(\d+)$')
+RECORD_KEY_COLUMNS = ('ID', 'CHROM', 'POS', 'END', 'SVTYPE')
+
+def input_fingerprint(path):
+    status = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+def _contig_filename(contig):
+    return quote(contig, safe='') + '.pkl'
+
+class ConsensusState:
+    """The files of a --state-dir."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def exists(self):
+        return os.path.exists(self._path('state.json'))
+
+    def load(self):
+        with open(self._path('state.json')) as file:
+            meta = json.load(file)
+        if meta.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported consensus state version in {self.directory}: {meta.get('version')}")
+        return meta
+
+    def caller_frame(self, caller):
+        return pd.read_pickle(self._path('callers', f'{caller}.pkl'))
+
+    def clusters(self, contigs):
+        """Stored consensus_calling rows of `contigs`, in their original row order."""
+        frames = [pd.read_pickle(self._path('clusters', _contig_filename(contig))) for contig in contigs]
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.read_pickle(self._path('clusters', _contig_filename(contigs[0])))
+        return pd.concat(frames).sort_index()
+
+    def save(self, contigs, options, inputs, caller_frames, clusters, next_id):
+        """Replace the state; state.json is written last, so a partial save is not loadable."""
+        if self.exists():
+            os.remove(self._path('state.json'))
+        for subdirectory in ('callers', 'clusters'):
+            os.makedirs(self._path(subdirectory), exist_ok=True)
+
+        for caller, frame in caller_frames.items():
+            frame.to_pickle(self._path('callers', f'{caller}.pkl'))
+
+        clusters = clusters.reset_index(drop=True)
+        filenames = set()
+        for contig in contigs:
+            filename = _contig_filename(contig)
+            filenames.add(filename)
+            rows = clusters[clusters['CHROM'] == contig]
+            rows.sort_values('POS', kind='stable').to_pickle(self._path('clusters', filename))
+        for filename in os.listdir(self._path('clusters')):
+            if filename not in filenames:
+                os.remove(self._path('clusters', filename))
+
+        meta = {'version': STATE_VERSION, 'contigs': list(contigs), 'options': options,
+                'inputs': inputs, 'next_id': next_id}
+        with open(self._path('state.json.tmp'), 'w') as file:
+            json.dump(meta, file, indent=1)
+        os.replace(self._path('state.json.tmp'), self._path('state.json'))
+
+def _clustered_rows(frame, contigs):
+    """The rows consensus_calling clusters for `contigs` (both ends selected)."""
+    return frame[frame['CHROM'].isin(contigs) & frame['CHROM2'].isin(contigs)]
+
+def _row_hashes(frame):
+    return pd.util.hash_pandas_object(frame.astype(str), index=False).to_numpy()
+
+def changed_contigs(old_frame, new_frame, old_contigs, new_contigs):
+    """Contigs of new_contigs whose pass sees different rows of one caller in the two frames."""
+    old_frame = _clustered_rows(old_frame, old_contigs)
+    new_frame = _clustered_rows(new_frame, new_contigs)
+    if list(old_frame.columns) != list(new_frame.columns):
+        return set(new_contigs)
+    old_hashes, new_hashes = _row_hashes(old_frame), _row_hashes(new_frame)
+    old_chrom, old_chrom2 = (old_frame[column].astype(str).to_numpy() for column in ('CHROM', 'CHROM2'))
+    new_chrom, new_chrom2 = (new_frame[column].astype(str).to_numpy() for column in ('CHROM', 'CHROM2'))
+    return {contig for contig in new_contigs
+            if contig not in old_contigs
+            or not np.array_equal(old_hashes[(old_chrom == contig) | (old_chrom2 == contig)],
+                                  new_hashes[(new_chrom == contig) | (new_chrom2 == contig)])}
+
+def touching(frame, contigs):
+    """Rows of frame with either end on one of contigs."""
+    return frame[frame['CHROM'].isin(contigs) | frame['CHROM2'].isin(contigs)]
+
+def _row_keys(frame):
+    """RECORD_KEY_COLUMNS of each row plus its occurrence number among equal keys."""
+    seen = defaultdict(int)
+    keys = []
+    for key in zip(*(frame[column].astype(str) for column in RECORD_KEY_COLUMNS)):
+        keys.append(key + (seen[key],))
+        seen[key] += 1
+    return keys
+
+def _pass_members(chrom, chrom2, chrom_ids, chrom2_ids, keys, contigs):
+    """Records of each cluster made by the passes of `contigs`."""
+    members = defaultdict(set)
+    for key, *ends in zip(keys, chrom, chrom_ids, chrom2, chrom2_ids):
+        for contig, cluster_id in (ends[:2], ends[2:]):
+            if contig in contigs and cluster_id is not None and cluster_id == cluster_id:
+                members[cluster_id].add(key)
+    return {cluster_id: frozenset(records) for cluster_id, records in members.items()}
+
+def _cluster_number(cluster_id):
+    match = CLUSTER_NUMBER.search(str(cluster_id))
+    return int(match.group(1)) if match else -1
+
+def merge_pass_ids(reclustered, previous, chroms, changed, first_new_id):
+    """
+    reclustered (consensus_calling rows of the passes of `changed`, run with
+    pass_ids) completed from previous (the stored rows touching `changed`):
+    breakends take the pass ID of their kept contig from the state, new
+    clusters with the records of a stored cluster of the same passes get its
+    ID back, and ConsensusSV_ID is the ID of the later pass in chroms order.
+    """
+    keys, previous_keys = _row_keys(reclustered), _row_keys(previous)
+    chrom = reclustered['CHROM'].astype(str).tolist()
+    chrom2 = reclustered['CHROM2'].astype(str).tolist()
+    chrom_ids = reclustered['chrom_pass_id'].tolist()
+    chrom2_ids = reclustered['chrom2_pass_id'].tolist()
+    stored = dict(zip(previous_keys, zip(previous['chrom_pass_id'], previous['chrom2_pass_id'])))
+    for row, key in enumerate(keys):
+        if chrom[row] not in changed:
+            chrom_ids[row] = stored.get(key, (None, None))[0]
+        elif chrom2[row] != chrom[row] and chrom2[row] not in changed:
+            chrom2_ids[row] = stored.get(key, (None, None))[1]
+
+    previous_ids = {records: cluster_id for cluster_id, records in _pass_members(
+        previous['CHROM'].astype(str), previous['CHROM2'].astype(str),
+        previous['chrom_pass_id'], previous['chrom2_pass_id'], previous_keys, changed).items()}
+    renamed = {cluster_id: previous_ids[records]
+               for cluster_id, records in _pass_members(chrom, chrom2, chrom_ids, chrom2_ids, keys, changed).items()
+               if _cluster_number(cluster_id) >= first_new_id and records in previous_ids}
+    chrom_ids = [renamed.get(cluster_id, cluster_id) for cluster_id in chrom_ids]
+    chrom2_ids = [renamed.get(cluster_id, cluster_id) for cluster_id in chrom2_ids]
+
+    order = {contig: code for code, contig in enumerate(chroms)}
+    consensus_ids = []
+    for ends in zip(chrom, chrom_ids, chrom2, chrom2_ids):
+        earlier, later = sorted((ends[:2], ends[2:]), key=lambda end: order[end[0]])
+        consensus_ids.append(later[1] if later[1] is not None and later[1] == later[1] else earlier[1])
+    reclustered['chrom_pass_id'] = chrom_ids
+    reclustered['chrom2_pass_id'] = chrom2_ids
+    reclustered['ConsensusSV_ID'] = consensus_ids
+    return reclustered
+
+def restore_row_order(clusters, caller_frames):
+    """
+    clusters in the row order consensus_calling gives the full caller frames
+    (filter_consensus_calls keeps the first of equally ranked calls).
+    """
+    position = {}
+    for frame in caller_frames:
+        for key in _row_keys(frame):
+            position[key] = len(position)
+    order = np.argsort([position.get(key, len(position)) for key in _row_keys(clusters)], kind='stable')
+    return clusters.iloc[order].reset_index(drop=True)
+
+def next_cluster_id(clusters, next_id=0):
+    """One past the highest consensusSV.type.<n> number in clusters (at least next_id)."""
+    for column in ('chrom_pass_id', 'chrom2_pass_id'):
+        for cluster_id in clusters[column].dropna().unique():
+            next_id = max(next_id, _cluster_number(cluster_id) + 1)
+    return next_id
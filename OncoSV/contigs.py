@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import fnmatch
+import re
+import numpy as np
+import pandas as pd
+from .header_combine import read_vcf_header
+
+# Contig selection for -x/--chrom and --exclude-chrom. `all` keeps the GRCh38
+# primary chromosomes, `header` every contig declared in the input VCFs'
+# ##contig lines, and anything else is a comma-separated list of names or
+# shell patterns (chr*_alt, GL*, ...) expanded against those declarations, so
+# alt contigs, unprefixed (1, 2, X) and mouse/xenograft references work too.
+#
+# Selected contigs are mapped to integer codes in selection order; the
+# clustering and matching engines compare those codes instead of strings.
+
+PRIMARY_CHROMS = ['chr' + str(i + 1) for i in range(22)] + ['chrX', 'chrY']
+CONTIG_ID = re.compile(r'##contig=<ID=([^,>]+)')
+# Mate contig and position in a BND ALT: N[chr2:123[, ]chr2:123]N, ...
+BND_MATE = re.compile(r'[\[\]]([^\[\]:]+):(\d+)[\[\]]')
+
+def header_contigs(vcf_files):
+    """Contig IDs declared by the VCFs' ##contig lines, in first-seen order."""
+    contigs = []
+    for vcf_file in vcf_files:
+        meta, _ = read_vcf_header(vcf_file)
+        for line in meta.get('contig', []):
+            match = CONTIG_ID.match(line)
+            if match:
+                contigs.append(match.group(1))
+    return list(dict.fromkeys(contigs))
+
+def _is_pattern(name):
+    return any(char in name for char in '*?[')
+
+def resolve_contigs(chrom='all', vcf_files=(), exclude=None):
+    """
+    Contigs selected by a -x value and --exclude-chrom patterns (both
+    comma-separated). vcf_files supply the ##contig declarations for `header`
+    and for patterns; plain names are kept even if undeclared.
+    """
+    declared = None
+    if chrom == 'header' or _is_pattern(chrom):
+        declared = header_contigs(vcf_files)
+
+    if chrom == 'all':
+        contigs = list(PRIMARY_CHROMS)
+    elif chrom == 'header':
+        contigs = declared
+    else:
+        contigs = []
+        for name in chrom.split(','):
+            name = name.strip()
+            if _is_pattern(name):
+                contigs.extend(contig for contig in declared if fnmatch.fnmatchcase(contig, name))
+            elif name:
+                contigs.append(name)
+        contigs = list(dict.fromkeys(contigs))
+
+    contigs = exclude_contigs(contigs, exclude)
+    if not contigs:
+        raise ValueError(f"No contigs selected by --chrom {chrom}" + (f" --exclude-chrom {exclude}" if exclude else ''))
+    return contigs
+
+def exclude_contigs(contigs, exclude):
+    """contigs without those matching the comma-separated --exclude-chrom patterns."""
+    if not exclude:
+        return list(contigs)
+    patterns = [pattern.strip() for pattern in exclude.split(',') if pattern.strip()]
+    return [contig for contig in contigs if not any(fnmatch.fnmatchcase(contig, pattern) for pattern in patterns)]
+
+def contigs_from_args(args, vcf_files=()):
+    return resolve_contigs(args.chrom, vcf_files, getattr(args, 'exclude_chrom', None))
+
+def encode_contigs(values, contigs):
+    """Integer codes of a CHROM/CHROM2 column, numbered in `contigs` order; -1 for other values."""
+    return pd.Categorical(values, categories=contigs).codes.astype(np.int32)
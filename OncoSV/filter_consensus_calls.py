@@ -2,6 +2,7 @@
 
 import pandas as pd
 import re
+from .schema import enforce_schema
 
 def filter_consensus_calls(df):
     # Extract 'sv_caller' values from the 'ID' column
@@ -41,4 +42,4 @@ def filter_consensus_calls(df):
     filtered_df['ConsensusSV_ID'] = filtered_df.apply(lambda row: \
     row['ConsensusSV_ID'].replace('type', row['SVTYPE']), axis=1)
 
-    return filtered_df
+    return enforce_schema(filtered_df)
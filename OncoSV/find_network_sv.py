@@ -1,12 +1,13 @@
 import pandas as pd
 import numpy as np
 import networkx as nx
-import community as community_louvain
 from pathlib import Path
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from pyvis.network import Network
 import random
+import json
+
+# python-louvain, matplotlib and pyvis are imported inside the functions that
+# use them: they cost more start-up time than the rest of the pipeline and are
+# only needed for clustering and the HTML export.
 
 # ─────────────────────────────────────────
 # 1.  Build SV graph (shared-read weights)
@@ -33,6 +34,8 @@ def label_sv_clusters(df: pd.DataFrame, G: nx.Graph):
     """
     Add a column Cluster_number = smallest Louvain community ID for the SV IDs in row.ID.
     """
+    import community as community_louvain
+
     partition = community_louvain.best_partition(G)
     df = df.copy()
     df["Cluster_number"] = df["ID"].apply(
@@ -111,6 +114,8 @@ def assign_clone_ids_per_cluster(df: pd.DataFrame):
 # 5.  Build & cluster only rows meeting the read-count threshold
 # ─────────────────────────────────────────
 def process_with_modularity(df_in: pd.DataFrame, min_read_count: int = 2):
+    import community as community_louvain
+
     df = df_in.copy()
 
     # Filter out weak-support patterns *before* building the graph
@@ -146,38 +151,142 @@ def process_with_modularity(df_in: pd.DataFrame, min_read_count: int = 2):
     ]
     return df, G, partition
 
-def make_all_clusters_html(sv_graph,
-                           partition,           # dict {SV_id: SV_Cluster}
-                           clone_map,           # dict {SV_id: Clone_ID}
-                           df_metadata=None,    # DataFrame with ID→CHROM (optional)
-                           outfile="all_clusters_interactive.html"):
-    """
-    Generates one-file interactive vis-network visualisation.
+# ─────────────────────────────────────────
+# 6.  Complex SV groups, modules & networks
+# ─────────────────────────────────────────
+GROUP_COLUMNS = ['ID', 'group', 'CHROM', 'CHROM2', 'POS', 'END', 'Read_Count', 'SV_Count', 'AF', 'CSV_Type',
+                 'POS_BKPT', 'END_BKPT', 'final_combination', 'any_overlapping_sv']
 
-    Parameters
-    ----------
-    sv_graph   : NetworkX Graph returned by process_with_modularity
-    partition  : dict {SV_id: Cluster_number}
-    clone_map  : dict {SV_id: Clone_ID string}
-    df_metadata: optional DataFrame that has columns ['ID','CHROM'] so we can
-                 pick chromosome per SV more robustly.  If None, chromosome is
-                 parsed as the second token in SV id 'Tool.SVTYPE.chr'.
-    outfile    : HTML file to write
+def group_by_group(df: pd.DataFrame, seed: int = 0):
     """
-    # ---------------- palettes ----------------
+    One row per distinct shared-read combination (ID), with the numbers of
+    the groups it belongs to in 'group' (';'-joined). Each SV opens a group of
+    the combinations containing it; identical combinations collapse onto the
+    longest one. 'Module' is the Louvain community (1-based, fixed seed) of
+    the combination's SVs in the shared-read graph.
+    """
+    df = df.sort_values(by='ID')
+    id_lists = df['ID'].str.split(',')
+    sv_list = sorted(set(sv for ids in id_lists for sv in ids))
+
+    complex_rows = {}           # ID -> output row, in first-seen order
+    group_number = 0
+
+    def add_to_group(selected):
+        if selected in complex_rows:
+            complex_rows[selected]['group'] = f"{complex_rows[selected]['group']};{group_number}"
+        else:
+            row_data = df.loc[df['ID'] == selected].iloc[0]
+            row = {column: row_data[column] for column in GROUP_COLUMNS if column != 'group'}
+            row['group'] = group_number
+            complex_rows[selected] = row
+
+    for sv in sv_list:
+        row_i = df.index[id_lists.apply(lambda ids: sv in ids)].tolist()
+
+        if len(row_i) > 1:
+            sv_i = df.loc[row_i, 'ID'].tolist()
+            sv_lists = [item.split(',') for item in sv_i]
+
+            # Identical combinations are one node; the others stand alone
+            G = nx.Graph()
+            G.add_nodes_from(range(len(sv_i)))
+            for j in range(len(sv_i)):
+                for z in range(j + 1, len(sv_i)):
+                    if sv_lists[j] == sv_lists[z]:
+                        G.add_edge(j, z)
+
+            group_number += 1
+            for component in nx.connected_components(G):
+                group_row = [sv_i[idx] for idx in sorted(component)]
+                add_to_group(max(group_row, key=lambda ids: ids.count(',')))
+        elif len(row_i) == 1:
+            selected = df.loc[row_i[0], 'ID']
+            if selected in complex_rows:
+                continue
+            group_number += 1
+            add_to_group(selected)
+
+    complex_df = pd.DataFrame(list(complex_rows.values()), columns=GROUP_COLUMNS)
+
+    import community as community_louvain
+
+    G = build_sv_graph(complex_df, min_read_count=0)
+    partition = community_louvain.best_partition(G, random_state=seed) if G.number_of_edges() else {}
+    complex_df['Module'] = complex_df['ID'].apply(
+        lambda ids: min(partition.get(sv, -1) for sv in ids.split(',')) + 1
+    )
+    return complex_df
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            return item
+        if self.parent[item] == item:
+            return item
+        self.parent[item] = self.find(self.parent[item])  # Path compression
+        return self.parent[item]
+
+    def union(self, set1, set2):
+        root1 = self.find(set1)
+        root2 = self.find(set2)
+        if root1 != root2:
+            self.parent[root2] = root1
+
+
+def identify_networks(df: pd.DataFrame):
+    """Add 'Network': groups sharing a combination are joined into one network (1-based)."""
+    uf = UnionFind()
+    for groups in df['group'].astype(str).str.split(';'):
+        for m in groups:
+            uf.union(groups[0], m)
+
+    roots = sorted(set(uf.find(m) for m in uf.parent), key=int)
+    network_ids = {root: idx + 1 for idx, root in enumerate(roots)}
+
+    df = df.copy()
+    df['Network'] = df['group'].apply(lambda x: network_ids[uf.find(str(x).split(';')[0])])
+    return df
+
+# ─────────────────────────────────────────
+# 7.  Interactive HTML export
+# ─────────────────────────────────────────
+def build_clone_map(final_df: pd.DataFrame) -> dict:
+    """dict {SV_id: Clone_ID} from the rows returned by process_with_modularity."""
+    return {sv: clone
+            for ids, clone in zip(final_df["ID"], final_df["Clone_ID"])
+            for sv in ids.split(",")}
+
+
+def _palettes(clone_map: dict):
+    """Hex colour per chromosome and per Clone_ID."""
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcolors
+
     chrom_list = [f"chr{i}" for i in range(1, 23)] + ["chrX", "chrY"]
-    chrom_palette = dict(zip(
-        chrom_list,
-        plt.get_cmap("tab20").colors * 2      # 24 distinct colours
-    ))
+    chrom_palette = {
+        chrom: mcolors.to_hex(col)
+        for chrom, col in zip(chrom_list, plt.get_cmap("tab20").colors * 2)  # 24 distinct colours
+    }
 
     clone_ids = sorted(set(clone_map.values()))
     clone_palette = {
         cl: mcolors.TABLEAU_COLORS[list(mcolors.TABLEAU_COLORS)[i % 10]]
         for i, cl in enumerate(clone_ids)
     }
+    return chrom_palette, clone_palette
 
-    # helper to fetch chromosome for an SV
+
+def _sv_chrom_lookup(df_metadata=None):
+    """
+    Chromosome per SV from df_metadata ['ID','CHROM'] if given, otherwise
+    parsed as the second token in SV id 'Tool.SVTYPE.chr'.
+    """
     id_to_chrom = {}
     if df_metadata is not None:
         id_to_chrom = dict(zip(df_metadata["ID"], df_metadata["CHROM"]))
@@ -188,14 +297,64 @@ def make_all_clusters_html(sv_graph,
         parts = svid.split(".")
         return parts[1] if len(parts) > 1 else "chr?"
 
+    return sv_chrom
+
+
+def make_all_clusters_html(sv_graph,
+                           partition,           # dict {SV_id: SV_Cluster}
+                           clone_map,           # dict {SV_id: Clone_ID}
+                           df_metadata=None,    # DataFrame with ID→CHROM (optional)
+                           outfile="all_clusters_interactive.html",
+                           mode="auto",
+                           lod_threshold=5000,
+                           physics_threshold=2000):
+    """
+    Generates one-file interactive vis-network visualisation.
+
+    Parameters
+    ----------
+    sv_graph   : NetworkX Graph returned by process_with_modularity
+    partition  : dict {SV_id: Cluster_number}
+    clone_map  : dict {SV_id: Clone_ID string}
+    df_metadata: optional DataFrame that has columns ['ID','CHROM'] so we can
+                 pick chromosome per SV more robustly.  If None, chromosome is
+                 parsed as the second token in SV id 'Tool.SVTYPE.chr'.
+    outfile    : HTML file to write
+    mode       : 'full' (every node in one pyvis network), 'lod' (see
+                 make_lod_clusters_html) or 'auto' = 'lod' above lod_threshold nodes
+    """
+    if mode == "auto":
+        mode = "lod" if sv_graph.number_of_nodes() > lod_threshold else "full"
+    if mode == "lod":
+        return make_lod_clusters_html(sv_graph, partition, clone_map,
+                                      df_metadata=df_metadata, outfile=outfile,
+                                      physics_threshold=physics_threshold)
+    if mode != "full":
+        raise ValueError(f"Unsupported HTML export mode: {mode}")
+
+    from pyvis.network import Network
+
+    chrom_palette, clone_palette = _palettes(clone_map)
+    sv_chrom = _sv_chrom_lookup(df_metadata)
+
     # ---------------- build network ----------------
     net = Network(height="800px", width="100%", bgcolor="#ffffff")
-    net.force_atlas_2based(gravity=-30, spring_length=120, damping=0.9)
+
+    # Past physics_threshold nodes the force simulation never settles in the
+    # browser, so positions are computed here and physics is switched off.
+    positions = {}
+    if sv_graph.number_of_nodes() > physics_threshold:
+        layout = compute_cluster_layout(sv_graph, partition)
+        positions = dict(zip(layout["nodes"], zip(layout["x"], layout["y"])))
+        net.toggle_physics(False)
+    else:
+        net.force_atlas_2based(gravity=-30, spring_length=120, damping=0.9)
 
     for node in sv_graph.nodes():
         cid   = partition[node]
         clone = clone_map.get(node, "?")
         chrom = sv_chrom(node)
+        xy    = {"x": positions[node][0], "y": positions[node][1]} if node in positions else {}
 
         net.add_node(
             node,
@@ -204,7 +363,8 @@ def make_all_clusters_html(sv_graph,
             cluster=cid,
             chrom_col=chrom_palette.get(chrom, "#888888"),
             clone_col=clone_palette.get(clone, "#888888"),
-            color=chrom_palette.get(chrom, "#888888")   # default view = chromosome
+            color=chrom_palette.get(chrom, "#888888"),   # default view = chromosome
+            **xy
         )
 
     for u, v in sv_graph.edges():
@@ -265,7 +425,319 @@ def make_all_clusters_html(sv_graph,
     Path(outfile).write_text(out_html)
     print(f"Interactive graph written → {outfile}")
 
-# build interactive HTML
-clone_map = {sv:clone
-             for ids, clone in zip(final_df["ID"], final_df["Clone_ID"])
-             for sv in ids.split(",")}
+
+
+# ─────────────────────────────────────────
+# 8.  Level-of-detail export for large graphs
+# ─────────────────────────────────────────
+_GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+def _sunflower(n: int) -> np.ndarray:
+    """n evenly spread points inside the unit disc (phyllotaxis spiral)."""
+    i = np.arange(n) + 0.5
+    r = np.sqrt(i / n)
+    theta = i * _GOLDEN_ANGLE
+    return np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+
+
+def _spread_layout(G: nx.Graph, max_spring_nodes: int, seed: int, spring=True):
+    """
+    (nodes, unit-scale positions) for G; spring layout when G is small enough,
+    otherwise a sunflower in BFS order so that linked SVs end up close together.
+    """
+    nodes = list(G.nodes())
+    if len(nodes) == 1:
+        return nodes, np.zeros((1, 2))
+    if spring and 8 < len(nodes) <= max_spring_nodes:
+        pos = nx.spring_layout(G, seed=seed, weight="weight")
+        return nodes, np.array([pos[node] for node in nodes])
+
+    order = []
+    for comp in sorted(nx.connected_components(G), key=len, reverse=True):
+        root = max(comp, key=G.degree)
+        order.append(root)
+        order.extend(v for _, v in nx.bfs_edges(G, root))
+    return order, _sunflower(len(order))
+
+
+def compute_cluster_layout(sv_graph: nx.Graph, partition: dict,
+                           max_spring_nodes: int = 100, max_spring_clusters: int = 500,
+                           seed: int = 42) -> dict:
+    """
+    Two-level server-side layout: clusters are placed as super-nodes (spring
+    layout of the cluster graph, weights = summed shared-read edges), then each
+    cluster's members are laid out inside a disc whose radius grows with
+    sqrt(cluster size). Only the max_spring_clusters largest clusters of 9 to
+    max_spring_nodes members (and a cluster graph of at most 4x that) get a
+    spring layout; everything else uses a deterministic sunflower, so cost
+    stays ~linear in nodes and networkx never needs scipy's sparse layout.
+
+    Returns dict with parallel lists: nodes, x, y (per SV) and clusters,
+    cluster_x, cluster_y, cluster_size, cluster_radius (per cluster).
+    """
+    members = {}
+    for node in sv_graph.nodes():
+        members.setdefault(partition[node], []).append(node)
+    clusters = sorted(members, key=lambda c: (-len(members[c]), c))
+
+    # cluster graph
+    C = nx.Graph()
+    C.add_nodes_from(clusters)
+    for u, v, w in sv_graph.edges(data="weight", default=1):
+        cu, cv = partition[u], partition[v]
+        if cu != cv:
+            prev = C.get_edge_data(cu, cv, default={"weight": 0})["weight"]
+            C.add_edge(cu, cv, weight=prev + w)
+
+    sizes = np.array([len(members[c]) for c in clusters], dtype=float)
+    radius = 10.0 * np.sqrt(sizes)
+    # spread centres so that neighbouring discs rarely overlap
+    cluster_order, centres = _spread_layout(C, 4 * max_spring_nodes, seed)
+    centre_of = dict(zip(cluster_order, centres))
+    centres = np.array([centre_of[c] for c in clusters]) * (2.5 * np.sqrt(radius.dot(radius)) + 1)
+
+    nodes, xs, ys = [], [], []
+    for k, cid in enumerate(clusters):
+        sub_nodes, local = _spread_layout(sv_graph.subgraph(members[cid]), max_spring_nodes, seed,
+                                          spring=k < max_spring_clusters)
+        local = local * radius[k]
+        nodes.extend(sub_nodes)
+        xs.extend(np.round(centres[k, 0] + local[:, 0], 1).tolist())
+        ys.extend(np.round(centres[k, 1] + local[:, 1], 1).tolist())
+
+    return {
+        "nodes": nodes, "x": xs, "y": ys,
+        "clusters": clusters,
+        "cluster_x": np.round(centres[:, 0], 1).tolist(),
+        "cluster_y": np.round(centres[:, 1], 1).tolist(),
+        "cluster_size": sizes.astype(int).tolist(),
+        "cluster_radius": np.round(radius, 1).tolist(),
+    }
+
+
+def make_lod_clusters_html(sv_graph,
+                           partition,
+                           clone_map,
+                           df_metadata=None,
+                           outfile="all_clusters_interactive.html",
+                           physics_threshold=2000):
+    """
+    Level-of-detail viewer for large SV graphs (tested up to ~100k nodes).
+
+    Layout is precomputed with compute_cluster_layout and written, together
+    with the node/edge tables, to a compact JSON sidecar '<outfile>.json'
+    (column arrays, integer node indices, palette lookup tables). The HTML page
+    starts with one super-node per cluster; double-click a cluster to expand
+    its SVs, double-click an SV to collapse its cluster again. Physics stays
+    off whenever more than physics_threshold nodes are visible.
+
+    Browsers block fetch() from file:// URLs, so open the page through a local
+    web server, e.g. `python -m http.server` in the output directory.
+    """
+    chrom_palette, clone_palette = _palettes(clone_map)
+    sv_chrom = _sv_chrom_lookup(df_metadata)
+    layout = compute_cluster_layout(sv_graph, partition)
+
+    node_index = {node: i for i, node in enumerate(layout["nodes"])}
+    cluster_index = {cid: i for i, cid in enumerate(layout["clusters"])}
+
+    chroms = [sv_chrom(node) for node in layout["nodes"]]
+    chrom_names = sorted(set(chroms))
+    chrom_code = {c: i for i, c in enumerate(chrom_names)}
+    clones = [clone_map.get(node, "?") for node in layout["nodes"]]
+    clone_names = sorted(set(clones))
+    clone_code = {c: i for i, c in enumerate(clone_names)}
+
+    src, dst, weight = [], [], []
+    cluster_edges = {}
+    for u, v, w in sv_graph.edges(data="weight", default=1):
+        src.append(node_index[u])
+        dst.append(node_index[v])
+        weight.append(w)
+        cu, cv = sorted((cluster_index[partition[u]], cluster_index[partition[v]]))
+        if cu != cv:
+            cluster_edges[(cu, cv)] = cluster_edges.get((cu, cv), 0) + w
+
+    data = {
+        "physics_threshold": physics_threshold,
+        "nodes": {
+            "id": layout["nodes"],
+            "x": layout["x"],
+            "y": layout["y"],
+            "cluster": [cluster_index[partition[node]] for node in layout["nodes"]],
+            "chrom": [chrom_code[c] for c in chroms],
+            "clone": [clone_code[c] for c in clones],
+        },
+        "edges": {"src": src, "dst": dst, "weight": weight},
+        "clusters": {
+            "id": layout["clusters"],
+            "x": layout["cluster_x"],
+            "y": layout["cluster_y"],
+            "size": layout["cluster_size"],
+            "radius": layout["cluster_radius"],
+        },
+        "cluster_edges": {
+            "src": [cu for cu, _ in cluster_edges],
+            "dst": [cv for _, cv in cluster_edges],
+            "weight": list(cluster_edges.values()),
+        },
+        "chrom_names": chrom_names,
+        "chrom_colors": [chrom_palette.get(c, "#888888") for c in chrom_names],
+        "clone_names": clone_names,
+        "clone_colors": [clone_palette.get(c, "#888888") for c in clone_names],
+    }
+
+    sidecar = Path(f"{outfile}.json")
+    with open(sidecar, "w") as fh:
+        json.dump(data, fh, separators=(",", ":"), default=_json_default)
+
+    Path(outfile).write_text(_LOD_HTML_TEMPLATE.replace("__SIDECAR__", json.dumps(sidecar.name)))
+    print(f"Interactive graph written → {outfile} (data: {sidecar})")
+
+
+def _json_default(value):
+    # numpy scalars from Read_Count weights / Louvain cluster ids
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_LOD_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"></script>
+<style>
+  html, body {margin:0; height:100%; font-family:sans-serif;}
+  #net {width:100%; height:100%;}
+  .panel {position:fixed; left:10px; background:#fff; border:1px solid #ccc;
+          padding:6px; z-index:2; font-size:13px;}
+</style>
+</head>
+<body>
+<div id="net"></div>
+<div class="panel" style="top:10px;">
+  <div id="status">Loading…</div>
+  <input id="find" placeholder="SV ID or cluster" size="24">
+  <button onclick="findItem()">Go</button>
+  <button onclick="collapseAll()">Collapse all</button>
+</div>
+<div class="panel" style="bottom:10px;">
+  Colour by:<br>
+  <label><input type="radio" name="pal" onchange="setPalette('chrom')" checked> Chromosome</label><br>
+  <label><input type="radio" name="pal" onchange="setPalette('clone')"> Clone ID</label>
+</div>
+<script>
+const SIDECAR = __SIDECAR__;
+let D, network, nodes, edges, palette = 'chrom';
+const expanded = new Set();
+let membersOf = [], edgesOf = [], clusterEdgesOf = [];
+
+function nodeColor(i){
+  return palette === 'chrom' ? D.chrom_colors[D.nodes.chrom[i]] : D.clone_colors[D.nodes.clone[i]];
+}
+function clusterColor(c){
+  // colour a super-node by its first (arbitrary but stable) member
+  return nodeColor(membersOf[c][0]);
+}
+function superNode(c){
+  return {id:'c'+c, label:'Cluster '+D.clusters.id[c]+' ('+D.clusters.size[c]+')',
+          x:D.clusters.x[c], y:D.clusters.y[c], shape:'dot',
+          size:Math.min(10 + 2*Math.sqrt(D.clusters.size[c]), 80), color:clusterColor(c)};
+}
+function svNode(i){
+  return {id:i, label:D.nodes.id[i], x:D.nodes.x[i], y:D.nodes.y[i], shape:'dot', size:6,
+          title:'Cluster '+D.clusters.id[D.nodes.cluster[i]]+'<br>'+D.clone_names[D.nodes.clone[i]]+
+                '<br>'+D.chrom_names[D.nodes.chrom[i]], color:nodeColor(i)};
+}
+function updatePhysics(){
+  network.setOptions({physics:{enabled: nodes.length <= D.physics_threshold}});
+  document.getElementById('status').textContent =
+    nodes.length + ' nodes shown, ' + expanded.size + ' of ' + D.clusters.id.length + ' clusters expanded';
+}
+function expand(c){
+  if(expanded.has(c)) return;
+  expanded.add(c);
+  edges.remove(clusterEdgesOf[c].map(k => 'k'+k));
+  nodes.remove('c'+c);
+  nodes.add(membersOf[c].map(svNode));
+  const add = [];
+  for(const e of edgesOf[c]){
+    const a = D.nodes.cluster[D.edges.src[e]], b = D.nodes.cluster[D.edges.dst[e]];
+    if(expanded.has(a) && expanded.has(b))
+      add.push({id:'e'+e, from:D.edges.src[e], to:D.edges.dst[e], color:'#bbbbbb'});
+  }
+  edges.add(add);
+  updatePhysics();
+}
+function collapse(c){
+  if(!expanded.has(c)) return;
+  expanded.delete(c);
+  edges.remove(edgesOf[c].map(e => 'e'+e));
+  nodes.remove(membersOf[c]);
+  nodes.add(superNode(c));
+  addClusterEdges(c);
+  updatePhysics();
+}
+function addClusterEdges(c){
+  const add = [];
+  for(const k of clusterEdgesOf[c]){
+    const a = D.cluster_edges.src[k], b = D.cluster_edges.dst[k];
+    if(!expanded.has(a) && !expanded.has(b) && !edges.get('k'+k))
+      add.push({id:'k'+k, from:'c'+a, to:'c'+b, color:'#dddddd',
+                width:Math.min(1 + Math.log(D.cluster_edges.weight[k]), 8)});
+  }
+  edges.add(add);
+}
+function collapseAll(){
+  for(const c of Array.from(expanded)) collapse(c);
+}
+function setPalette(mode){
+  palette = mode;
+  nodes.update(nodes.getIds().map(function(id){
+    return (typeof id === 'string') ? {id:id, color:clusterColor(+id.slice(1))} : {id:id, color:nodeColor(id)};
+  }));
+}
+function findItem(){
+  const q = document.getElementById('find').value.trim();
+  let i = D.nodes.id.indexOf(q), c;
+  if(i >= 0){ c = D.nodes.cluster[i]; }
+  else { c = D.clusters.id.map(String).indexOf(q); if(c < 0) return; }
+  expand(c);
+  network.focus(i >= 0 ? i : membersOf[c][0], {scale:1.5});
+}
+
+fetch(SIDECAR).then(r => r.json()).then(function(data){
+  D = data;
+  const nc = D.clusters.id.length;
+  membersOf = Array.from({length:nc}, () => []);
+  edgesOf = Array.from({length:nc}, () => []);
+  clusterEdgesOf = Array.from({length:nc}, () => []);
+  D.nodes.cluster.forEach((c, i) => membersOf[c].push(i));
+  D.edges.src.forEach(function(s, e){
+    const a = D.nodes.cluster[s], b = D.nodes.cluster[D.edges.dst[e]];
+    edgesOf[a].push(e); if(b !== a) edgesOf[b].push(e);
+  });
+  D.cluster_edges.src.forEach(function(a, k){
+    clusterEdgesOf[a].push(k); clusterEdgesOf[D.cluster_edges.dst[k]].push(k);
+  });
+
+  nodes = new vis.DataSet(Array.from({length:nc}, (_, c) => superNode(c)));
+  edges = new vis.DataSet();
+  network = new vis.Network(document.getElementById('net'), {nodes:nodes, edges:edges},
+                            {physics:{enabled:false}, interaction:{hideEdgesOnDrag:true}, layout:{improvedLayout:false}});
+  for(let c = 0; c < nc; c++) addClusterEdges(c);
+  network.on('doubleClick', function(p){
+    if(!p.nodes.length) return;
+    const id = p.nodes[0];
+    if(typeof id === 'string') expand(+id.slice(1)); else collapse(D.nodes.cluster[id]);
+  });
+  updatePhysics();
+}).catch(function(err){
+  document.getElementById('status').textContent = 'Could not load ' + SIDECAR + ' (' + err + '); serve this folder over HTTP.';
+});
+</script>
+</body>
+</html>
+"""
@@ -1,30 +1,67 @@
 #!/usr/bin/env python3
 
 import gzip
+import os
+from functools import lru_cache
+
+# Header service: every VCF header is read once per process, stopping at the
+# #CHROM line instead of streaming all records, and the parsed meta-lines are
+# cached (keyed by path, size and mtime so a rewritten file is re-read).
+
+def _open_vcf(file_path):
+    # bgzipped VCFs are valid multi-member gzip files, so gzip reads them lazily
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rt', encoding='utf-8')
+    return open(file_path, 'r', encoding='utf-8')
+
+@lru_cache(maxsize=None)
+def _parse_vcf_header(file_path, size, mtime_ns):
+    meta = {}
+    column_line = None
+    with _open_vcf(file_path) as file:
+        for line in file:
+            if line.startswith('##'):
+                line = line.strip()
+                key = line[2:].split('=', 1)[0]
+                meta.setdefault(key, []).append(line)
+            elif line.startswith('#'):
+                column_line = line.strip()
+                break
+            else:
+                break
+    return meta, column_line
+
+def read_vcf_header(file_path):
+    """
+    Parsed header of a VCF: (meta, column_line), where meta maps each meta-line
+    key ('contig', 'FILTER', 'INFO', ...) to its lines in file order and
+    column_line is the #CHROM line. Only the header is read.
+    """
+    stat = os.stat(file_path)
+    return _parse_vcf_header(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
 
 # Function to read VCF lines based on the prefix and optional chromosome filtering
 def read_vcf_lines(file_path, line_prefix, chroms=None, extended_chroms=False):
-    # Use gzip if the file is compressed; otherwise, use regular open
-    open_func = gzip.open if file_path.endswith('.gz') else open
-    mode = 'rt' if file_path.endswith('.gz') else 'r'
-
-    with open_func(file_path, mode) as file:
-        if chroms:
-            if extended_chroms:
-                lines = [line.strip() for line in file if line.startswith(line_prefix) and any(line.startswith(line_prefix + chrom + ',') for chrom in chroms)]
-            else:
-                lines = [line.strip() for line in file if line.startswith(line_prefix) and any(chrom + ',' in line for chrom in chroms)]
+    meta, _ = read_vcf_header(file_path)
+    key = line_prefix[2:].split('=', 1)[0]
+    lines = [line for line in meta.get(key, []) if line.startswith(line_prefix)]
+
+    if chroms:
+        if extended_chroms:
+            lines = [line for line in lines if any(line.startswith(line_prefix + chrom + ',') for chrom in chroms)]
         else:
-            lines = [line.strip() for line in file if line.startswith(line_prefix)]
+            lines = [line for line in lines if any(chrom + ',' in line for chrom in chroms)]
     return lines
 
-# Function to combine VCF lines, avoiding duplicates and sorting them
-def combine_vcf_lines(file1, file2, line_prefix, chroms=None, extended_chroms=False):
-    lines1 = read_vcf_lines(file1, line_prefix, chroms, extended_chroms)
-    lines2 = read_vcf_lines(file2, line_prefix, chroms, extended_chroms)
-
-    # Combine lines while avoiding duplicates
-    combined_lines = list(set(lines1 + lines2))
+# Function to merge VCF lines from any number of files, avoiding duplicates and sorting contigs
+def merge_vcf_lines(files, line_prefix, chroms=None, extended_chroms=False):
+    combined_lines = []
+    seen = set()
+    for file_path in files:
+        for line in read_vcf_lines(file_path, line_prefix, chroms, extended_chroms):
+            if line not in seen:
+                seen.add(line)
+                combined_lines.append(line)
 
     # Sort combined lines if they are contigs
     if chroms:
@@ -32,3 +69,7 @@ def combine_vcf_lines(file1, file2, line_prefix, chroms=None, extended_chroms=Fa
         combined_lines.sort(key=lambda x: (primary_chrom_order.get(x.split('ID=')[1].split(',')[0], len(primary_chrom_order)), x))
 
     return combined_lines
+
+# Function to combine VCF lines, avoiding duplicates and sorting them
+def combine_vcf_lines(file1, file2, line_prefix, chroms=None, extended_chroms=False):
+    return merge_vcf_lines([file1, file2], line_prefix, chroms, extended_chroms)
@@ -1,8 +1,33 @@
 #!/usr/bin/env python3
 
 import pandas as pd
-
-def identify_variants(tumour, normal, chromosomes, window_size=200):
+from .contigs import encode_contigs
+from .interval_index import merge_intervals
+from .schema import enforce_schema
+
+def breakpoint_windows(tumour, chromosomes, window_size=200):
+    """
+    Per contig of chromosomes, the merged POS windows (merge_intervals) in
+    which identify_variants looks for normal calls matching `tumour`: within
+    window_size of either breakpoint (POS, or END on CHROM2).
+    """
+    tumour = tumour[tumour['CHROM'].isin(chromosomes)]
+    breakpoints = pd.concat([
+        pd.DataFrame({'contig': tumour['CHROM'].astype(str), 'pos': pd.to_numeric(tumour['POS'], errors='coerce')}),
+        pd.DataFrame({'contig': tumour['CHROM2'].astype(str), 'pos': pd.to_numeric(tumour['END'], errors='coerce')}),
+    ]).dropna()
+    breakpoints = breakpoints[breakpoints['contig'].isin(chromosomes)]
+    return {contig: merge_intervals(pos - window_size, pos + window_size)
+            for contig, pos in breakpoints.groupby('contig')['pos']}
+
+def identify_variants(tumour, normal, chromosomes, window_size=200, shard=None):
+    """
+    (somatic, germline, germline normal evidence, mosaic normal) calls on
+    `chromosomes`. With `shard` (the contigs of a --shard run, calls parsed on
+    every contig) only tumour calls on the shard are classified; tumour calls
+    elsewhere with a mate in the shard still claim the normal calls they
+    match, so those are neither mosaic here nor normal evidence of this shard.
+    """
     # Save original setting
     original_setting = pd.options.mode.chained_assignment
 
@@ -12,6 +37,10 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
     # Filter dataframes for specified chromosomes
     tumour = tumour[tumour['CHROM'].isin(chromosomes)].copy()
     normal = normal[normal['CHROM'].isin(chromosomes)].copy()
+    if shard is not None:
+        tumour = tumour[tumour['CHROM'].isin(shard) | tumour['CHROM2'].isin(shard)].copy()
+        normal = normal[normal['CHROM'].isin(shard) | normal['CHROM2'].isin(shard)].copy()
+    tumour['in_shard'] = True if shard is None else tumour['CHROM'].isin(shard)
 
     # Convert the END and SVLEN columns to numeric, setting errors='coerce' to convert invalid data to NaN
     tumour['END'] = pd.to_numeric(tumour['END'], errors='coerce')
@@ -19,6 +48,13 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
     tumour['SVLEN'] = pd.to_numeric(tumour['SVLEN'], errors='coerce')
     normal['SVLEN'] = pd.to_numeric(normal['SVLEN'], errors='coerce')
 
+    # Integer contig codes for the matching below; mates outside `chromosomes`
+    # get codes of their own so they still only match the same contig
+    contigs = list(dict.fromkeys([*chromosomes, *tumour['CHROM2'].dropna(), *normal['CHROM2'].dropna()]))
+    for frame in (tumour, normal):
+        frame['chrom_code'] = encode_contigs(frame['CHROM'], contigs)
+        frame['chrom2_code'] = encode_contigs(frame['CHROM2'], contigs)
+
     # Ensure SVLEN is absolute for deletions
     tumour.loc[tumour['SVTYPE'] == 'DEL', 'SVLEN'] = tumour['SVLEN'].abs()
     normal.loc[normal['SVTYPE'] == 'DEL', 'SVLEN'] = normal['SVLEN'].abs()
@@ -27,15 +63,17 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
     tumour['variant_type'] = 'unknown'
     tumour['variant_ID'] = None
     normal['variant_ID'] = None
+    # Normal evidence belongs to the shard of the first tumour call matching it
+    normal['shard_match'] = False
 
     # Counter for generating unique numbers
     variant_counter = 1
 
     # Iterate over each variant in the tumour dataframe
     for index, tumour_row in tumour.iterrows():
-        chrom1 = tumour_row['CHROM']
+        chrom1 = tumour_row['chrom_code']
         pos1 = tumour_row['POS']
-        chrom2 = tumour_row.get('CHROM2', None)
+        chrom2 = tumour_row['chrom2_code']
         pos2 = tumour_row.get('END', None)
         svtype = tumour_row['SVTYPE']
         tumour_svlen = tumour_row['SVLEN']
@@ -49,24 +87,24 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
         # Match logic for different SVTYPEs
         if svtype in ['DUP', 'DEL'] and tumour_svlen > 1000:
             match_normal = normal[
-                (normal['CHROM'] == chrom1) & (normal['POS'] >= window_start1) & (normal['POS'] <= window_end1) &
+                (normal['chrom_code'] == chrom1) & (normal['POS'] >= window_start1) & (normal['POS'] <= window_end1) &
                 (normal['SVTYPE'] == svtype)
             ]
             match_reverse = normal[
-                (normal['CHROM'] == chrom2) & (normal['POS'] >= window_start2) & (normal['POS'] <= window_end2) &
+                (normal['chrom_code'] == chrom2) & (normal['POS'] >= window_start2) & (normal['POS'] <= window_end2) &
                 (normal['SVTYPE'] == svtype)
             ]
             match = match_normal if not match_normal.empty else match_reverse
 
         else:
             match_normal = normal[
-                (normal['CHROM'] == chrom1) & (normal['POS'] >= window_start1) & (normal['POS'] <= window_end1) &
-                (normal['CHROM2'] == chrom2) & (normal['END'] >= window_start2) & (normal['END'] <= window_end2) &
+                (normal['chrom_code'] == chrom1) & (normal['POS'] >= window_start1) & (normal['POS'] <= window_end1) &
+                (normal['chrom2_code'] == chrom2) & (normal['END'] >= window_start2) & (normal['END'] <= window_end2) &
                 (normal['SVTYPE'] == svtype)
             ]
             match_reverse = normal[
-                (normal['CHROM'] == chrom2) & (normal['POS'] >= window_start2) & (normal['POS'] <= window_end2) &
-                (normal['CHROM2'] == chrom1) & (normal['END'] >= window_start1) & (normal['END'] <= window_end1) &
+                (normal['chrom_code'] == chrom2) & (normal['POS'] >= window_start2) & (normal['POS'] <= window_end2) &
+                (normal['chrom2_code'] == chrom1) & (normal['END'] >= window_start1) & (normal['END'] <= window_end1) &
                 (normal['SVTYPE'] == svtype)
             ]
             match = match_normal if not match_normal.empty else match_reverse
@@ -106,6 +144,7 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
             else:
                 variant_id = f'germline.{svtype}.{variant_counter}'
                 normal.at[match_index, 'variant_ID'] = variant_id
+                normal.at[match_index, 'shard_match'] = tumour_row['in_shard']
                 variant_counter += 1
             tumour.at[index, 'variant_type'] = 'germline-normal'
             tumour.at[index, 'variant_ID'] = variant_id
@@ -114,6 +153,11 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
             tumour.at[index, 'variant_ID'] = f'somatic.{svtype}.{variant_counter}'
             variant_counter += 1
 
+    in_shard = normal['CHROM'].isin(shard) if shard is not None else True
+    shard_match = normal['shard_match']
+    tumour = tumour[tumour['in_shard']].drop(columns=['chrom_code', 'chrom2_code', 'in_shard'])
+    normal = normal.drop(columns=['chrom_code', 'chrom2_code', 'shard_match'])
+
     # Split the tumour dataframe into two based on variant_type
     somatic_tumour = tumour[tumour['variant_type'] == 'somatic'].drop(columns=['variant_type'])
     germline_tumour = tumour[tumour['variant_type'] == 'germline-normal'].drop(columns=['variant_type'])
@@ -128,12 +172,12 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
     ]
 
     # Create germline_normal dataframe from normal
-    germline_normal = normal.dropna(subset=['variant_ID'])
+    germline_normal = normal[normal['variant_ID'].notna() & shard_match]
     if 'variant_type' in germline_normal.columns:
         germline_normal = germline_normal.drop(columns=['variant_type'])
 
     # Identify and create other_normal dataframe
-    other_normal = normal[normal['variant_ID'].isna()]
+    other_normal = normal[normal['variant_ID'].isna() & in_shard]
     if 'variant_ID' in other_normal.columns:
         other_normal = other_normal.drop(columns=['variant_ID'])
     if 'variant_type' in other_normal.columns:
@@ -142,5 +186,5 @@ def identify_variants(tumour, normal, chromosomes, window_size=200):
     # Restore original pandas setting
     pd.options.mode.chained_assignment = original_setting
 
-    return somatic_tumour, germline_tumour, germline_normal, other_normal
+    return tuple(enforce_schema(frame) for frame in (somatic_tumour, germline_tumour, germline_normal, other_normal))
 
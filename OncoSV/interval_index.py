@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import functools
+import gzip
+import os
+import numpy as np
+
+# Sorted-endpoint index over SV spans for reciprocal-overlap queries. Spans
+# are kept sorted by start. Two spans overlap reciprocally by fraction f when
+# their overlap covers at least f of each, so a match for [start, end) of
+# length L has a length between f*L and L/f and must start in
+# [start + f*L - L/f, end - f*L]; a query binary-searches that start window
+# and checks only the spans inside it, O(log n + k) instead of a scan of every
+# span on the contig.
+#
+# RegionSet holds the --exclude-bed regions the same way: merged and sorted
+# per contig, so whether a breakpoint is excluded is one searchsorted.
+
+def reciprocal_overlap_window(start, end, fraction):
+    """Range of starts a span reciprocally overlapping [start, end) by `fraction` can have."""
+    length = end - start
+    return start + fraction * length - length / fraction, end - fraction * length
+
+class IntervalIndex:
+    """Spans [start, end) with a label each, queried by reciprocal overlap."""
+
+    def __init__(self, starts, ends, labels):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        order = np.argsort(starts, kind='stable')
+        # Spans given end-first (e.g. from a breakend's mate side) are flipped
+        self.starts = np.minimum(starts, ends)[order]
+        self.ends = np.maximum(starts, ends)[order]
+        self.labels = np.asarray(labels)[order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def reciprocal_overlaps(self, start, end, fraction=0.5):
+        """Labels of the spans overlapping [start, end) by at least `fraction` of both lengths, by start."""
+        start, end = min(start, end), max(start, end)
+        if end == start:
+            return self.labels[(self.starts == start) & (self.ends == end)]
+        low, high = reciprocal_overlap_window(start, end, fraction)
+        first = np.searchsorted(self.starts, low, side='left')
+        last = np.searchsorted(self.starts, high, side='right')
+        starts, ends = self.starts[first:last], self.ends[first:last]
+        overlap = np.minimum(ends, end) - np.maximum(starts, start)
+        matched = (overlap >= fraction * (end - start)) & (overlap >= fraction * (ends - starts)) & (overlap > 0)
+        return self.labels[first:last][matched]
+
+def merge_intervals(starts, ends, gap=0):
+    """
+    Closed intervals [start, end] sorted and merged where they overlap or lie
+    at most `gap` apart; returns (starts, ends) arrays.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # A new interval begins where the start is past everything before it
+    begins = np.ones(len(starts), dtype=bool)
+    begins[1:] = starts[1:] > ends[:-1] + gap
+    first = np.flatnonzero(begins)
+    last = np.append(first[1:], len(starts)) - 1
+    return starts[first], ends[last]
+
+class RegionSet:
+    """
+    Excluded regions (e.g. centromeres, telomeres, blacklists) as merged,
+    sorted 1-based closed intervals per contig, queried for many positions at
+    once: one binary search per position, vectorised per contig.
+    """
+
+    def __init__(self, regions):
+        self.regions = {contig: merge_intervals(starts, ends) for contig, (starts, ends) in regions.items()}
+
+    @classmethod
+    def from_bed(cls, bed_file):
+        """Regions of a BED file (0-based half-open; plain or gzipped; track/browser/# lines skipped)."""
+        opener = gzip.open if bed_file.endswith('.gz') else open
+        regions = {}
+        with opener(bed_file, 'rt') as file:
+            for line in file:
+                if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                    continue
+                fields = line.split('\t') if '\t' in line else line.split()
+                if len(fields) < 3:
+                    raise ValueError(f"Malformed BED line in {bed_file}: {line.rstrip()}")
+                starts, ends = regions.setdefault(fields[0], ([], []))
+                starts.append(int(fields[1]) + 1)
+                ends.append(int(fields[2]))
+        return cls(regions)
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self.regions.values())
+
+    def contains(self, contigs, positions):
+        """Boolean array: whether each (contig, position) lies in a region; NaN positions do not."""
+        contigs = np.asarray(contigs, dtype=object)
+        positions = np.asarray(positions, dtype=np.float64)
+        inside = np.zeros(len(positions), dtype=bool)
+        for contig in self.regions.keys() & set(contigs):
+            starts, ends = self.regions[contig]
+            on_contig = np.flatnonzero(contigs == contig)
+            pos = positions[on_contig]
+            region = np.searchsorted(starts, pos, side='right') - 1
+            inside[on_contig] = (region >= 0) & (pos <= ends[np.maximum(region, 0)])
+        return inside
+
+@functools.lru_cache(maxsize=4)
+def _cached_region_set(bed_file, size, mtime_ns):
+    return RegionSet.from_bed(bed_file)
+
+def load_region_set(bed_file):
+    """RegionSet.from_bed, parsed once per process while the file is unchanged."""
+    status = os.stat(bed_file)
+    return _cached_region_set(os.path.abspath(bed_file), status.st_size, status.st_mtime_ns)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Cohort runner: every manifest row becomes a consensus -> pair (-> complexSV
+# with --stages) chain of CLI invocations. Stages run in a bounded process pool as soon as
+# their inputs are ready, and a stage is skipped when its outputs are newer
+# than its inputs and were produced with the same arguments (recorded in a
+# stamp file next to the outputs), so a failed cohort run can simply be re-run.
+
+STAGES = ('consensus', 'pair', 'complexSV')
+MANIFEST_COLUMNS = ('sample_id', 'sniffles', 'cutesv', 'svim', 'normal', 'patient_id')
+
+class Task:
+    def __init__(self, sample_id, stage, argv, inputs, outputs, sample_dir, depends=()):
+        self.sample_id = sample_id
+        self.stage = stage
+        self.argv = argv
+        self.inputs = inputs
+        self.outputs = outputs
+        self.sample_dir = sample_dir
+        self.depends = list(depends)
+
+    @property
+    def key(self):
+        return (self.sample_id, self.stage)
+
+    @property
+    def stamp_path(self):
+        return os.path.join(self.sample_dir, '.oncosv', f'{self.stage}.json')
+
+    @property
+    def log_path(self):
+        return os.path.join(self.sample_dir, 'logs', f'{self.stage}.log')
+
+    @property
+    def params_hash(self):
+        return hashlib.sha1(json.dumps(self.argv).encode()).hexdigest()
+
+def read_manifest(manifest_path):
+    """Rows of a tab-separated manifest with a header line; '#' lines are ignored."""
+    with open(manifest_path, newline='') as file:
+        lines = [line for line in file if line.strip() and not line.startswith('#')]
+    reader = csv.DictReader(lines, delimiter='\t')
+    missing = {'sample_id', 'sniffles', 'cutesv', 'svim'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Manifest {manifest_path} is missing column(s): {', '.join(sorted(missing))}")
+
+    rows = []
+    for row in reader:
+        row = {column: (row.get(column) or '').strip() for column in MANIFEST_COLUMNS}
+        if any(existing['sample_id'] == row['sample_id'] for existing in rows):
+            raise ValueError(f"Duplicate sample_id in manifest: {row['sample_id']}")
+        rows.append(row)
+    return rows
+
+def _vcf_suffix(args):
+    return '.vcf.gz' if args.compress else '.vcf'
+
+def _filter_argv(args):
+    argv = ['-x', args.chrom, '-q', str(args.quality_threshold),
+            '-M', str(args.maximum_sv_size)]
+    return argv + (['--exclude-chrom', args.exclude_chrom] if args.exclude_chrom else []) + _exclude_bed_argv(args) + _store_argv(args)
+
+def _exclude_bed_argv(args):
+    bed = getattr(args, 'exclude_bed', None)
+    return ['--exclude-bed', bed] if bed else []
+
+def _store_argv(args):
+    store = getattr(args, 'read_name_store', None)
+    return ['--read-name-store', store] if store else []
+
+def _ingest_argv(args):
+    workers = getattr(args, 'ingest_workers', 1)
+    return ['--ingest-workers', str(workers)] if workers > 1 else []
+
+def _clustering_argv(args):
+    matching = getattr(args, 'large_sv_matching', 'start')
+    if matching == 'start':
+        return []
+    return ['--large-sv-matching', matching, '--reciprocal-overlap', str(args.reciprocal_overlap)]
+
+def _population_argv(args):
+    catalogue = getattr(args, 'population_catalogue', None)
+    if not catalogue:
+        return []
+    index = getattr(args, 'population_index', None)
+    return ['--population-catalogue', catalogue] + (['--population-index', index] if index else [])
+
+def build_tasks(rows, args):
+    """
+    Dependency graph for the manifest. A row whose `normal` names another
+    sample_id uses that sample's consensus VCF as its normal; any other value
+    is taken as the path of an existing normal VCF. Rows without a normal only
+    get a consensus stage.
+    """
+    stages = [stage.strip() for stage in args.stages.split(',')]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    samples = {row['sample_id']: row for row in rows}
+    consensus_vcfs = {}
+    tasks = {}
+    for row in rows:
+        sample_id = row['sample_id']
+        sample_dir = os.path.join(args.out_dir, sample_id)
+        out_file = os.path.join(sample_dir, f'{sample_id}_consensus')
+        consensus_vcfs[sample_id] = out_file + _vcf_suffix(args)
+        if 'consensus' in stages:
+            argv = ['consensus', '-s', row['sniffles'], '-c', row['cutesv'], '-v', row['svim'], '-o', out_file,
+                    '-m', str(args.minimum_sv_size), '--threads', str(args.threads)]
+            argv += _filter_argv(args) + _ingest_argv(args) + _clustering_argv(args)
+            argv += ['--compress'] if args.compress else []
+            task = Task(sample_id, 'consensus', argv, [row['sniffles'], row['cutesv'], row['svim']],
+                        [consensus_vcfs[sample_id]], sample_dir)
+            tasks[task.key] = task
+
+    for row in rows:
+        sample_id, normal = row['sample_id'], row['normal']
+        if not normal:
+            continue
+        sample_dir = os.path.join(args.out_dir, sample_id)
+        pair_dir = os.path.join(sample_dir, 'pair')
+        somatic_vcf = os.path.join(pair_dir, 'consensus_somatic_variants' + _vcf_suffix(args))
+
+        if normal in samples:
+            normal_vcf = consensus_vcfs[normal]
+            normal_depends = [(normal, 'consensus')] if (normal, 'consensus') in tasks else []
+        else:
+            normal_vcf, normal_depends = normal, []
+        tumour_depends = [(sample_id, 'consensus')] if (sample_id, 'consensus') in tasks else []
+
+        if 'pair' in stages:
+            kinds = ['somatic'] if args.only_somatic else ['somatic', 'germline', 'germline_normal_evidence', 'mosaic_normal']
+            outputs = [os.path.join(pair_dir, f'consensus_{kind}' + ('_variants' if kind in ('somatic', 'germline') else '') + _vcf_suffix(args))
+                       for kind in kinds]
+            argv = ['pair', '-t', consensus_vcfs[sample_id], '-n', normal_vcf, '--normal-mode', 'single', '-o', pair_dir,
+                    '-sv', str(args.minimum_sv_size), '--threads', str(args.threads)]
+            argv += _filter_argv(args) + _ingest_argv(args) + _population_argv(args)
+            argv += ['--only-somatic'] if args.only_somatic else []
+            argv += ['--compress'] if args.compress else []
+            argv += ['--patient-id', row['patient_id']] if row['patient_id'] else []
+            inputs = [consensus_vcfs[sample_id], normal_vcf]
+            inputs += [args.population_catalogue] if getattr(args, 'population_catalogue', None) else []
+            task = Task(sample_id, 'pair', argv, inputs, outputs, sample_dir, tumour_depends + normal_depends)
+            tasks[task.key] = task
+
+        if 'complexSV' in stages:
+            complex_dir = os.path.join(sample_dir, 'complexSV')
+            argv = ['complexSV', '--vcf', somatic_vcf, '--output_dir', complex_dir, '--sample_id', sample_id,
+                    '--label_prefix', sample_id, '--qual', str(args.quality_threshold), '-x', args.chrom,
+                    '-sv', str(args.minimum_sv_size), '-M', str(args.maximum_sv_size)]
+            argv += ['--exclude-chrom', args.exclude_chrom] if args.exclude_chrom else []
+            argv += _exclude_bed_argv(args) + _store_argv(args) + (['--threads', str(args.threads)] if args.threads > 1 else [])
+            outputs = [os.path.join(complex_dir, f'{sample_id}_shared_sv_counts_breakopints_overlap.csv'),
+                       os.path.join(complex_dir, f'{sample_id}_complexSV_groups_networks.csv')]
+            depends = [(sample_id, 'pair')] if (sample_id, 'pair') in tasks else []
+            task = Task(sample_id, 'complexSV', argv, [somatic_vcf], outputs, sample_dir, depends)
+            tasks[task.key] = task
+    return tasks
+
+def is_up_to_date(task):
+    """Outputs exist, are newer than every input and were made with the same arguments."""
+    if not all(os.path.exists(path) for path in task.outputs):
+        return False
+    try:
+        with open(task.stamp_path) as file:
+            if json.load(file).get('params') != task.params_hash:
+                return False
+        newest_input = max(os.path.getmtime(path) for path in task.inputs)
+    except (OSError, ValueError):
+        return False
+    return min(os.path.getmtime(path) for path in task.outputs) >= newest_input
+
+def run_task(argv, log_path):
+    """Run one CLI invocation in a worker process, logging its output. Returns None or the error text."""
+    from .cli import build_parser, run_command
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        print('OncoSV ' + ' '.join(argv))
+        try:
+            run_command(build_parser().parse_args(argv))
+        except BaseException as error:
+            traceback.print_exc()
+            return f"{type(error).__name__}: {error}"
+    return None
+
+def _write_stamp(task):
+    os.makedirs(os.path.dirname(task.stamp_path), exist_ok=True)
+    with open(task.stamp_path, 'w') as file:
+        json.dump({'params': task.params_hash, 'argv': task.argv, 'outputs': task.outputs}, file, indent=2)
+
+def run_batch(args):
+    rows = read_manifest(args.manifest)
+    tasks = build_tasks(rows, args)
+    print(f"{len(rows)} samples, {len(tasks)} stages in manifest {args.manifest}")
+
+    done, failed, skipped = set(), {}, []
+    pending = dict(tasks)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        while pending or running:
+            for key, task in list(pending.items()):
+                if any(dep in failed for dep in task.depends):
+                    failed[key] = 'upstream stage failed'
+                    del pending[key]
+                elif all(dep in done for dep in task.depends):
+                    del pending[key]
+                    # outputs of a stage that just re-ran are newer than ours, so mtimes decide
+                    if not args.force and is_up_to_date(task):
+                        print(f"[{task.sample_id}] {task.stage}: up to date, skipped")
+                        skipped.append(key)
+                        done.add(key)
+                    elif args.dry_run:
+                        print(f"[{task.sample_id}] {task.stage}: would run: OncoSV {' '.join(task.argv)}")
+                        done.add(key)
+                    else:
+                        print(f"[{task.sample_id}] {task.stage}: started (log: {task.log_path})")
+                        for path in task.outputs:
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                        running[executor.submit(run_task, task.argv, task.log_path)] = task
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    error = future.result()
+                except Exception as exc:     # worker process died
+                    error = f"{type(exc).__name__}: {exc}"
+                if error is None:
+                    _write_stamp(task)
+                    done.add(task.key)
+                    print(f"[{task.sample_id}] {task.stage}: completed")
+                else:
+                    failed[task.key] = error
+                    print(f"[{task.sample_id}] {task.stage}: FAILED ({error})")
+
+    ran = len(done) - len(skipped)
+    action = 'would run' if args.dry_run else 'run'
+    print(f"Batch finished: {ran} stages {action}, {len(skipped)} up to date, {len(failed)} failed")
+    for (sample_id, stage), error in failed.items():
+        print(f"  {sample_id} {stage}: {error}")
+    if failed:
+        sys.exit(1)
@@ -5,65 +5,101 @@ import os
 import argparse
 from .process_vcf_to_dataframe import process_vcf_to_dataframe
 from .shared_reads_sv import process_shared_reads, process_sv_data_with_sv_count, process_breakpoints, add_overlapping_column
-from .find_network_sv import group_by_group, identify_networks
-
-def run_complexSV(args):
-    if args.chrom == 'all':
-        chroms = ['chr' + str(i+1) for i in range(22)] + ['chrX', 'chrY']
-    else:
-        chroms = args.chrom.split(',')
-
-    print("Processing Input VCF file...")
-    vcf = process_vcf_to_dataframe(
-            args.vcf,
-            chroms,
-            qual=args.qual,
-            vcf_format=args.vcf_format,
-            lower_sv_size=args.minimum_sv_size,
-            upper_sv_size=args.maximum_sv_size,
-            sample_id=getattr(args, 'sample_id', None),
-            apply_af_filtering=False)
-    print(f"Number of variants processed: {len(vcf)}")
+from .contigs import contigs_from_args
+from .parquet_output import SHARED_READ_LIST_COLUMNS, check_parquet, write_tables, writes_native
+from .profiling import StageProfiler
+from .read_name_store import store_from_args
 
+def analyse_complex_svs(vcf, output_dir, label_prefix, profiler, args=None, read_names=None):
+    """
+    Shared-read, grouping and network stages of complexSV for a parsed VCF
+    frame. args supplies the --parquet/--arrow output options, read_names the
+    ReadNameStore of a frame holding RNAMES_ID. Returns the shared-read counts
+    and the groups/networks frames.
+    """
     print("Processing shared reads...")
-    shared_reads = process_shared_reads(vcf)
+    with profiler.stage('shared_reads') as stage:
+        shared_reads = process_shared_reads(vcf, read_names)
+        stage.rows = len(shared_reads)
     print(f"Number of shared reads identified: {len(shared_reads)}")
 
     print("Processing SV shared reads with counts...")
-    shared_sv_counts = process_sv_data_with_sv_count(shared_reads)
-    shared_sv_counts_breakopints = process_breakpoints(shared_sv_counts)
-    shared_sv_counts_breakopints_overlap = add_overlapping_column(shared_sv_counts_breakopints)
+    with profiler.stage('sv_counts') as stage:
+        shared_sv_counts = process_sv_data_with_sv_count(shared_reads)
+        shared_sv_counts_breakopints = process_breakpoints(shared_sv_counts)
+        shared_sv_counts_breakopints_overlap = add_overlapping_column(shared_sv_counts_breakopints)
+        stage.rows = len(shared_sv_counts_breakopints_overlap)
     shared_sv_counts_breakopints_overlap_path = os.path.join(
-        args.output_dir,
-        f"{args.label_prefix + '_' if args.label_prefix else ''}shared_sv_counts_breakopints_overlap.csv"
+        output_dir,
+        f"{label_prefix + '_' if label_prefix else ''}shared_sv_counts_breakopints_overlap.csv"
     )
     print(f"Saving SV shared reads with counts and overlapping breakpoints to {shared_sv_counts_breakopints_overlap_path}...")
     print(f"Number of shared SV counts: {len(shared_sv_counts_breakopints_overlap)}")
-    shared_sv_counts_breakopints_overlap.to_csv(shared_sv_counts_breakopints_overlap_path, index=False)
+    with profiler.stage('write_shared_counts'):
+        if writes_native(args):
+            shared_sv_counts_breakopints_overlap.to_csv(shared_sv_counts_breakopints_overlap_path, index=False)
+        write_tables(args, [(shared_sv_counts_breakopints_overlap, shared_sv_counts_breakopints_overlap_path)],
+                     SHARED_READ_LIST_COLUMNS)
+
+    # networkx/community are only needed from here on
+    from .find_network_sv import group_by_group, identify_networks
 
     print("Grouping by complex SV groups and clustering modules...")
-    complexSV_df = group_by_group(
-        shared_sv_counts_breakopints_overlap,
-        output_dir=args.output_dir,
-        label_prefix=args.label_prefix
-    )
+    with profiler.stage('grouping') as stage:
+        complexSV_df = group_by_group(shared_sv_counts_breakopints_overlap)
+        stage.rows = len(complexSV_df)
 
-    max_group_number = complexSV_df['group'].astype(int).max()
+    # a combination in several groups lists them all, e.g. '12;262'
+    max_group_number = (complexSV_df['group'].astype(str).str.split(';').explode().astype(int).max()
+                        if len(complexSV_df) else 0)
     print(f"Number of complex SV groups: {max_group_number}")
 
     n_modules = complexSV_df['Module'].nunique()
     print(f"Number of modular SV clusters identified: {n_modules}")
 
     print("Identifying networks...")
-    complexSV_network_df = identify_networks(complexSV_df)
+    with profiler.stage('networks') as stage:
+        complexSV_network_df = identify_networks(complexSV_df)
+        stage.rows = len(complexSV_network_df)
     complexSV_networks_path = os.path.join(
-        args.output_dir,
-        f"{args.label_prefix + '_' if args.label_prefix else ''}complexSV_groups_networks.csv"
+        output_dir,
+        f"{label_prefix + '_' if label_prefix else ''}complexSV_groups_networks.csv"
     )
     print(f"Saving complex SV group and networks data to {complexSV_networks_path}...")
     unique_network_count = complexSV_network_df['Network'].nunique()
     print(f"Number of complex SV networks: {unique_network_count}")
-    complexSV_network_df.to_csv(complexSV_networks_path, index=False)
+    with profiler.stage('write_networks'):
+        if writes_native(args):
+            complexSV_network_df.to_csv(complexSV_networks_path, index=False)
+        write_tables(args, [(complexSV_network_df, complexSV_networks_path)], SHARED_READ_LIST_COLUMNS)
+    return shared_sv_counts_breakopints_overlap, complexSV_network_df
+
+def run_complexSV(args):
+    profiler = StageProfiler.from_args(args, 'complexSV')
+    check_parquet(args)
+
+    chroms = contigs_from_args(args, [args.vcf])
+    read_names = store_from_args(args)
+
+    print("Processing Input VCF file...")
+    with profiler.stage('parse') as stage:
+        vcf = process_vcf_to_dataframe(
+                args.vcf,
+                chroms,
+                qual=args.qual,
+                vcf_format=args.vcf_format,
+                lower_sv_size=args.minimum_sv_size,
+                upper_sv_size=args.maximum_sv_size,
+                sample_id=getattr(args, 'sample_id', None),
+                apply_af_filtering=False,
+                read_names=read_names,
+                threads=getattr(args, 'threads', 1),
+                exclude_bed=getattr(args, 'exclude_bed', None))
+        stage.rows = len(vcf)
+    print(f"Number of variants processed: {len(vcf)}")
+
+    analyse_complex_svs(vcf, args.output_dir, args.label_prefix, profiler, args, read_names)
 
+    profiler.write_report()
     print("Complex SV network calling completed successfully.")
 
@@ -1,99 +1,249 @@
 #!/usr/bin/env python3
 import numpy as np
 import pandas as pd
-from .process_vcf_to_dataframe import process_vcf_to_dataframe
+from .parallel_ingest import parse_vcfs
 from .consensus_calling import consensus_calling
 from .filter_consensus_calls import filter_consensus_calls
 from .shared_reads_sv import process_shared_reads
 from .header_combine import combine_vcf_lines
 from .prepare_vcf_output_file import generate_vcf_from_dataframe
+from .profiling import StageProfiler
+from .contigs import PRIMARY_CHROMS, contigs_from_args, exclude_contigs, header_contigs
+from .parquet_output import check_parquet, write_tables, writes_native
+from .read_name_store import store_from_args
+from .shard_merge import write_shard_manifest
+from .consensus_state import ConsensusState, changed_contigs, input_fingerprint, merge_pass_ids, next_cluster_id, restore_row_order, touching
+from .schema import concat_frames
 
-def run_consensus(args):
-    if args.chrom == 'all':
-        chroms = ['chr' + str(i+1) for i in range(22)] + ['chrX', 'chrY']
-    else:
-        chroms = args.chrom.split(',')
-    
+CALLER_LABELS = {'sniffles': 'Sniffles', 'cutesv': 'CuteSV', 'svim': 'SVIM'}
+
+def ingest_options(args):
+    """process_vcf_to_dataframe options shared by the three caller VCFs."""
     apply_af_filtering = True  # Default value
-    if args.apply_af_filtering is not None:
+    if getattr(args, 'apply_af_filtering', None) is not None:
         apply_af_filtering = args.apply_af_filtering.lower() == "true"
+    return dict(qual=args.quality_threshold,
+                lower_sv_size=args.minimum_sv_size,
+                upper_sv_size=args.maximum_sv_size,
+                sample_id=getattr(args, 'sample_id', None),
+                apply_af_filtering=apply_af_filtering,
+                exclude_bed=getattr(args, 'exclude_bed', None))
 
-    print("Processing Sniffles VCF file...")
-    sniffles_df = process_vcf_to_dataframe(
-        args.sniffles,
-        chroms,
-        qual=args.quality_threshold,
-        vcf_format='sniffles',
-        lower_sv_size=args.minimum_sv_size,
-        upper_sv_size=args.maximum_sv_size,
-        sample_id=getattr(args, 'sample_id', None),
-        apply_af_filtering=apply_af_filtering
-    )
-    print(f"Number of variants in Sniffles VCF file: {len(sniffles_df)}")
+def clustering_options(args):
+    """consensus_calling options for large DEL/DUP matching."""
+    reciprocal_overlap = getattr(args, 'reciprocal_overlap', 0.5)
+    if not 0 < reciprocal_overlap <= 1:
+        raise ValueError("--reciprocal-overlap must be in (0, 1]")
+    return dict(large_sv_matching=getattr(args, 'large_sv_matching', 'start'),
+                reciprocal_overlap=reciprocal_overlap)
 
-    print("Processing CuteSV VCF file...")
-    cutesv_df = process_vcf_to_dataframe(
-        args.cutesv,
-        chroms,
-        qual=args.quality_threshold,
-        vcf_format='cutesv',
-        lower_sv_size=args.minimum_sv_size,
-        upper_sv_size=args.maximum_sv_size,
-        sample_id=getattr(args, 'sample_id', None),
-        apply_af_filtering=apply_af_filtering
-    )
-    print(f"Number of variants in CuteSV VCF file: {len(cutesv_df)}")
+def parse_caller_vcfs(vcf_files, chroms, args, profiler, stage_prefix='', read_names=None, callers=None):
+    """Parsed frames of the caller VCFs in vcf_files (all three, or `callers`), keyed by caller."""
+    callers = [caller for caller in CALLER_LABELS if callers is None or caller in callers]
+    options = ingest_options(args)
+    jobs = [dict(vcf_file=vcf_files[caller], chromosomes=chroms, vcf_format=caller, **options)
+            for caller in callers]
+    threads = getattr(args, 'threads', 1)
+    workers = getattr(args, 'ingest_workers', 1)
 
-    print("Processing SVIM VCF file...")
-    svim_df = process_vcf_to_dataframe(
-        args.svim,
-        chroms,
-        qual=args.quality_threshold,
-        vcf_format='svim',
-        lower_sv_size=args.minimum_sv_size,
-        upper_sv_size=args.maximum_sv_size,
-        sample_id=getattr(args, 'sample_id', None),
-        apply_af_filtering=apply_af_filtering
-    )
-    print(f"Number of variants in SVIM VCF file: {len(svim_df)}")
+    if workers > 1 and len(jobs) > 1:
+        print(f"Processing {', '.join(CALLER_LABELS[caller] for caller in callers)} VCF files in parallel...")
+        with profiler.stage(f'{stage_prefix}parse') as stage:
+            caller_dfs = parse_vcfs(jobs, workers, threads, read_names)
+            stage.rows = sum(len(caller_df) for caller_df in caller_dfs)
+    else:
+        caller_dfs = []
+        for caller, job in zip(callers, jobs):
+            print(f"Processing {CALLER_LABELS[caller]} VCF file...")
+            with profiler.stage(f'{stage_prefix}parse_{caller}') as stage:
+                caller_dfs.extend(parse_vcfs([job], threads=threads, read_names=read_names))
+                stage.rows = len(caller_dfs[-1])
+    for caller, caller_df in zip(callers, caller_dfs):
+        print(f"Number of variants in {CALLER_LABELS[caller]} VCF file: {len(caller_df)}")
+    return dict(zip(callers, caller_dfs))
 
-    print("Generating consensus calls...")
-    consensus_df = consensus_calling(sniffles_df, cutesv_df, svim_df, chroms=chroms)
-    consensus_filtered = filter_consensus_calls(consensus_df)
-    
+def filter_clusters(consensus_df, profiler, stage_prefix=''):
+    with profiler.stage(f'{stage_prefix}filter') as stage:
+        consensus_filtered = filter_consensus_calls(consensus_df)
+        stage.rows = len(consensus_filtered)
     print(f"Number of variants in Consensus VCF file: {len(consensus_filtered)}")
+    return consensus_filtered
 
-    print("Combining header lines...")
+def call_consensus(vcf_files, chroms, args, profiler, stage_prefix='', mate_chroms=None, read_names=None):
+    """
+    Parse the Sniffles, CuteSV and SVIM VCFs in vcf_files (a dict keyed by
+    caller) and return the filtered consensus calls as a DataFrame. With a
+    ReadNameStore as read_names the calls carry RNAMES_ID instead of RNAMES.
+    """
+    caller_dfs = parse_caller_vcfs(vcf_files, chroms, args, profiler, stage_prefix, read_names)
+
+    print("Generating consensus calls...")
+    with profiler.stage(f'{stage_prefix}cluster') as stage:
+        consensus_df = consensus_calling(*caller_dfs.values(), chroms=chroms, mate_chroms=mate_chroms,
+                                         **clustering_options(args))
+        stage.rows = len(consensus_df)
+    return filter_clusters(consensus_df, profiler, stage_prefix)
+
+def update_clusters(vcf_files, chroms, args, profiler, state, meta, inputs):
+    """
+    Caller frames and consensus_calling rows for an --update run, re-parsing
+    and re-clustering only what changed since the stored state.
+    """
+    options = state_options(args)
+    stored_chroms = meta['contigs']
+    changed_inputs = [caller for caller in CALLER_LABELS
+                      if meta['options'] != options or meta['inputs'].get(caller) != inputs[caller]]
+    added_chroms = [chrom for chrom in chroms if chrom not in stored_chroms]
+    if added_chroms or [chrom for chrom in stored_chroms if chrom in chroms] != [chrom for chrom in chroms if chrom in stored_chroms]:
+        # Contigs are clustered in -x order, and a parse orders rows across contigs
+        changed_inputs = list(CALLER_LABELS)
+    print(f"Changed inputs: {', '.join(CALLER_LABELS[caller] for caller in changed_inputs) or 'none'}")
+
+    stored_frames = {caller: state.caller_frame(caller) for caller in CALLER_LABELS}
+    caller_frames = parse_caller_vcfs(vcf_files, chroms, args, profiler, callers=changed_inputs) if changed_inputs else {}
+    for caller in CALLER_LABELS:
+        if caller not in changed_inputs:
+            frame = stored_frames[caller]
+            caller_frames[caller] = frame[frame['CHROM'].isin(chroms)]
+    caller_frames = {caller: caller_frames[caller] for caller in CALLER_LABELS}
+
+    with profiler.stage('compare') as stage:
+        changed = set()
+        for caller in CALLER_LABELS:
+            if caller in changed_inputs or len(chroms) != len(stored_chroms):
+                changed |= changed_contigs(stored_frames[caller], caller_frames[caller], stored_chroms, chroms)
+        if {key: meta['options'].get(key) for key in clustering_options(args)} != clustering_options(args):
+            changed = set(chroms)
+        stage.rows = len(changed)
+
+    stored_clusters = state.clusters(stored_chroms)
+    clusters = stored_clusters[stored_clusters['CHROM'].isin(chroms) & stored_clusters['CHROM2'].isin(chroms)]
+    if changed:
+        passes = [chrom for chrom in chroms if chrom in changed]
+        print(f"Re-clustering {len(passes)} contig(s): {', '.join(passes)}")
+        with profiler.stage('cluster') as stage:
+            reclustered = consensus_calling(*(touching(frame, changed) for frame in caller_frames.values()),
+                                            chroms=chroms, start_id=meta['next_id'], passes=passes, pass_ids=True,
+                                            **clustering_options(args))
+            reclustered = merge_pass_ids(reclustered, touching(stored_clusters, changed), chroms, changed,
+                                         meta['next_id'])
+            stage.rows = len(reclustered)
+        clusters = concat_frames([clusters[~clusters.index.isin(touching(clusters, changed).index)], reclustered],
+                                 ignore_index=True)
+        clusters = restore_row_order(clusters, caller_frames.values())
+    else:
+        print("No contigs to re-cluster")
+    return caller_frames, clusters
+
+def state_options(args):
+    """Options recorded in a --state-dir: a change re-parses every input."""
+    options = dict(ingest_options(args), **clustering_options(args))
+    if options['exclude_bed']:
+        options['exclude_bed'] = input_fingerprint(options['exclude_bed'])
+    return options
+
+def stateful_consensus(vcf_files, chroms, args, profiler):
+    """
+    call_consensus for runs with --state-dir: the parsed inputs and clusters
+    are saved to the state, and --update starts from the stored ones.
+    """
+    state = ConsensusState(args.state_dir)
+    inputs = {caller: input_fingerprint(vcf_files[caller]) for caller in CALLER_LABELS}
+    if getattr(args, 'update', False):
+        if not state.exists():
+            raise ValueError(f"No consensus state in {args.state_dir}; run once with --state-dir first")
+        meta = state.load()
+        caller_frames, clusters = update_clusters(vcf_files, chroms, args, profiler, state, meta, inputs)
+        next_id = next_cluster_id(clusters, meta['next_id'])
+    else:
+        caller_frames = parse_caller_vcfs(vcf_files, chroms, args, profiler)
+        print("Generating consensus calls...")
+        with profiler.stage('cluster') as stage:
+            clusters = consensus_calling(*caller_frames.values(), chroms=chroms, pass_ids=True,
+                                         **clustering_options(args))
+            stage.rows = len(clusters)
+        next_id = next_cluster_id(clusters)
+
+    with profiler.stage('save_state'):
+        state.save(chroms, state_options(args), inputs, caller_frames, clusters, next_id)
+    print(f"Consensus state saved to {args.state_dir}")
+    return filter_clusters(clusters.drop(columns=['chrom_pass_id', 'chrom2_pass_id']), profiler)
+
+def consensus_header_lines(vcf_files, chroms):
+    """Combined contig and FILTER header lines of the Sniffles and CuteSV inputs."""
     combined_contigs = combine_vcf_lines(
-        args.sniffles,
-        args.cutesv,
+        vcf_files['sniffles'],
+        vcf_files['cutesv'],
         '##contig=<ID=',
         chroms,
         extended_chroms=True
     )
     combined_filters = combine_vcf_lines(
-        args.sniffles,
-        args.cutesv,
+        vcf_files['sniffles'],
+        vcf_files['cutesv'],
         '##FILTER=<ID='
     )
+    return combined_contigs, combined_filters
 
-    output_filename = args.out_file
-    if args.compress:
+def consensus_output_filename(output_filename, compress):
+    if compress:
         if not output_filename.endswith('.vcf.gz'):
             output_filename += '.vcf.gz' if not output_filename.endswith('.vcf') else '.gz'
-        is_compressed = True
     else:
         output_filename += '.vcf' if not output_filename.endswith('.vcf') else ''
-        is_compressed = False
+    return output_filename
+
+def run_consensus(args):
+    profiler = StageProfiler.from_args(args, 'consensus')
+    check_parquet(args)
+    clustering_options(args)
+    if getattr(args, 'shard', False) and not writes_native(args):
+        raise ValueError("--shard needs the VCF output; use --parquet alongside")
+    if getattr(args, 'update', False) and not getattr(args, 'state_dir', None):
+        raise ValueError("--update needs --state-dir")
+    if getattr(args, 'state_dir', None) and (getattr(args, 'shard', False) or getattr(args, 'read_name_store', None)):
+        raise ValueError("--state-dir cannot be combined with --shard or --read-name-store")
+
+    vcf_files = {'sniffles': args.sniffles, 'cutesv': args.cutesv, 'svim': args.svim}
+    chroms = contigs_from_args(args, vcf_files.values())
+    mate_chroms = None
+    if getattr(args, 'shard', False):
+        # A shard keeps its breakends whichever shard their mate falls in
+        declared = header_contigs(vcf_files.values()) or PRIMARY_CHROMS
+        mate_chroms = exclude_contigs(dict.fromkeys(declared + chroms), getattr(args, 'exclude_chrom', None))
+
+    read_names = store_from_args(args)
+    if getattr(args, 'state_dir', None):
+        consensus_filtered = stateful_consensus(vcf_files, chroms, args, profiler)
+    else:
+        consensus_filtered = call_consensus(vcf_files, chroms, args, profiler, mate_chroms=mate_chroms,
+                                            read_names=read_names)
+
+    print("Combining header lines...")
+    with profiler.stage('header'):
+        combined_contigs, combined_filters = consensus_header_lines(vcf_files, chroms)
+
+    output_filename = consensus_output_filename(args.out_file, args.compress)
 
     print("Generating VCF output...")
-    generate_vcf_from_dataframe(
-        consensus_filtered,
-        combined_contigs,
-        combined_filters,
-        output_filename,
-        is_compressed
-    )
+    with profiler.stage('write') as stage:
+        if writes_native(args):
+            generate_vcf_from_dataframe(
+                consensus_filtered,
+                combined_contigs,
+                combined_filters,
+                output_filename,
+                args.compress,
+                threads=getattr(args, 'threads', 1),
+                read_names=read_names
+            )
+            print(f"VCF file written to {output_filename}")
+        write_tables(args, [(consensus_filtered, output_filename)], read_names=read_names)
+        stage.rows = len(consensus_filtered)
 
-    print(f"VCF file written to {output_filename}")
+    if getattr(args, 'shard', False):
+        manifest_path = output_filename + '.shard.json'
+        write_shard_manifest(manifest_path, 'consensus', chroms, {'consensus': output_filename})
+        print(f"Shard manifest written to {manifest_path}")
+    profiler.write_report()
     print("Consensus structural variant calling completed")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+from .process_vcf_to_dataframe import process_vcf_to_dataframe, calls_from_dataframe
+from .prepare_vcf_output_file import generate_vcf_from_dataframe
+from .main_consensus import call_consensus, clustering_options, consensus_header_lines, consensus_output_filename
+from .main_somatic import annotate_population, classify_variants, write_pair_outputs
+from .contigs import contigs_from_args
+from .parquet_output import check_parquet, write_tables, writes_native
+from .profiling import StageProfiler
+from .read_name_store import store_from_args
+
+# consensus -> pair -> complexSV in one process. Stages hand DataFrames to each
+# other instead of writing a VCF and parsing it again: calls_from_dataframe
+# applies what that round trip would (rounding, re-typing, the reader's
+# filters), so results match running the three subcommands on uncompressed
+# files. VCFs are written only as final artefacts.
+
+def run_pipeline(args):
+    profiler = StageProfiler.from_args(args, 'pipeline')
+    check_parquet(args)
+    clustering_options(args)
+
+    chroms = contigs_from_args(args, [args.sniffles, args.cutesv, args.svim])
+    read_names = store_from_args(args)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    prefix = f"{args.label_prefix}_" if args.label_prefix else ''
+
+    normal_files = {'sniffles': args.normal_sniffles, 'cutesv': args.normal_cutesv, 'svim': args.normal_svim}
+    if not args.normal_consensus and not all(normal_files.values()):
+        raise ValueError("Provide either --normal-consensus or all of --normal-sniffles, --normal-cutesv and --normal-svim.")
+
+    print("Tumour consensus calling...")
+    tumour_files = {'sniffles': args.sniffles, 'cutesv': args.cutesv, 'svim': args.svim}
+    tumour_consensus = call_consensus(tumour_files, chroms, args, profiler, stage_prefix='tumour_',
+                                      read_names=read_names)
+    tumour_header = consensus_header_lines(tumour_files, chroms)
+    consensus_outputs = [(tumour_consensus, tumour_header, f'{prefix}tumour_consensus')]
+
+    if args.normal_consensus:
+        print("Processing normal consensus VCF file...")
+        with profiler.stage('parse_normal') as stage:
+            normal_df = process_vcf_to_dataframe(
+                args.normal_consensus,
+                chroms,
+                qual=0,
+                vcf_format='consensus',
+                lower_sv_size=args.minimum_sv_size,
+                upper_sv_size=args.maximum_sv_size,
+                apply_af_filtering=False,
+                read_names=read_names,
+                threads=args.threads,
+                exclude_bed=getattr(args, 'exclude_bed', None)
+            )
+            stage.rows = len(normal_df)
+        normal_header = args.normal_consensus
+    else:
+        print("Normal consensus calling...")
+        normal_consensus = call_consensus(normal_files, chroms, args, profiler, stage_prefix='normal_',
+                                          read_names=read_names)
+        normal_header = consensus_header_lines(normal_files, chroms)
+        consensus_outputs.append((normal_consensus, normal_header, f'{prefix}normal_consensus'))
+        with profiler.stage('normal_calls') as stage:
+            normal_df = calls_from_dataframe(
+                normal_consensus,
+                chroms,
+                qual=0,
+                lower_sv_size=args.minimum_sv_size,
+                upper_sv_size=args.maximum_sv_size,
+                apply_af_filtering=False
+            )
+            stage.rows = len(normal_df)
+
+    if not args.skip_consensus_vcf:
+        with profiler.stage('write_consensus') as stage:
+            for consensus_df, (contigs, filters), name in consensus_outputs:
+                output_filename = consensus_output_filename(os.path.join(args.out_dir, name), args.compress)
+                if writes_native(args):
+                    generate_vcf_from_dataframe(consensus_df, contigs, filters, output_filename, args.compress,
+                                                threads=args.threads, read_names=read_names)
+                    print(f"VCF file written to {output_filename}")
+                write_tables(args, [(consensus_df, output_filename)], read_names=read_names)
+            stage.rows = sum(len(df) for df, _, _ in consensus_outputs)
+    if args.stop_after == 'consensus':
+        profiler.write_report()
+        print("Pipeline completed (consensus)")
+        return
+
+    with profiler.stage('tumour_calls') as stage:
+        tumour_df = calls_from_dataframe(
+            tumour_consensus,
+            chroms,
+            qual=args.quality_threshold,
+            lower_sv_size=args.minimum_sv_size,
+            upper_sv_size=args.maximum_sv_size
+        )
+        stage.rows = len(tumour_df)
+
+    print("Identifying somatic and germline variants for consensus outputs ...")
+    frames = classify_variants(tumour_df, normal_df, chroms, profiler)
+    frames = annotate_population(frames, args, profiler)
+    write_pair_outputs(frames, tumour_header, normal_header, args, profiler, read_names)
+    if args.stop_after == 'pair':
+        profiler.write_report()
+        print("Pipeline completed (pair)")
+        return
+
+    with profiler.stage('somatic_calls') as stage:
+        somatic_df = calls_from_dataframe(
+            frames[0],
+            chroms,
+            qual=args.quality_threshold,
+            lower_sv_size=args.minimum_sv_size,
+            upper_sv_size=args.maximum_sv_size,
+            sample_id=args.patient_id,
+            apply_af_filtering=False,
+            include_variant_ID=True
+        )
+        stage.rows = len(somatic_df)
+    print(f"Number of somatic variants passed to complexSV: {len(somatic_df)}")
+
+    from .main_complexSV import analyse_complex_svs
+    analyse_complex_svs(somatic_df, args.out_dir, args.label_prefix, profiler, args, read_names)
+
+    profiler.write_report()
+    print("Pipeline completed")
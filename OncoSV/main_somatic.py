@@ -2,9 +2,18 @@
 
 import os
 import pandas as pd
-from .process_vcf_to_dataframe import process_vcf_to_dataframe
-from .identify_variants_withID_proximity import identify_variants
-from .prepare_vcf_output_file import generate_vcf_variants
+from .parallel_ingest import parse_vcfs
+from .identify_variants_withID_proximity import breakpoint_windows, identify_variants
+from .process_vcf_to_dataframe import process_vcf_regions
+from .prepare_vcf_output_file import generate_pair_vcfs
+from .contigs import PRIMARY_CHROMS, contigs_from_args, exclude_contigs, header_contigs
+from .schema import concat_frames
+from .profiling import StageProfiler
+from .parquet_output import check_parquet, write_tables, writes_native
+from .read_name_store import attach_read_names, store_from_args
+from .shard_merge import write_shard_manifest
+
+MATCH_WINDOW = 200  # bp around each tumour breakpoint searched for a normal call
 
 def detect_vcf_format(filename):
     """Automatically detects VCF format based on filename."""
@@ -18,147 +27,193 @@ def detect_vcf_format(filename):
     else:
         raise ValueError(f"Unknown VCF format for file: {filename}")
 
-def run_pair(args):
-    if args.chrom == 'all':
-        chroms = ['chr' + str(i + 1) for i in range(22)] + ['chrX', 'chrY']
-    else:
-        chroms = args.chrom.split(',')
-
-    print("Processing tumour VCF file...")
-    tumour_df = process_vcf_to_dataframe(
-        args.tumour_consensus,
-        chroms,
-        qual=args.quality_threshold,
-        vcf_format=args.vcf_format,
-        lower_sv_size=args.minimum_sv_size,
-        upper_sv_size=args.maximum_sv_size,
-        sample_id=args.tumour_id
-    )
+def shard_match_contigs(chroms, vcf_files, exclude=None):
+    """
+    Contigs a --shard pair run parses and matches over: every contig declared
+    by vcf_files (the primary ones if none are), then the shard's own.
+    """
+    declared = header_contigs(vcf_files) or PRIMARY_CHROMS
+    return list(dict.fromkeys(exclude_contigs(declared, exclude) + list(chroms)))
 
-    if args.normal_mode == "single":
-        print("Processing single normal VCF file...")
-        normal_df = process_vcf_to_dataframe(
-            args.normal_sample,
+def classify_variants(tumour_df, normal_df, chroms, profiler, shard=None):
+    """identify_variants with progress output: (somatic, germline, germline normal evidence, mosaic normal)."""
+    with profiler.stage('identify') as stage:
+        somatic_tumour_df, germline_tumour_df, germline_normal_df, other_normal_df = identify_variants(
+            tumour_df,
+            normal_df,
             chroms,
-            qual=0,
-            vcf_format=args.vcf_format,
-            lower_sv_size=args.minimum_sv_size,
-            upper_sv_size=args.maximum_sv_size,
-            sample_id=args.normal_id,
-            apply_af_filtering=False
+            window_size=MATCH_WINDOW,
+            shard=shard
         )
-    elif args.normal_mode == "multi":
-        print("Processing multiple normal VCF files...")
-        normal_dfs = []
-        for normal_vcf in [args.normal_sample1, args.normal_sample2, args.normal_sample3]:
-            vcf_format = detect_vcf_format(normal_vcf)
-            df = process_vcf_to_dataframe(
-                normal_vcf,
-                chroms,
-                qual=0,
-                vcf_format=vcf_format,
-                lower_sv_size=args.minimum_sv_size,
-                upper_sv_size=args.maximum_sv_size,
-                sample_id=args.normal_id,
-                apply_af_filtering=False
-            )
-            normal_dfs.append(df)
-        normal_df = pd.concat(normal_dfs, ignore_index=True)
-        print(f"Total variants after merging normal samples: {len(normal_df)}")
-        
-        # Save merged normal data as CSV if specified as 'true'
-        if args.save_merged_normal.lower() == "true":
-            merged_csv_path = os.path.join(args.out_dir, "merged_normal_samples.csv")
-            normal_df.to_csv(merged_csv_path, index=False)
-            print(f"Merged normal samples saved to {merged_csv_path}")
-    else:
-        raise ValueError("Invalid normal mode. Choose 'single' or 'multi'.")
-
-    print(f"Identifying somatic and germline variants for {args.svcaller} outputs ...")
-    somatic_tumour_df, germline_tumour_df, germline_normal_df, other_normal_df = identify_variants(
-        tumour_df,
-        normal_df,
-        chroms,
-        window_size=200
-    )
+        stage.rows = len(somatic_tumour_df) + len(germline_tumour_df) + len(germline_normal_df) + len(other_normal_df)
 
     print(f"Number of somatic structural variants: {len(somatic_tumour_df)}")
     print(f"Number of germline structural variants: {len(germline_tumour_df)}")
     print(f"Number of germline variants in normal samples: {len(germline_normal_df)}")
     print(f"Number of mosaic-normal variants: {len(other_normal_df)}")
+    return somatic_tumour_df, germline_tumour_df, germline_normal_df, other_normal_df
+
+def annotate_population(frames, args, profiler):
+    """The classify_variants frames with POP_AF from --population-catalogue, if one is given."""
+    catalogue_vcf = getattr(args, 'population_catalogue', None)
+    if not catalogue_vcf:
+        return frames
+    from .population_catalogue import CatalogueIndex, annotate_population_af
+    with profiler.stage('population_index'):
+        catalogue = CatalogueIndex.open(catalogue_vcf, getattr(args, 'population_index', None),
+                                        getattr(args, 'threads', 1))
+    with profiler.stage('population_af') as stage:
+        frames = annotate_population_af(frames, catalogue, MATCH_WINDOW)
+        stage.rows = sum(len(frame) for frame in frames)
+    print(f"Somatic variants in the population catalogue: {int(frames[0]['POP_AF'].notna().sum())}")
+    return frames
 
-    # Construct the output filenames
-    somatic_output_filename = os.path.join(args.out_dir, f'{args.svcaller}_somatic_variants.vcf')
-    germline_tumour_output_filename = os.path.join(args.out_dir, f'{args.svcaller}_germline_variants.vcf')
-    germline_normal_evidence_output_filename = os.path.join(args.out_dir, f'{args.svcaller}_germline_normal_evidence.vcf')
-    mosaic_normal_output_filename = os.path.join(args.out_dir, f'{args.svcaller}_mosaic_normal.vcf')
-
-    output_directories = [
-        os.path.dirname(somatic_output_filename),
-        os.path.dirname(germline_tumour_output_filename),
-        os.path.dirname(germline_normal_evidence_output_filename),
-        os.path.dirname(mosaic_normal_output_filename)
-    ]
-
-    for dir in output_directories:
-        if not os.path.exists(dir):
-            os.makedirs(dir)
-            print(f"Created directory: {dir}")
-
-    if args.compress:
-        somatic_output_filename += '.gz'
-        germline_tumour_output_filename += '.gz'
-        germline_normal_evidence_output_filename += '.gz'
-        mosaic_normal_output_filename += '.gz'
+def pair_output_filenames(args):
+    """Output VCF of each pair kind, in write order (only the somatic one with --only-somatic)."""
+    suffix = '.vcf.gz' if args.compress else '.vcf'
+    filenames = {
+        kind: os.path.join(args.out_dir, f'{args.svcaller}_{kind}{suffix}')
+        for kind in ('somatic_variants', 'germline_variants', 'germline_normal_evidence', 'mosaic_normal')
+    }
+    if args.only_somatic:
+        return {'somatic_variants': filenames['somatic_variants']}
+    return filenames
+
+def write_pair_outputs(frames, tumour_header, normal_header, args, profiler, read_names=None):
+    """
+    Write the pair VCFs for the four classify_variants frames. The headers are
+    template VCF paths or (contigs, filters) line lists; read_names is the
+    ReadNameStore of frames holding RNAMES_ID. Returns the somatic output
+    filename.
+    """
+    filenames = pair_output_filenames(args)
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+        print(f"Created directory: {args.out_dir}")
 
+    headers = [tumour_header, tumour_header, normal_header, normal_header]
+    sinks = [(dataframe, header, filename)
+             for dataframe, header, filename in zip(frames, headers, filenames.values())]
     if args.only_somatic:
         print("Generating VCF file for somatic tumour variants...")
-        generate_vcf_variants(
-            somatic_tumour_df,
-            args.tumour_consensus,
-            somatic_output_filename,
-            is_compressed=args.compress,
-            svcaller=args.svcaller,
-            include_variant_ID=True,
-            sample_id=args.patient_id if args.patient_id else None
-        )
     else:
         print("Generating VCF files for all variant types...")
-        generate_vcf_variants(
-            somatic_tumour_df,
-            args.tumour_consensus,
-            somatic_output_filename,
-            is_compressed=args.compress,
-            svcaller=args.svcaller,
-            include_variant_ID=True,
-            sample_id=args.patient_id if args.patient_id else None
-        )
-        generate_vcf_variants(
-            germline_tumour_df,
-            args.tumour_consensus,
-            germline_tumour_output_filename,
-            is_compressed=args.compress,
-            svcaller=args.svcaller,
-            include_variant_ID=True,
-            sample_id=args.patient_id if args.patient_id else None
-        )
-        generate_vcf_variants(
-            germline_normal_df,
-            args.normal_consensus,
-            germline_normal_evidence_output_filename,
-            is_compressed=args.compress,
-            svcaller=args.svcaller,
-            include_variant_ID=True,
-            sample_id=args.patient_id if args.patient_id else None
-        )
-        generate_vcf_variants(
-            other_normal_df,
-            args.normal_consensus,
-            mosaic_normal_output_filename,
-            is_compressed=args.compress,
-            svcaller=args.svcaller,
-            include_variant_ID=True,
-            sample_id=args.patient_id if args.patient_id else None
-        )
 
+    with profiler.stage('write') as stage:
+        if writes_native(args):
+            generate_pair_vcfs(
+                sinks,
+                is_compressed=args.compress,
+                svcaller=args.svcaller,
+                include_variant_ID=True,
+                sample_id=args.patient_id if args.patient_id else None,
+                threads=getattr(args, 'threads', 1),
+                read_names=read_names
+            )
+        write_tables(args, [(dataframe, filename) for dataframe, _, filename in sinks], read_names=read_names)
+        stage.rows = sum(len(df) for df, _, _ in sinks)
+    return filenames['somatic_variants']
+
+def run_pair(args):
+    profiler = StageProfiler.from_args(args, 'pair')
+    check_parquet(args)
+    if getattr(args, 'shard', False) and not writes_native(args):
+        raise ValueError("--shard needs the VCF outputs; use --parquet alongside")
+    stream_normal = getattr(args, 'stream_normal', False)
+    if stream_normal and args.normal_mode != "single":
+        raise ValueError("--stream-normal needs --normal-mode single")
+
+    chroms = contigs_from_args(args, [args.tumour_consensus])
+    read_names = store_from_args(args)
+    # A shard classifies the tumour calls on its contigs, but matches them
+    # against normal calls (and tumour calls with a mate here) on every contig
+    shard = chroms if getattr(args, 'shard', False) else None
+
+    if args.normal_mode == "single":
+        normal_vcfs = [(args.normal_sample, args.vcf_format)]
+    elif args.normal_mode == "multi":
+        normal_vcfs = [(normal_vcf, detect_vcf_format(normal_vcf))
+                       for normal_vcf in [args.normal_sample1, args.normal_sample2, args.normal_sample3]]
+    else:
+        raise ValueError("Invalid normal mode. Choose 'single' or 'multi'.")
+
+    match_chroms = chroms
+    if shard:
+        match_chroms = shard_match_contigs(chroms, [args.tumour_consensus] + [vcf for vcf, _ in normal_vcfs],
+                                           getattr(args, 'exclude_chrom', None))
+    tumour_job = dict(vcf_file=args.tumour_consensus,
+                      chromosomes=match_chroms,
+                      qual=args.quality_threshold,
+                      vcf_format=args.vcf_format,
+                      lower_sv_size=args.minimum_sv_size,
+                      upper_sv_size=args.maximum_sv_size,
+                      sample_id=args.tumour_id,
+                      exclude_bed=getattr(args, 'exclude_bed', None))
+    normal_jobs = [dict(vcf_file=normal_vcf,
+                        chromosomes=match_chroms,
+                        qual=0,
+                        vcf_format=vcf_format,
+                        lower_sv_size=args.minimum_sv_size,
+                        upper_sv_size=args.maximum_sv_size,
+                        sample_id=args.normal_id,
+                        apply_af_filtering=False,
+                        exclude_bed=getattr(args, 'exclude_bed', None))
+                   for normal_vcf, vcf_format in normal_vcfs]
+    threads = getattr(args, 'threads', 1)
+    workers = getattr(args, 'ingest_workers', 1)
+
+    if stream_normal:
+        print("Processing tumour VCF file...")
+        with profiler.stage('parse_tumour') as stage:
+            tumour_df, = parse_vcfs([tumour_job], threads=threads, read_names=read_names)
+            stage.rows = len(tumour_df)
+        print("Fetching normal calls near tumour breakpoints...")
+        with profiler.stage('parse_normal') as stage:
+            normal_job = {key: value for key, value in normal_jobs[0].items() if key != 'chromosomes'}
+            normal_dfs = [process_vcf_regions(regions=breakpoint_windows(tumour_df, match_chroms, MATCH_WINDOW),
+                                              read_names=read_names, threads=threads, **normal_job)]
+            stage.rows = len(normal_dfs[0])
+        print("Warning: with --stream-normal the mosaic-normal output only holds normal calls near tumour breakpoints")
+    elif workers > 1:
+        print("Processing tumour and normal VCF files in parallel...")
+        with profiler.stage('parse') as stage:
+            tumour_df, *normal_dfs = parse_vcfs([tumour_job] + normal_jobs, workers, threads, read_names)
+            stage.rows = len(tumour_df) + sum(len(df) for df in normal_dfs)
+    else:
+        print("Processing tumour VCF file...")
+        with profiler.stage('parse_tumour') as stage:
+            tumour_df, = parse_vcfs([tumour_job], threads=threads, read_names=read_names)
+            stage.rows = len(tumour_df)
+        print(f"Processing {args.normal_mode} normal VCF file{'s' if args.normal_mode == 'multi' else ''}...")
+        with profiler.stage('parse_normal') as stage:
+            normal_dfs = parse_vcfs(normal_jobs, threads=threads, read_names=read_names)
+            stage.rows = sum(len(df) for df in normal_dfs)
+
+    if args.normal_mode == "single":
+        normal_df = normal_dfs[0]
+    else:
+        normal_df = concat_frames(normal_dfs, ignore_index=True)
+        print(f"Total variants after merging normal samples: {len(normal_df)}")
+
+        # Save merged normal data as CSV if specified as 'true'
+        if args.save_merged_normal.lower() == "true":
+            merged_csv_path = os.path.join(args.out_dir, "merged_normal_samples.csv")
+            if writes_native(args):
+                attach_read_names(normal_df, read_names, as_tuples=True).to_csv(merged_csv_path, index=False)
+                print(f"Merged normal samples saved to {merged_csv_path}")
+            write_tables(args, [(normal_df, merged_csv_path)], read_names=read_names)
+
+    print(f"Identifying somatic and germline variants for {args.svcaller} outputs ...")
+    frames = classify_variants(tumour_df, normal_df, match_chroms, profiler, shard)
+    frames = annotate_population(frames, args, profiler)
+
+    # Template for the normal-side outputs' contig/FILTER header lines
+    normal_header_file = args.normal_sample if args.normal_mode == "single" else args.normal_sample1
+    write_pair_outputs(frames, args.tumour_consensus, normal_header_file, args, profiler, read_names)
+    if getattr(args, 'shard', False):
+        manifest_path = os.path.join(args.out_dir, f'{args.svcaller}_pair.shard.json')
+        write_shard_manifest(manifest_path, 'pair', chroms, pair_output_filenames(args))
+        print(f"Shard manifest written to {manifest_path}")
+
+    profiler.write_report()
     print("Somatic variant calling completed")
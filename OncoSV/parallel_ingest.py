@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .process_vcf_to_dataframe import process_vcf_to_dataframe
+from .read_name_store import ReadNameStore
+
+# Independent input VCFs (the three callers of a sample, tumour and normals)
+# are parsed in up to --ingest-workers worker processes, each decompressing
+# its file with its share of --threads htslib threads. Frames come back
+# pickled; with a ReadNameStore every worker writes its RNAMES to a pool file
+# of its own in the store's directory, which the parent appends to the store,
+# shifting the frame's RNAMES_ID to match.
+#
+# Long-running processes (`OncoSV serve` workers) call enable_frame_cache: the
+# frames of the most recently parsed VCFs are then kept, keyed by the file's
+# path, size and mtime and the parse options, and handed out as copies, so a
+# normal or panel shared by many tumours is parsed once per worker. Frames
+# parsed into a ReadNameStore are not cached (their IDs belong to one run).
+
+def _parse(job, threads, store_directory):
+    if store_directory is None:
+        return process_vcf_to_dataframe(**job, threads=threads), None
+    store = ReadNameStore(store_directory, unlink=False)
+    try:
+        dataframe = process_vcf_to_dataframe(**job, read_names=store, threads=threads)
+    except BaseException:
+        path, _ = store.detach()
+        os.remove(path)
+        raise
+    return dataframe, store.detach()
+
+def _adopt(dataframe, pool, read_names):
+    if pool is None:
+        return dataframe
+    shift = read_names.merge(*pool)
+    if shift:
+        ids = dataframe['RNAMES_ID']
+        dataframe['RNAMES_ID'] = ids.where(ids < 0, ids + shift).astype(np.int32)
+    return dataframe
+
+class FrameCache:
+    """Least-recently-used parsed frames, keyed by VCF fingerprint and parse options."""
+
+    def __init__(self, size):
+        self.size = size
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(job):
+        status = os.stat(job['vcf_file'])
+        options = tuple(sorted((name, tuple(value) if isinstance(value, (list, tuple)) else value)
+                               for name, value in job.items() if name != 'vcf_file'))
+        if job.get('exclude_bed'):
+            bed_status = os.stat(job['exclude_bed'])
+            options += (bed_status.st_size, bed_status.st_mtime_ns)
+        return os.path.abspath(job['vcf_file']), status.st_size, status.st_mtime_ns, options
+
+    def get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                return None
+            self.frames.move_to_end(key)
+            return frame.copy()
+
+    def put(self, key, frame):
+        with self.lock:
+            self.frames[key] = frame.copy()
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.size:
+                self.frames.popitem(last=False)
+
+_frame_cache = None
+
+def enable_frame_cache(size):
+    """Keep the frames of the `size` most recently parsed VCFs in this process."""
+    global _frame_cache
+    _frame_cache = FrameCache(size) if size > 0 else None
+
+def parse_vcfs(jobs, workers=1, threads=1, read_names=None):
+    """
+    process_vcf_to_dataframe for every job (a dict of its keyword arguments),
+    returning the frames in job order. workers > 1 parses the files in that
+    many processes; `threads` decompression threads are shared out between
+    the files parsed at once.
+    """
+    cache = _frame_cache if read_names is None else None
+    if cache is None:
+        return _parse_vcfs(jobs, workers, threads, read_names)
+    keys = [cache.key(job) for job in jobs]
+    frames = [cache.get(key) for key in keys]
+    missing = [position for position, frame in enumerate(frames) if frame is None]
+    if missing:
+        parsed = _parse_vcfs([jobs[position] for position in missing], workers, threads)
+        for position, frame in zip(missing, parsed):
+            cache.put(keys[position], frame)
+            frames[position] = frame
+    return frames
+
+def _parse_vcfs(jobs, workers=1, threads=1, read_names=None):
+    workers = max(1, min(workers, len(jobs)))
+    file_threads = max(1, threads // workers)
+    if workers == 1:
+        return [process_vcf_to_dataframe(**job, read_names=read_names, threads=file_threads) for job in jobs]
+
+    store_directory = read_names.directory if read_names is not None else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_parse, job, file_threads, store_directory) for job in jobs]
+        results, error = [], None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                error = error or exc
+    if error is not None:
+        for _, pool in results:
+            if pool is not None:
+                os.remove(pool[0])
+        raise error
+    # merged in job order, so IDs grow with the job order as in a sequential parse
+    return [_adopt(dataframe, pool, read_names) for dataframe, pool in results]
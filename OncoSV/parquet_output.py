@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import pandas as pd
+from .read_name_store import attach_read_names
+
+# Columnar copies of the VCF/CSV outputs for downstream analytics
+# (--parquet alongside|instead). Columns keep their types: categoricals become
+# dictionary columns, tuples (RNAMES, ALT, Genotype) lists, and the
+# delimiter-joined fields of the complexSV tables (SV IDs, AFs, breakpoints)
+# are split into typed lists. --arrow writes Arrow IPC files instead of
+# Parquet, which read_table memory-maps without parsing. pyarrow is optional
+# (pip install OncoSV[parquet]) and only imported when a table is written.
+
+PARQUET_MODES = ('off', 'alongside', 'instead')
+
+# Delimiter-joined columns of the shared-read tables: column -> (delimiter, item type)
+SHARED_READ_LIST_COLUMNS = {
+    'ID': (',', 'string'),
+    'ConsensusSV_ID': (',', 'string'),
+    'CHROM': (';', 'string'),
+    'CHROM2': (';', 'string'),
+    'POS_BKPT': (';', 'string'),
+    'END_BKPT': (';', 'string'),
+    'AF': (';', 'float64'),
+}
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("--parquet needs pyarrow: pip install pyarrow (or OncoSV[parquet])") from None
+    return pyarrow
+
+def parquet_mode(args):
+    return getattr(args, 'parquet', None) or 'off'
+
+def writes_native(args):
+    """Whether the VCF/CSV outputs are written (everything but --parquet instead)."""
+    return parquet_mode(args) != 'instead'
+
+def check_parquet(args):
+    """Fail before any work is done when --parquet is requested without pyarrow."""
+    if parquet_mode(args) != 'off':
+        _pyarrow()
+
+def table_path(output_path, arrow=False):
+    """<output without .vcf/.vcf.gz/.csv>.parquet (or .arrow)."""
+    stem = output_path
+    for suffix in ('.gz', '.vcf', '.csv'):
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    return stem + ('.arrow' if arrow else '.parquet')
+
+def _split_list(values, delimiter, item_type):
+    def split(value):
+        if not isinstance(value, str):
+            return None
+        items = value.split(delimiter) if value else []
+        return [float(item) for item in items] if item_type == 'float64' else items
+    return values.map(split)
+
+def _arrow_column(values, pa):
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed columns such as SVIM's GQ ('.' or integers) are kept as text
+        return pa.array(values.map(lambda value: None if value is None or value is pd.NA or value != value else str(value)),
+                        type=pa.string())
+
+def to_arrow_table(dataframe, list_columns=None):
+    """pyarrow Table of dataframe, splitting the delimiter-joined list_columns."""
+    pa = _pyarrow()
+    list_columns = list_columns or {}
+    arrays = []
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if column in list_columns:
+            delimiter, item_type = list_columns[column]
+            values = _split_list(values.astype(object), delimiter, item_type)
+            arrays.append(pa.array(values, type=pa.list_(pa.float64() if item_type == 'float64' else pa.string()),
+                                   from_pandas=True))
+        else:
+            arrays.append(_arrow_column(values, pa))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in dataframe.columns])
+
+def write_table(dataframe, output_path, arrow=False, list_columns=None, read_names=None):
+    """Write the Parquet/Arrow copy of output_path; returns its filename."""
+    pa = _pyarrow()
+    path = table_path(output_path, arrow)
+    dataframe = attach_read_names(dataframe, read_names, as_tuples=True)
+    table = to_arrow_table(dataframe.reset_index(drop=True), list_columns)
+    if arrow:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa.parquet.write_table(table, path, compression='zstd')
+    return path
+
+def write_tables(args, outputs, list_columns=None, read_names=None):
+    """Write the tables for [(dataframe, output path)] unless --parquet is off."""
+    if parquet_mode(args) == 'off':
+        return []
+    paths = []
+    for dataframe, output_path in outputs:
+        path = write_table(dataframe, output_path, getattr(args, 'arrow', False), list_columns, read_names)
+        print(f"Table written to {path}")
+        paths.append(path)
+    return paths
+
+def read_table(path):
+    """pyarrow Table of a written .parquet/.arrow file (Arrow IPC is memory-mapped)."""
+    pa = _pyarrow()
+    if path.endswith('.arrow'):
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return pa.parquet.read_table(path, memory_map=True)
+
+def read_tables(paths):
+    """One table from the same output of several samples, e.g. a cohort's complexSV tables."""
+    pa = _pyarrow()
+    return pa.concat_tables([read_table(path) for path in paths], promote_options='default')
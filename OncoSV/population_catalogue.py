@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pysam
+from .consensus_state import input_fingerprint
+from .contigs import BND_MATE
+
+# Population allele frequencies from a local SV catalogue (gnomAD-SV, 1000G
+# or any VCF with SVTYPE and AF), for `pair --population-catalogue`.
+#
+# The catalogue is parsed once into a directory of .npy arrays next to it
+# (or --population-index), rebuilt only when the catalogue file changes:
+#
+#   index.json       format version, catalogue fingerprint, contig and SVTYPE names
+#   key.npy          contig code << 32 | POS, sorted; the search key
+#   end.npy, mate.npy, svtype.npy, svlen.npy, af.npy   per-record columns
+#
+# and opened memory-mapped, so a run only pages in the parts it touches.
+# Breakends are stored from both sides. Calls are matched in one vectorised
+# pass: the POS window of every call is binary-searched on key.npy, and the
+# candidates are checked with identify_variants' rules (SVTYPE; END and mate
+# contig within the window, except for INS and DEL/DUP over 1 kb, which
+# instead need a concordant SVLEN; large DEL/DUP are matched at POS only). The
+# closest match by POS gives the call its POP_AF; calls without a match have
+# none.
+
+CATALOGUE_VERSION = 1
+LARGE_SV = 1000
+COLUMNS = ('key', 'end', 'mate', 'svtype', 'svlen', 'af')
+SVTYPE_ALIASES = {'CTX': 'BND', 'TRA': 'BND'}
+
+def _info_value(info, key):
+    value = info.get(key) if key in info else None
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    return value
+
+def read_catalogue(vcf_file, threads=1):
+    """One row per catalogue record with an AF: CHROM, POS, END, CHROM2, SVTYPE, SVLEN, AF."""
+    columns = {column: [] for column in ('CHROM', 'POS', 'END', 'CHROM2', 'SVTYPE', 'SVLEN', 'AF')}
+    with pysam.VariantFile(vcf_file, 'r', threads=threads) as vcf_reader:
+        declared = set(vcf_reader.header.info)
+        for record in vcf_reader:
+            info = record.info
+            af = _info_value(info, 'AF') if 'AF' in declared else None
+            svtype = _info_value(info, 'SVTYPE') if 'SVTYPE' in declared else None
+            if af is None or svtype is None:
+                continue
+            svtype = SVTYPE_ALIASES.get(svtype, svtype)
+            chrom2 = _info_value(info, 'CHR2') if 'CHR2' in declared else None
+            end = _info_value(info, 'END2') if 'END2' in declared and svtype == 'BND' else None
+            if svtype == 'BND' and (chrom2 is None or end is None):
+                match = BND_MATE.search(record.alts[0]) if record.alts else None
+                if match is None:
+                    continue
+                chrom2, end = match.group(1), int(match.group(2))
+            columns['CHROM'].append(record.chrom)
+            columns['POS'].append(record.pos)
+            columns['END'].append(end if end is not None else record.stop)
+            columns['CHROM2'].append(chrom2 or record.chrom)
+            columns['SVTYPE'].append(svtype)
+            columns['SVLEN'].append(_info_value(info, 'SVLEN') if 'SVLEN' in declared else None)
+            columns['AF'].append(af)
+    return pd.DataFrame(columns)
+
+def _breakpoint_key(contig_codes, positions):
+    return (np.asarray(contig_codes, dtype=np.int64) << 32) + np.asarray(positions, dtype=np.int64)
+
+class CatalogueIndex:
+    """The memory-mapped breakpoint arrays of a catalogue."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'index.json')) as file:
+            self.meta = json.load(file)
+        self.contigs = {contig: code for code, contig in enumerate(self.meta['contigs'])}
+        self.svtypes = {svtype: code for code, svtype in enumerate(self.meta['svtypes'])}
+        for column in COLUMNS:
+            setattr(self, column, np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.key)
+
+    @staticmethod
+    def current(directory, vcf_file):
+        """True when directory holds an index of vcf_file as it is now."""
+        try:
+            with open(os.path.join(directory, 'index.json')) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return meta.get('version') == CATALOGUE_VERSION and meta.get('source') == input_fingerprint(vcf_file)
+
+    @classmethod
+    def build(cls, vcf_file, directory, threads=1):
+        """Parse vcf_file into an index at directory (replacing any older one)."""
+        catalogue = read_catalogue(vcf_file, threads)
+        # Breakends from both sides, so a call matches whichever side it was called from
+        bnd = catalogue[catalogue['SVTYPE'] == 'BND']
+        mates = bnd.rename(columns={'CHROM': 'CHROM2', 'CHROM2': 'CHROM', 'POS': 'END', 'END': 'POS'})
+        catalogue = pd.concat([catalogue, mates[catalogue.columns]], ignore_index=True)
+
+        contigs = list(dict.fromkeys(catalogue['CHROM'].tolist() + catalogue['CHROM2'].tolist()))
+        svtypes = sorted(catalogue['SVTYPE'].unique())
+        contig_codes = {contig: code for code, contig in enumerate(contigs)}
+        key = _breakpoint_key(catalogue['CHROM'].map(contig_codes), catalogue['POS'])
+        order = np.argsort(key, kind='stable')
+        arrays = {
+            'key': key[order],
+            'end': catalogue['END'].to_numpy(dtype=np.int64)[order],
+            'mate': catalogue['CHROM2'].map(contig_codes).to_numpy(dtype=np.int32)[order],
+            'svtype': catalogue['SVTYPE'].map({svtype: code for code, svtype in enumerate(svtypes)})
+                                         .to_numpy(dtype=np.int8)[order],
+            'svlen': pd.to_numeric(catalogue['SVLEN'], errors='coerce').abs().to_numpy(dtype=np.float64)[order],
+            'af': pd.to_numeric(catalogue['AF'], errors='coerce').to_numpy(dtype=np.float64)[order],
+        }
+
+        # Written to a temporary directory and renamed, so concurrent runs never see a partial index
+        parent = os.path.dirname(os.path.abspath(directory))
+        staging = tempfile.mkdtemp(prefix='.population_index.', dir=parent)
+        for column, values in arrays.items():
+            np.save(os.path.join(staging, f'{column}.npy'), values)
+        meta = {'version': CATALOGUE_VERSION, 'source': input_fingerprint(vcf_file), 'contigs': contigs,
+                'svtypes': svtypes, 'records': len(catalogue)}
+        with open(os.path.join(staging, 'index.json'), 'w') as file:
+            json.dump(meta, file, indent=1)
+        if os.path.exists(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)   # another run has just built it
+        return cls(directory)
+
+    @classmethod
+    def open(cls, vcf_file, directory=None, threads=1):
+        """The index of vcf_file, built (at directory, default <catalogue>.popindex) if missing or stale."""
+        directory = directory or f'{vcf_file}.popindex'
+        if cls.current(directory, vcf_file):
+            return cls(directory)
+        print(f"Building population index of {vcf_file} in {directory}...")
+        return cls.build(vcf_file, directory, threads)
+
+    def allele_frequencies(self, calls, window_size=200):
+        """POP_AF of every call: the AF of its closest matching catalogue record, NaN where none matches."""
+        n_calls = len(calls)
+        contig = calls['CHROM'].astype(str).map(self.contigs).fillna(-1).to_numpy(dtype=np.int64)
+        mate = calls['CHROM2'].astype(str).map(self.contigs).fillna(-1).to_numpy(dtype=np.int64)
+        svtype = calls['SVTYPE'].astype(str).map(self.svtypes).fillna(-1).to_numpy(dtype=np.int64)
+        pos = pd.to_numeric(calls['POS'], errors='coerce').to_numpy(dtype=np.float64)
+        end = pd.to_numeric(calls['END'], errors='coerce').to_numpy(dtype=np.float64)
+        svlen = pd.to_numeric(calls['SVLEN'], errors='coerce').abs().to_numpy(dtype=np.float64)
+
+        searchable = (contig >= 0) & (svtype >= 0) & ~np.isnan(pos)
+        first = np.zeros(n_calls, dtype=np.int64)
+        last = np.zeros(n_calls, dtype=np.int64)
+        first[searchable] = np.searchsorted(self.key, _breakpoint_key(contig[searchable], pos[searchable] - window_size), 'left')
+        last[searchable] = np.searchsorted(self.key, _breakpoint_key(contig[searchable], pos[searchable] + window_size), 'right')
+
+        # Expand (call, candidate) pairs: candidate rows first..last-1 of each call
+        counts = last - first
+        call = np.repeat(np.arange(n_calls), counts)
+        offsets = np.cumsum(counts) - counts
+        candidate = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(first, counts)
+
+        cand_svtype = self.svtype[candidate]
+        cand_end = self.end[candidate]
+        cand_mate = self.mate[candidate]
+        cand_svlen = self.svlen[candidate]
+        call_svtype = np.asarray(self.meta['svtypes'], dtype=object)[svtype[call]] if len(call) else np.array([], dtype=object)
+        call_svlen = svlen[call]
+
+        large = np.isin(call_svtype, ['DEL', 'DUP']) & (call_svlen > LARGE_SV)
+        is_ins = call_svtype == 'INS'
+        by_breakpoints = ~large & ~is_ins
+        near_end = (cand_mate == mate[call]) & (np.abs(cand_end - end[call]) <= window_size)
+
+        # identify_variants' SVLEN concordance: sd of the two lengths within 30% (INS) / 20% (large DEL/DUP)
+        threshold = np.where(is_ins, 0.3, 0.2)
+        checked = (large | (is_ins & (call_svlen > 0) & (cand_svlen > 0)))
+        svlen_sd = np.abs(call_svlen - cand_svlen) / (2 * np.sqrt(2))
+        concordant = ~checked | (svlen_sd <= threshold * cand_svlen)
+
+        matched = (cand_svtype == svtype[call]) & np.where(by_breakpoints, near_end, concordant)
+        call, candidate = call[matched], candidate[matched]
+
+        pop_af = np.full(n_calls, np.nan)
+        if len(call):
+            distance = np.abs((self.key[candidate] & 0xFFFFFFFF) - pos[call])
+            order = np.lexsort((distance, call))
+            call, candidate = call[order], candidate[order]
+            best = np.flatnonzero(np.r_[True, call[1:] != call[:-1]])
+            pop_af[call[best]] = self.af[candidate[best]]
+        return pd.Series(pop_af, index=calls.index, name='POP_AF')
+
+def annotate_population_af(frames, catalogue, window_size=200):
+    """The frames with a POP_AF column from catalogue (a CatalogueIndex)."""
+    return tuple(frame.assign(POP_AF=catalogue.allele_frequencies(frame, window_size)) for frame in frames)
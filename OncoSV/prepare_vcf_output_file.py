@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
 import re
-import pysam
-import gzip
+from concurrent.futures import ThreadPoolExecutor
+from .bgzf_tabix_writer import BGZFTabixWriter
+from .header_combine import read_vcf_header
+from .read_name_store import attach_read_names
 
 def format_genotype(genotype):
     if genotype is None:
@@ -76,6 +79,9 @@ def create_info_field(row, include_variant_ID=False, svcaller="consensus"):
             else:
                 continue
 
+    if 'POP_AF' in row and pd.notna(row['POP_AF']):
+        info_parts.append(f"POP_AF={float(row['POP_AF']):g}")
+
     return ";".join(info_parts)
 
 
@@ -90,7 +96,187 @@ def create_format_and_sample_fields(row):
     ]
     return ":".join(format_keys), ":".join(str(x) for x in format_values)
 
-def generate_vcf_from_dataframe(dataframe, combined_contigs, combined_filters, output_filename, is_compressed=False, sample_id=None):
+# Column-wise serialisation: the helpers below build every INFO/FORMAT/sample
+# string for the whole frame at once and reproduce create_info_field and
+# create_format_and_sample_fields value for value.
+
+def _empty_strings(index):
+    return pd.Series("", index=index, dtype=object)
+
+def _column_or_na(dataframe, key):
+    if key in dataframe.columns:
+        return dataframe[key]
+    return pd.Series(np.nan, index=dataframe.index, dtype=object)
+
+def _stringify(values):
+    """str() of every value, with tuples comma-joined as in clean_tuple_field."""
+    if values.dtype != object:
+        return values.astype(str)
+    out = values.astype(str)
+    is_tuple = values.map(type) == tuple
+    if is_tuple.any():
+        out[is_tuple] = values[is_tuple].map(clean_tuple_field)
+    return out
+
+def _int_or_dot(value):
+    try:
+        return str(int(value))
+    except ValueError:
+        return "."
+
+def _integer_strings(values):
+    """str(int(v)) for numeric columns, '.' where int() would fail."""
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        out = pd.Series(".", index=values.index, dtype=object)
+        present = values.notna()
+        out[present] = np.trunc(values[present].astype(float)).astype(np.int64).astype(str)
+        return out
+    return values.map(_int_or_dot)
+
+def _float2_strings(values):
+    """f'{float(v):.2f}' for every value, '.' where float() would fail."""
+    numeric = pd.to_numeric(values, errors="coerce").astype(float)
+    out = pd.Series(".", index=values.index, dtype=object)
+    present = numeric.notna()
+    out[present] = np.char.mod("%.2f", numeric[present].to_numpy())
+    return out
+
+def _keyed(key, values, mask):
+    """'key=value' where mask holds, '' elsewhere."""
+    out = _empty_strings(values.index)
+    out[mask] = f"{key}=" + values[mask]
+    return out
+
+def _join_parts(parts, sep):
+    """Join per-row string parts with sep, skipping empty parts."""
+    joined = _empty_strings(parts[0].index)
+    for part in parts:
+        has_part = part != ""
+        joined[has_part] = joined[has_part] + sep + part[has_part]
+    return joined.str[len(sep):]
+
+def format_info_column(dataframe, include_variant_ID=False, svcaller="consensus"):
+    """INFO strings for every row of dataframe, equal to create_info_field per row."""
+    index = dataframe.index
+    parts = []
+
+    if "TYPE" in dataframe.columns:
+        precision = dataframe["TYPE"].astype(str).str.upper()
+        flags = _empty_strings(index)
+        flags[precision == "PRECISE"] = "PRECISE"
+        flags[precision == "IMPRECISE"] = "IMPRECISE"
+        parts.append(flags)
+
+    if svcaller == "consensus" and "ConsensusSV_ID" in dataframe.columns:
+        values = dataframe["ConsensusSV_ID"]
+        parts.append(_keyed("ConsensusSV_ID", _stringify(values), values.notna()))
+
+    if include_variant_ID and "variant_ID" in dataframe.columns:
+        values = dataframe["variant_ID"]
+        parts.append(_keyed("Variant_ID", _stringify(values), values.notna()))
+
+    svtype = _column_or_na(dataframe, "SVTYPE")
+    is_bnd = svtype == "BND"
+    parts.append(_keyed("SVTYPE", _stringify(svtype), svtype.notna()))
+
+    svlen = _column_or_na(dataframe, "SVLEN")
+    svlen_strings = pd.Series(".", index=index, dtype=object)
+    svlen_strings[svlen.notna()] = _integer_strings(svlen[svlen.notna()])
+    parts.append(_keyed("SVLEN", svlen_strings, ~is_bnd))
+
+    for key in ["END", "RNAMES"]:
+        values = _column_or_na(dataframe, key)
+        parts.append(_keyed(key, _stringify(values), values.notna()))
+
+    af = _column_or_na(dataframe, "AF")
+    parts.append(_keyed("AF", _float2_strings(af), af.notna()))
+
+    num_callers = _column_or_na(dataframe, "NUM_CALLERS")
+    num_callers_strings = pd.Series("1", index=index, dtype=object)
+    num_callers_strings[num_callers.notna()] = _stringify(num_callers[num_callers.notna()])
+    parts.append("NUM_CALLERS=" + num_callers_strings)
+
+    if "POP_AF" in dataframe.columns:
+        pop_af = pd.to_numeric(dataframe["POP_AF"], errors="coerce").astype(float)
+        pop_af_strings = pd.Series("", index=index, dtype=object)
+        pop_af_strings[pop_af.notna()] = np.char.mod("%g", pop_af[pop_af.notna()].to_numpy())
+        parts.append(_keyed("POP_AF", pop_af_strings, pop_af.notna()))
+
+    return _join_parts(parts, ";")
+
+def format_sample_column(dataframe):
+    """GT:GQ:DR:DV sample strings for every row, equal to create_format_and_sample_fields."""
+    index = dataframe.index
+    if "Genotype" in dataframe.columns:
+        # only a handful of distinct genotypes exist: format those once
+        codes, uniques = pd.factorize(dataframe["Genotype"], use_na_sentinel=False)
+        genotypes = pd.Series(np.array([str(format_genotype(g)) for g in uniques], dtype=object)[codes], index=index)
+    else:
+        genotypes = pd.Series(".", index=index, dtype=object)
+
+    fields = [genotypes]
+    for key in ["GenotypeQuality", "ReferenceReads", "VariantReads"]:
+        values = _column_or_na(dataframe, key)
+        present = values.notna() & (values.astype(str) != ".")
+        strings = pd.Series(".", index=index, dtype=object)
+        strings[present] = _integer_strings(values[present])
+        fields.append(strings)
+
+    return fields[0].str.cat(fields[1:], sep=":")
+
+def format_vcf_records(dataframe, include_variant_ID=False, svcaller="consensus", read_names=None):
+    """
+    All data lines (newline-terminated) for dataframe, built column-wise.
+    RNAMES_ID columns are resolved through the read_names ReadNameStore.
+    """
+    if len(dataframe) == 0:
+        return []
+    dataframe = attach_read_names(dataframe, read_names)
+
+    qual = pd.to_numeric(dataframe["QUAL"], errors="coerce")
+    qual_strings = pd.Series(".", index=dataframe.index, dtype=object)
+    qual_strings[qual.notna()] = np.round(qual[qual.notna()].astype(float)).astype(np.int64).astype(str)
+
+    columns = [
+        _stringify(dataframe["POS"]),
+        _stringify(dataframe["ID"]),
+        _stringify(dataframe["REF"]),
+        _stringify(dataframe["ALT"]),
+        qual_strings,
+        _stringify(dataframe["FILTER"]),
+        format_info_column(dataframe, include_variant_ID=include_variant_ID, svcaller=svcaller),
+        pd.Series("GT:GQ:DR:DV", index=dataframe.index, dtype=object),
+        format_sample_column(dataframe),
+    ]
+    lines = _stringify(dataframe["CHROM"]).str.cat(columns, sep="\t") + "\n"
+    return lines.tolist()
+
+def write_vcf_file(output_filename, vcf_header, records, is_compressed=False, threads=1):
+    """
+    Write header lines and newline-terminated records. Compressed output is
+    bgzipped with `threads` compression threads and tabix-indexed while it is
+    written (BGZFTabixWriter), instead of a separate tabix_index pass.
+    """
+    header = "".join(f"{line}\n" for line in vcf_header)
+    if is_compressed:
+        with BGZFTabixWriter(output_filename, threads=threads) as file:
+            file.write(header)
+            file.write_records(records)
+    else:
+        with open(output_filename, 'w') as file:
+            file.write(header)
+            file.writelines(records)
+
+def sort_for_index(dataframe):
+    """
+    Group records by contig (in order of first appearance) and sort by POS, as
+    tabix requires. Frames that are already sorted keep their order.
+    """
+    chrom_rank = pd.factorize(dataframe['CHROM'])[0]
+    return dataframe.assign(_chrom_rank=chrom_rank).sort_values(
+        ['_chrom_rank', 'POS'], kind='stable').drop(columns='_chrom_rank')
+
+def generate_vcf_from_dataframe(dataframe, combined_contigs, combined_filters, output_filename, is_compressed=False, sample_id=None, threads=1, read_names=None):
     # Extract the sample ID from the first row
     if not sample_id:
         sample_id = dataframe.iloc[0]['Sample'] if 'Sample' in dataframe.columns and len(dataframe) > 0 else 'DefaultSample'
@@ -136,50 +322,18 @@ def generate_vcf_from_dataframe(dataframe, combined_contigs, combined_filters, o
 
     vcf_header.append(f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample_id}")
 
-    mode = 'wb' if is_compressed else 'w'
-    open_func = pysam.BGZFile if is_compressed else open
-
-    with open_func(output_filename, mode) as file:
-        for line in vcf_header:
-            file.write(f"{line}\n".encode('utf-8') if is_compressed else f"{line}\n")
-        for _, row in dataframe.iterrows():
-            info_field = create_info_field(row)
-            format_field, sample_field = create_format_and_sample_fields(row)
-            row["QUAL"] = round(float(row["QUAL"])) if pd.notna(row["QUAL"]) else "."
-            row["ALT"] = clean_tuple_field(row["ALT"])
-            vcf_row = [
-                row["CHROM"],
-                row["POS"],
-                row["ID"],
-                row["REF"],
-                row["ALT"],
-                row["QUAL"],
-                row["FILTER"],
-                info_field,
-                format_field,
-                sample_field
-            ]
-            file.write("\t".join(map(str, vcf_row)).encode('utf-8') if is_compressed else "\t".join(map(str, vcf_row)) + "\n")
-
     if is_compressed:
-        # Create tabix index
-        pysam.tabix_index(output_filename, preset="vcf")
+        dataframe = sort_for_index(dataframe)
+    write_vcf_file(output_filename, vcf_header, format_vcf_records(dataframe, read_names=read_names), is_compressed, threads)
 
 def retrieve_vcf_header(file_path):
-    contigs, filters = [], []
-    with (gzip.open if file_path.endswith('.gz') else open)(file_path, 'rt', encoding='utf-8') as file:
-        for line in file:
-            if line.startswith("##contig="):
-                contigs.append(line.strip())
-            elif line.startswith("##FILTER="):
-                filters.append(line.strip())
-    return contigs, filters
-
-def generate_vcf_variants(dataframe, header_file_path, output_filename, is_compressed=False, include_variant_ID=True, sample_id=None, svcaller="consensus"):
-    if not sample_id:
-        sample_id = dataframe.iloc[0]['Sample'] if 'Sample' in dataframe.columns else 'DefaultSample'
+    meta, _ = read_vcf_header(file_path)
+    return list(meta.get("contig", [])), list(meta.get("FILTER", []))
 
-    contigs, filters = retrieve_vcf_header(header_file_path)
+def build_variants_header(dataframe, contigs, filters, svcaller="consensus", sample_id=None):
+    """Header lines for generate_vcf_variants output, given the template's contig/FILTER lines."""
+    if not sample_id:
+        sample_id = dataframe.iloc[0]['Sample'] if 'Sample' in dataframe.columns and len(dataframe) > 0 else 'DefaultSample'
 
     vcf_header = [
         "##fileformat=VCFv4.2",
@@ -225,6 +379,8 @@ def generate_vcf_variants(dataframe, header_file_path, output_filename, is_compr
         "##INFO=<ID=AF,Number=A,Type=Float,Description=\"Allele Frequency\">",
         "##INFO=<ID=NUM_CALLERS,Number=1,Type=Integer,Description=\"Number of SV callers reporting this variant\">"
     ]
+    if "POP_AF" in dataframe.columns:
+        info_fields.append("##INFO=<ID=POP_AF,Number=1,Type=Float,Description=\"Allele frequency of the closest matching SV in the population catalogue\">")
     
     # Add ConsensusSV_ID if svcaller is consensus
     if svcaller == "consensus":
@@ -252,29 +408,54 @@ def generate_vcf_variants(dataframe, header_file_path, output_filename, is_compr
         "##FORMAT=<ID=DV,Number=1,Type=Integer,Description=\"Variant Reads\">",
         f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample_id}"
     ])
+    return vcf_header
 
-    mode = 'wb' if is_compressed else 'w'
-    open_func = pysam.BGZFile if is_compressed else open
-
-    with open_func(output_filename, mode) as file:
-        for line in vcf_header:
-            file.write(f"{line}\n".encode('utf-8') if is_compressed else f"{line}\n")
-        for _, row in dataframe.iterrows():
-            info_field = create_info_field(row, include_variant_ID=include_variant_ID, svcaller=svcaller)
-            format_field, sample_field = create_format_and_sample_fields(row)
-            vcf_row = [
-                row["CHROM"],
-                row["POS"],
-                row["ID"],
-                row["REF"],
-                row["ALT"],
-                round(float(row["QUAL"])) if pd.notna(row["QUAL"]) else ".",
-                row["FILTER"],
-                info_field,
-                format_field,
-                sample_field
-            ]
-            file.write("\t".join(map(str, vcf_row)).encode('utf-8') if is_compressed else "\t".join(map(str, vcf_row)) + "\n")
-
+def _write_variants(dataframe, vcf_header, output_filename, is_compressed, include_variant_ID, svcaller, threads, read_names=None):
     if is_compressed:
-        pysam.tabix_index(output_filename, preset="vcf")
+        dataframe = sort_for_index(dataframe)
+    records = format_vcf_records(dataframe, include_variant_ID=include_variant_ID, svcaller=svcaller, read_names=read_names)
+    write_vcf_file(output_filename, vcf_header, records, is_compressed, threads)
+
+def generate_vcf_variants(dataframe, header_file_path, output_filename, is_compressed=False, include_variant_ID=True, sample_id=None, svcaller="consensus", threads=1, read_names=None):
+    contigs, filters = retrieve_vcf_header(header_file_path)
+    vcf_header = build_variants_header(dataframe, contigs, filters, svcaller=svcaller, sample_id=sample_id)
+    _write_variants(dataframe, vcf_header, output_filename, is_compressed, include_variant_ID, svcaller, threads, read_names)
+
+def generate_pair_vcfs(sinks, is_compressed=False, include_variant_ID=True, sample_id=None, svcaller="consensus", threads=1, read_names=None):
+    """
+    Write several generate_vcf_variants outputs in one pass.
+
+    sinks: list of (dataframe, header_file_path, output_filename). Each distinct
+    template is read once for its contig/FILTER lines (a (contigs, filters)
+    pair of line lists may be given instead of a path), every header is built
+    up front, and with threads > 1 the outputs are serialised and written
+    concurrently (compression threads are shared out between them).
+    read_names resolves the frames' RNAMES_ID columns, if any.
+    """
+    templates = {}
+    for _, header_file_path, _ in sinks:
+        if isinstance(header_file_path, str) and header_file_path not in templates:
+            templates[header_file_path] = retrieve_vcf_header(header_file_path)
+
+    jobs = []
+    for dataframe, header_file_path, output_filename in sinks:
+        contigs, filters = templates[header_file_path] if isinstance(header_file_path, str) else header_file_path
+        vcf_header = build_variants_header(dataframe, contigs, filters, svcaller=svcaller, sample_id=sample_id)
+        jobs.append((dataframe, vcf_header, output_filename))
+
+    workers = min(len(jobs), threads)
+    if workers <= 1:
+        for dataframe, vcf_header, output_filename in jobs:
+            _write_variants(dataframe, vcf_header, output_filename, is_compressed, include_variant_ID, svcaller, threads,
+                            read_names)
+        return
+
+    compression_threads = max(1, threads // workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_variants, dataframe, vcf_header, output_filename, is_compressed,
+                            include_variant_ID, svcaller, compression_threads, read_names)
+            for dataframe, vcf_header, output_filename in jobs
+        ]
+        for future in futures:
+            future.result()
@@ -1,34 +1,128 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pysam
 import pandas as pd
-import re
-
-def process_sample_data(sample, vcf_format):
-    genotype = sample['GT']
-
-    if vcf_format in ['sniffles', 'cutesv', 'consensus']:
+from .contigs import BND_MATE
+from .interval_index import load_region_set, merge_intervals
+from .schema import enforce_schema
+
+# Record extraction. process_vcf_to_dataframe picks one extractor per file
+# from the VCF format; it resolves the INFO keys it reads against the header
+# once (pysam rejects undeclared keys) and appends every record's fields
+# straight to column lists, reading only those keys instead of decoding the
+# whole INFO dict. Sniffles2, cuteSV and consensus VCFs carry DR/DV read
+# counts, SVIM ones AD (or SUPPORT).
+#
+# A key becomes a column only when the header declares it; SVTYPE, SVLEN and
+# CHR2 are always present because filter_sv_dataframe reads them. Unlike the
+# original dict-based reader, INFO fields outside INFO_KEYS are not copied
+# into the frame: there are no PRECISE/IMPRECISE (precision is in TYPE) or
+# SUPPORT columns any more.
+#
+# process_vcf_regions reads an indexed VCF window by window instead (pair
+# --stream-normal): windows closer than REGION_GAP bp share one tabix fetch,
+# and only records whose POS lies in a window are kept, in file order.
+
+REGION_GAP = 10000
+
+class RecordExtractor:
+    """Column buffers for the records of a Sniffles2/cuteSV-style VCF."""
+    INFO_KEYS = ('SVTYPE', 'SVLEN', 'CHR2', 'RNAMES')
+    REQUIRED_KEYS = ('SVTYPE', 'SVLEN', 'CHR2')
+    PRECISION_FLAGS = True
+
+    def __init__(self, header, sample_id, read_names=None):
+        self.sample_id = sample_id
+        self.read_names = read_names
+        self.info_keys = tuple(key for key in self.INFO_KEYS if key in header.info)
+        self.flags = tuple(flag for flag in ('PRECISE', 'IMPRECISE')
+                           if self.PRECISION_FLAGS and flag in header.info)
+        # RNAMES go to the ReadNameStore when there is one, the frame keeps their IDs
+        self.info_columns = tuple('RNAMES_ID' if key == 'RNAMES' and read_names is not None else key
+                                  for key in self.INFO_KEYS if key in header.info or key in self.REQUIRED_KEYS)
+        self.columns = {column: [] for column in
+                        ('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'TYPE', 'END') + self.info_columns +
+                        ('Genotype', 'GenotypeQuality', 'ReferenceReads', 'VariantReads', 'AF')}
+
+    def sample_fields(self, sample):
+        """(GenotypeQuality, ReferenceReads, VariantReads, AF) from the sample's FORMAT fields."""
         reference_reads = sample.get('DR', 0)
         variant_reads = sample.get('DV', 0)
         genotype_quality = sample.get('GQ', 0)
 
         reference_reads = int(reference_reads) if reference_reads is not None else 0
         variant_reads = int(variant_reads) if variant_reads is not None else 0
-
-        # Calculate AF for cutesv and sniffles if they use similar structure for DR and DV
         af = variant_reads / (variant_reads + reference_reads) if (variant_reads + reference_reads) > 0 else 0
-
-    elif vcf_format == 'svim':
+        return genotype_quality, reference_reads, variant_reads, af
+
+    def add(self, record, sample):
+        columns = self.columns
+        info = record.info
+        alts = record.alts
+        columns['CHROM'].append(record.chrom)
+        columns['POS'].append(record.pos)
+        columns['ID'].append(record.id)
+        columns['REF'].append(record.ref)
+        columns['ALT'].append(alts)
+        columns['QUAL'].append(record.qual)
+        filters = record.filter.keys()
+        columns['FILTER'].append(filters[0] if filters else '.')
+
+        precision = '.'
+        for flag in self.flags:
+            if info.get(flag, False):
+                precision = flag
+                break
+        columns['TYPE'].append(precision)
+
+        values = {key: info.get(key) for key in self.info_keys}
+        end = record.stop
+        if values.get('SVTYPE') == 'BND':
+            # mate contig and position come from the ALT string
+            match = BND_MATE.search(alts[0]) if alts else None
+            values['CHR2'] = match.group(1) if match else '.'
+            end = int(match.group(2)) if match else '.'
+        columns['END'].append(end)
+        if self.read_names is not None:
+            values['RNAMES_ID'] = self.read_names.add(values.pop('RNAMES', None))
+        for column in self.info_columns:
+            columns[column].append(values.get(column))
+
+        genotype_quality, reference_reads, variant_reads, af = self.sample_fields(sample)
+        columns['Genotype'].append(sample['GT'])
+        columns['GenotypeQuality'].append(genotype_quality)
+        columns['ReferenceReads'].append(reference_reads)
+        columns['VariantReads'].append(variant_reads)
+        columns['AF'].append(af)
+
+    def to_dataframe(self):
+        dataframe = pd.DataFrame(self.columns)
+        dataframe['Sample'] = self.sample_id
+        return dataframe
+
+class Sniffles2Extractor(RecordExtractor):
+    pass
+
+class CuteSVExtractor(RecordExtractor):
+    pass
+
+class ConsensusExtractor(RecordExtractor):
+    """OncoSV's own consensus/pair VCFs, which add the consensus INFO keys."""
+    INFO_KEYS = ('ConsensusSV_ID', 'Variant_ID', 'SVTYPE', 'SVLEN', 'CHR2', 'RNAMES', 'NUM_CALLERS')
+
+class SVIMExtractor(RecordExtractor):
+    """SVIM VCFs: no precision flags, read counts from AD or SUPPORT."""
+    PRECISION_FLAGS = False
+
+    def sample_fields(self, sample):
         svtype = sample.get('SVTYPE', '.')
-        # Try to get DP (Total Read Depth), default to 0 if missing
-        read_depth = int(sample.get('DP', 0) or 0)
 
         # Handle special case for BND variants (Breakends)
         if svtype == 'BND':
             reference_reads = 0  # No reference reads for BND
             variant_reads = int(sample.get('SUPPORT', 0) or 0)  # Use SUPPORT
             af = '.'  # No meaningful AF since ref reads are missing
-
         else:
             # Extract AD (Allelic Depth) if available
             ad_values = sample.get('AD')
@@ -47,20 +141,20 @@ def process_sample_data(sample, vcf_format):
                 af = variant_reads / (reference_reads + variant_reads) if (reference_reads + variant_reads) > 0 else '.'
 
         genotype_quality = sample.get('GQ', '.')  # Default GQ
+        return genotype_quality, reference_reads, variant_reads, af
 
+EXTRACTORS = {
+    'sniffles': Sniffles2Extractor,
+    'cutesv': CuteSVExtractor,
+    'svim': SVIMExtractor,
+    'consensus': ConsensusExtractor,
+}
 
-    else:
-        raise ValueError(f"Unsupported vcf_format: {vcf_format}")  # Catch unexpected cases
-
-    call_record = {
-        'Genotype': genotype,
-        'GenotypeQuality': genotype_quality,
-        'ReferenceReads': reference_reads,
-        'VariantReads': variant_reads,
-        'AF': af  # Apply AF calculation to all formats where applicable
-    }
-
-    return call_record
+def record_extractor(vcf_format, header, sample_id, read_names=None):
+    """The extractor for a VCF of vcf_format ('sniffles', 'cutesv', 'svim' or 'consensus')."""
+    if vcf_format not in EXTRACTORS:
+        raise ValueError(f"Unsupported vcf_format: {vcf_format}")
+    return EXTRACTORS[vcf_format](header, sample_id, read_names)
 
 def convert_svlen(value):
     if isinstance(value, (list, tuple)) and len(value) > 0:
@@ -71,77 +165,163 @@ def convert_svlen(value):
         except:
             return 0
 
-def process_vcf_to_dataframe(vcf_file, chromosomes, qual, vcf_format, lower_sv_size=50, upper_sv_size=1000000, sample_id=None, apply_af_filtering=True):
-    processed_data = []
+def _parse_genotype(genotype):
+    """GT tuple pysam returns for a genotype written by format_genotype."""
+    from .prepare_vcf_output_file import format_genotype
+    return tuple(None if allele == '.' else int(allele) for allele in str(format_genotype(genotype)).split('/'))
+
+def _written_integers(values, missing):
+    """Integer column as it reads back after _integer_strings: truncated, `missing` for '.'/NaN."""
+    numeric = pd.to_numeric(values.where(values.astype(str) != '.'), errors='coerce')
+    present = numeric.notna()
+    out = pd.Series(missing, index=values.index, dtype=object)
+    out[present] = np.trunc(numeric[present].astype(float)).astype(np.int64)
+    return out
+
+def calls_from_dataframe(dataframe, chromosomes, qual, lower_sv_size=50, upper_sv_size=1000000, sample_id=None,
+                         apply_af_filtering=True, include_variant_ID=False, svcaller="consensus"):
+    """
+    The frame process_vcf_to_dataframe(vcf_format='consensus') returns for a VCF
+    written from `dataframe` by format_vcf_records (uncompressed, so in frame
+    order), built directly from the frame: values are rounded, stringified and
+    re-typed the way the write/parse round trip would, then filtered with
+    filter_sv_dataframe. Used to chain pipeline stages without intermediate VCFs.
+    """
+    from .prepare_vcf_output_file import _stringify
+
+    if not sample_id:
+        sample_id = dataframe.iloc[0]['Sample'] if 'Sample' in dataframe.columns and len(dataframe) > 0 else 'DefaultSample'
+    df = dataframe[dataframe['CHROM'].isin(chromosomes)]
+    index = df.index
+
+    def column(key):
+        return df[key] if key in df.columns else pd.Series(np.nan, index=index, dtype=object)
+
+    processed = pd.DataFrame(index=index)
+    processed['CHROM'] = df['CHROM']
+    processed['POS'] = df['POS'].astype(np.int64)
+    ids = _stringify(df['ID'])
+    processed['ID'] = ids.where(ids != '.', None)
+    processed['REF'] = _stringify(df['REF'])
+    alts = _stringify(df['ALT'])
+    processed['ALT'] = alts.map(lambda alt: None if alt == '.' else tuple(alt.split(',')))
+    processed['QUAL'] = np.round(pd.to_numeric(df['QUAL'], errors='coerce').astype(float))
+    processed['FILTER'] = _stringify(df['FILTER']).str.split(';').str[0]
+
+    precision = column('TYPE').astype(str).str.upper()
+    processed['TYPE'] = np.where(precision == 'PRECISE', 'PRECISE', np.where(precision == 'IMPRECISE', 'IMPRECISE', '.'))
+
+    # INFO/END when written, otherwise the record's own end (POS + len(REF) - 1)
+    end = pd.to_numeric(column('END'), errors='coerce')
+    processed['END'] = end.fillna(processed['POS'] + processed['REF'].str.len() - 1).astype(np.int64).astype(object)
+
+    if svcaller == "consensus" and 'ConsensusSV_ID' in df.columns:
+        processed['ConsensusSV_ID'] = _stringify(df['ConsensusSV_ID']).where(df['ConsensusSV_ID'].notna())
+    if include_variant_ID and 'variant_ID' in df.columns:
+        processed['Variant_ID'] = _stringify(df['variant_ID']).where(df['variant_ID'].notna())
+
+    svtype = column('SVTYPE')
+    is_bnd = svtype == 'BND'
+    processed['SVTYPE'] = svtype
+    svlen = _written_integers(column('SVLEN'), 0)
+    svlen[is_bnd] = 0
+    processed['SVLEN'] = svlen
+
+    if 'RNAMES_ID' in df.columns:
+        processed['RNAMES_ID'] = df['RNAMES_ID']     # read names stay in the ReadNameStore
+    else:
+        rnames = column('RNAMES')
+        processed['RNAMES'] = _stringify(rnames).map(lambda names: tuple(names.split(','))).where(rnames.notna())
+    processed['AF'] = 0.0      # INFO/AF slot; recomputed from DR/DV below as the reader does
+    processed['NUM_CALLERS'] = _written_integers(column('NUM_CALLERS'), 1).astype(np.int64)
+
+    # BND mate and END come from the ALT string, exactly as in the VCF reader
+    processed['CHR2'] = pd.Series(np.nan, index=index, dtype=object)
+    if is_bnd.any():
+        mates = alts[is_bnd].str.extract(BND_MATE)
+        processed.loc[is_bnd, 'CHR2'] = mates[0].fillna('.')
+        processed.loc[is_bnd, 'END'] = mates[1].map(lambda value: '.' if pd.isna(value) else int(value))
+    if not (processed['END'] == '.').any():
+        processed['END'] = processed['END'].astype(np.int64)
+
+    codes, uniques = pd.factorize(column('Genotype'), use_na_sentinel=False)
+    processed['Genotype'] = pd.Series([_parse_genotype(g) for g in uniques], dtype=object).to_numpy()[codes] if len(uniques) else []
+    gq = _written_integers(column('GenotypeQuality'), np.nan)
+    processed['GenotypeQuality'] = gq.astype(float) if gq.isna().any() else gq.astype(np.int64)
+    reference_reads = _written_integers(column('ReferenceReads'), 0).astype(np.int64)
+    variant_reads = _written_integers(column('VariantReads'), 0).astype(np.int64)
+    processed['ReferenceReads'] = reference_reads
+    processed['VariantReads'] = variant_reads
+    depth = reference_reads + variant_reads
+    processed['AF'] = (variant_reads / depth.where(depth > 0)).fillna(0)
+    processed['Sample'] = sample_id
+
+    return filter_sv_dataframe(processed.reset_index(drop=True).infer_objects(), qual, lower_sv_size, upper_sv_size, apply_af_filtering)
+
+def process_vcf_to_dataframe(vcf_file, chromosomes, qual, vcf_format, lower_sv_size=50, upper_sv_size=1000000, sample_id=None, apply_af_filtering=True, read_names=None, threads=1, exclude_bed=None):
+    """
+    One row per record of vcf_file on `chromosomes`, filtered by
+    filter_sv_dataframe. With a ReadNameStore as read_names, RNAMES are added
+    to the store and the frame holds their RNAMES_ID instead. Bgzipped input
+    is decompressed with `threads` htslib threads. Records with a breakpoint
+    in a region of the exclude_bed BED file are dropped.
+    """
+    chromosomes = set(chromosomes)
 
     # Open VCF or compressed VCF file
-    with pysam.VariantFile(vcf_file, 'r') as vcf_reader:
+    with pysam.VariantFile(vcf_file, 'r', threads=threads) as vcf_reader:
         if not sample_id:
             sample_id = list(vcf_reader.header.samples)[0] if vcf_reader.header.samples else 'DefaultSample'
+        extractor = record_extractor(vcf_format, vcf_reader.header, sample_id, read_names)
 
         for record in vcf_reader:
-            CHROM = record.chrom
-
-            if CHROM in chromosomes:
-                POS = record.pos
-                ID = record.id
-                REF = record.ref
-                ALT = record.alts
-                QUAL = record.qual
-                FILTER = record.filter.keys()[0] if record.filter else '.'
-
-                info_dict = dict(record.info.items())
-
-                if vcf_format in ['sniffles', 'cutesv', 'consensus']:
-                    if info_dict.get('PRECISE', False):
-                        filter_status = 'PRECISE'
-                    elif info_dict.get('IMPRECISE', False):
-                        filter_status = 'IMPRECISE'
-                    else:
-                        filter_status = '.'
-                else:
-                    filter_status = '.'
-
-                info_record = {
-                    'CHROM': CHROM,
-                    'POS': POS,
-                    'ID': ID,
-                    'REF': REF,
-                    'ALT': ALT,
-                    'QUAL': QUAL,
-                    'FILTER': FILTER,
-                    'TYPE': filter_status,
-                    'END': record.stop
-                }
-
-                info_record.update(info_dict)
-
-                if 'SVTYPE' in info_dict and info_dict['SVTYPE'] == 'BND':
-                    if ALT:
-                        alt_str = ALT[0]
-                        match = re.search(r'N?\[?(chr[\dXY]+):(\d+)\]?N?', alt_str)
-                        if match:
-                            chr2 = match.group(1)
-                            end = int(match.group(2))
-                        else:
-                            chr2 = '.'
-                            end = '.'
-                        info_record['CHR2'] = chr2
-                        info_record['END'] = end
-                    else:
-                        chr2 = '.'
-                        end = '.'
-                        info_record['CHR2'] = chr2
-                        info_record['END'] = end
-
+            if record.chrom in chromosomes:
                 sample_data = record.samples.get(sample_id)
                 if sample_data is not None:
-                    call_record = process_sample_data(sample_data, vcf_format)
-                    final_record = {**info_record, **call_record, 'Sample': sample_id}
-                    processed_data.append(final_record)
-
-    processed_df = pd.DataFrame(processed_data)
-
+                    extractor.add(record, sample_data)
+
+    processed_df = extractor.to_dataframe()
+    return filter_sv_dataframe(processed_df, qual, lower_sv_size, upper_sv_size, apply_af_filtering,
+                               load_region_set(exclude_bed) if exclude_bed else None)
+
+def process_vcf_regions(vcf_file, regions, qual, vcf_format, lower_sv_size=50, upper_sv_size=1000000, sample_id=None, apply_af_filtering=True, read_names=None, threads=1, exclude_bed=None):
+    """
+    process_vcf_to_dataframe for the records of a tabix/CSI-indexed VCF whose
+    POS lies in `regions`: {contig: (starts, ends)} of sorted, disjoint closed
+    POS windows, as returned by merge_intervals.
+    """
+    with pysam.VariantFile(vcf_file, 'r', threads=threads) as vcf_reader:
+        if vcf_reader.index is None:
+            raise ValueError(f"{vcf_file} has no tabix/CSI index (bgzip it and run `tabix -p vcf`)")
+        if not sample_id:
+            sample_id = list(vcf_reader.header.samples)[0] if vcf_reader.header.samples else 'DefaultSample'
+        extractor = record_extractor(vcf_format, vcf_reader.header, sample_id, read_names)
+
+        # Contigs in index (file) order, so rows come out as a full read orders them
+        for contig in [contig for contig in vcf_reader.index if contig in regions]:
+            starts, ends = regions[contig]
+            for fetch_start, fetch_end in zip(*merge_intervals(starts, ends, gap=REGION_GAP)):
+                for record in vcf_reader.fetch(contig, int(fetch_start) - 1, int(fetch_end)):
+                    # fetch also returns records that start earlier and span the region
+                    window = np.searchsorted(ends, record.pos)
+                    if record.pos < fetch_start or window == len(ends) or record.pos < starts[window]:
+                        continue
+                    sample_data = record.samples.get(sample_id)
+                    if sample_data is not None:
+                        extractor.add(record, sample_data)
+
+    processed_df = extractor.to_dataframe()
+    return filter_sv_dataframe(processed_df, qual, lower_sv_size, upper_sv_size, apply_af_filtering,
+                               load_region_set(exclude_bed) if exclude_bed else None)
+
+def filter_sv_dataframe(processed_df, qual, lower_sv_size=50, upper_sv_size=1000000, apply_af_filtering=True,
+                        exclude_regions=None):
+    """
+    Post-ingest clean-up shared by every reader: CHR2 -> CHROM2, END/SVLEN
+    normalisation, excluded-region (a RegionSet: POS on CHROM or END on
+    CHROM2 inside), size and QUAL filters and optional AF de-duplication.
+    processed_df holds one row per record as built by process_vcf_to_dataframe.
+    """
     column_order = list(processed_df.columns)
     column_order.remove('Sample')
     column_order.append('Sample')
@@ -153,6 +333,11 @@ def process_vcf_to_dataframe(vcf_file, chromosomes, qual, vcf_format, lower_sv_s
     processed_df['END'] = processed_df['END'].fillna(processed_df['POS'])
     processed_df['SVLEN'] = processed_df['SVLEN'].apply(convert_svlen)
 
+    if exclude_regions is not None:
+        excluded = (exclude_regions.contains(processed_df['CHROM'], processed_df['POS']) |
+                    exclude_regions.contains(processed_df['CHROM2'], pd.to_numeric(processed_df['END'], errors='coerce')))
+        processed_df = processed_df[~excluded]
+
     filtered_df = processed_df[
     (processed_df['SVTYPE'].isin(['BND', 'INV'])) |
     ((processed_df['SVLEN'].abs() >= lower_sv_size) & (processed_df['SVLEN'].abs() <= upper_sv_size))
@@ -168,10 +353,9 @@ def process_vcf_to_dataframe(vcf_file, chromosomes, qual, vcf_format, lower_sv_s
         # Apply AF filtering only to non-BND variants
         non_bnd_variants = non_bnd_variants.dropna(subset=['AF'])
         non_bnd_variants = non_bnd_variants.loc[
-            non_bnd_variants.groupby(['CHROM', 'POS', 'END'])['AF'].idxmax()
+            non_bnd_variants.groupby(['CHROM', 'POS', 'END'], observed=True)['AF'].idxmax()
         ]
         # Concatenate BND and filtered non-BND variants
         filtered_df = pd.concat([bnd_variants, non_bnd_variants])
 
-    return filtered_df
-
+    return enforce_schema(filtered_df)
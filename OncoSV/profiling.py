@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Per-stage instrumentation for the pipelines: wall time, CPU time, resident
+# memory and output row counts, written as JSON or TSV with --profile-report.
+# --profile-hook additionally runs cProfile or pyinstrument around each stage.
+#
+# peak_rss_mb is the stage's own peak: on Linux the resident high-water mark
+# is reset at stage start (writing 5 to /proc/self/clear_refs) and VmHWM is
+# read at stage end. Where it cannot be reset the column is empty. A stage
+# that encloses others gets the largest of their peaks and its own.
+# children_peak_rss_mb is the largest child process (ingest pool workers,
+# batch stages) that exited during the stage, from RUSAGE_CHILDREN; the kernel
+# only keeps the largest child ever, so it is empty when no child exited or
+# none outgrew the children of earlier stages. The JSON report's top-level
+# process_peak_rss_mb is the peak of the whole run.
+
+REPORT_COLUMNS = ['command', 'stage', 'wall_s', 'cpu_s', 'rss_start_mb', 'rss_end_mb', 'peak_rss_mb',
+                  'children_peak_rss_mb', 'rows']
+
+def _maxrss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _reset_peak_rss():
+    """Reset the resident high-water mark (VmHWM); False where that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def _stage_peak_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+class Stage:
+    """Measurements of one pipeline stage; set `rows` inside the with-block."""
+
+    def __init__(self, command, name):
+        self.command = command
+        self.name = name
+        self.rows = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.peak_rss_mb = None
+        self.children_peak_rss_mb = None
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'stage': self.name,
+            'wall_s': round(self.wall_s, 4),
+            'cpu_s': round(self.cpu_s, 4),
+            'rss_start_mb': None if self.rss_start_mb is None else round(self.rss_start_mb, 1),
+            'rss_end_mb': None if self.rss_end_mb is None else round(self.rss_end_mb, 1),
+            'peak_rss_mb': None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            'children_peak_rss_mb': None if self.children_peak_rss_mb is None else round(self.children_peak_rss_mb, 1),
+            'rows': self.rows,
+        }
+
+class StageProfiler:
+    """
+    Collects Stage records for one command.
+
+    report_path: JSON (default) or TSV (.tsv/.txt) file written by write_report()
+    hook       : None, 'cprofile' or 'pyinstrument'; per-stage profiles go next
+                 to the report as <report stem>.<stage>.prof / .html
+    """
+
+    def __init__(self, command, report_path=None, hook=None):
+        self.command = command
+        self.report_path = report_path
+        self.hook = hook
+        self.stages = []
+        self.open_stages = []
+        self.process_peak_rss_mb = _maxrss_mb()
+
+    @classmethod
+    def from_args(cls, args, command):
+        return cls(command,
+                   report_path=getattr(args, 'profile_report', None),
+                   hook=getattr(args, 'profile_hook', None))
+
+    @contextmanager
+    def stage(self, name):
+        record = Stage(self.command, name)
+        profiler = self._start_hook()
+        record.rss_start_mb = _current_rss_mb()
+        # Resetting VmHWM also resets ru_maxrss: hand the mark so far to the
+        # enclosing stages and the run's peak first
+        self._note_peak(_stage_peak_rss_mb() or _maxrss_mb())
+        resettable = _reset_peak_rss()
+        children_start = _maxrss_mb(resource.RUSAGE_CHILDREN)
+        self.open_stages.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_s = time.perf_counter() - wall
+            record.cpu_s = time.process_time() - cpu
+            record.rss_end_mb = _current_rss_mb()
+            self.open_stages.pop()
+            if resettable:
+                # Enclosed stages reset the mark too, but raised ours before doing so
+                record.peak_rss_mb = max(record.peak_rss_mb or 0, _stage_peak_rss_mb() or 0)
+                self._note_peak(record.peak_rss_mb)
+            else:
+                record.peak_rss_mb = None
+            children_end = _maxrss_mb(resource.RUSAGE_CHILDREN)
+            if children_end > children_start:
+                record.children_peak_rss_mb = children_end
+            self._stop_hook(profiler, name)
+            self.stages.append(record)
+
+    def _note_peak(self, peak_mb):
+        self.process_peak_rss_mb = max(self.process_peak_rss_mb, peak_mb)
+        for enclosing in self.open_stages:
+            enclosing.peak_rss_mb = max(enclosing.peak_rss_mb or 0, peak_mb)
+
+    def _start_hook(self):
+        if self.hook == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if self.hook == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        return None
+
+    def _stop_hook(self, profiler, name):
+        if profiler is None:
+            return
+        base = f"{os.path.splitext(self.report_path)[0] if self.report_path else self.command + '_profile'}.{name}"
+        if self.hook == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(f"{base}.prof")
+        else:
+            profiler.stop()
+            with open(f"{base}.html", 'w') as file:
+                file.write(profiler.output_html())
+
+    def write_report(self, path=None):
+        path = path or self.report_path
+        if not path:
+            return None
+        rows = [stage.as_dict() for stage in self.stages]
+        if path.endswith(('.tsv', '.txt')):
+            with open(path, 'w') as file:
+                file.write('\t'.join(REPORT_COLUMNS) + '\n')
+                for row in rows:
+                    file.write('\t'.join('' if row[c] is None else str(row[c]) for c in REPORT_COLUMNS) + '\n')
+        else:
+            with open(path, 'w') as file:
+                self._note_peak(_stage_peak_rss_mb() or _maxrss_mb())
+                json.dump({'command': self.command, 'process_peak_rss_mb': round(self.process_peak_rss_mb, 1),
+                           'stages': rows}, file, indent=2)
+        print(f"Profile report written to {path}")
+        return path
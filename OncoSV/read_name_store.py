@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+import numpy as np
+import pandas as pd
+
+# RNAMES of deep long-read tumours are hundreds of read UUIDs per SV, and as
+# per-record tuples they are most of a caller frame's memory although consensus
+# and pair only copy them through. With --read-name-store DIR they are
+# appended, comma-joined, to a byte pool in an unlinked file under DIR (an
+# offsets array marks where each value starts), and the frames carry an
+# integer RNAMES_ID column instead (-1 where a record has none). The pool is
+# memory-mapped when read: process_shared_reads and the writers fetch the
+# values of the rows they handle (attach_read_names), so resident memory holds
+# only the pages in use. The file is removed from DIR as soon as it is created
+# and disappears with the process. Ingestion workers (parallel_ingest) keep
+# their pool file instead and hand it to the parent store, which appends it
+# with merge().
+
+class ReadNameStore:
+    """Append-only, file-backed pool of RNAMES values addressed by integer ID."""
+
+    def __init__(self, directory=None, unlink=True):
+        fd, path = tempfile.mkstemp(prefix='oncosv_rnames_', suffix='.bin', dir=directory)
+        if unlink:
+            os.unlink(path)
+        self.path = None if unlink else path
+        self.directory = directory
+        self._file = os.fdopen(fd, 'w+b')
+        self._offsets = array('q', [0])
+        self._view = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def add(self, names):
+        """Store an RNAMES value (tuple of names or comma-joined string); returns its ID, -1 for None."""
+        if names is None:
+            return -1
+        if isinstance(names, (tuple, list)):
+            names = ','.join(str(name) for name in names)
+        data = names.encode()
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        return len(self._offsets) - 2
+
+    def _mapped(self):
+        """uint8 view of the pool, re-mapped when values were added since the last read."""
+        with self._lock:
+            size = self._offsets[-1]
+            if self._view is None or len(self._view) < size:
+                self._file.flush()
+                if size == 0:
+                    self._view = np.empty(0, dtype=np.uint8)
+                else:
+                    self._view = np.frombuffer(mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ),
+                                               dtype=np.uint8)
+            return self._view
+
+    def strings(self, ids):
+        """Comma-joined RNAMES for each ID (None for -1), as they are written to INFO."""
+        view = self._mapped()
+        offsets = self._offsets
+        values = []
+        for read_names_id in ids:
+            read_names_id = int(read_names_id)
+            if read_names_id < 0:
+                values.append(None)
+            else:
+                values.append(view[offsets[read_names_id]:offsets[read_names_id + 1]].tobytes().decode())
+        return values
+
+    def tuples(self, ids):
+        """RNAMES tuples for each ID, as process_vcf_to_dataframe would hold them (None for -1)."""
+        return [None if names is None else tuple(names.split(',')) for names in self.strings(ids)]
+
+    def detach(self):
+        """Close a store made with unlink=False; returns (pool path, offsets) for merge()."""
+        self.close()
+        return self.path, self._offsets
+
+    def merge(self, path, offsets):
+        """
+        Append the values of a detached store (whose file is then removed);
+        returns the amount its IDs shift by in this store.
+        """
+        shift = len(self)
+        base = self._offsets[-1]
+        with open(path, 'rb') as pool:
+            shutil.copyfileobj(pool, self._file)
+        os.remove(path)
+        self._offsets.extend(base + offset for offset in offsets[1:])
+        return shift
+
+    def close(self):
+        self._view = None
+        self._file.close()
+
+def store_from_args(args):
+    """A ReadNameStore under --read-name-store, or None when the option is not given."""
+    directory = getattr(args, 'read_name_store', None)
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return ReadNameStore(directory)
+
+def attach_read_names(dataframe, read_names, as_tuples=False):
+    """
+    dataframe with its RNAMES_ID column replaced, in place, by the RNAMES it
+    references (comma-joined strings, or tuples with as_tuples). Frames
+    without RNAMES_ID, or without a store, are returned unchanged.
+    """
+    if read_names is None or 'RNAMES_ID' not in dataframe.columns:
+        return dataframe
+    position = dataframe.columns.get_loc('RNAMES_ID')
+    fetch = read_names.tuples if as_tuples else read_names.strings
+    values = pd.Series(fetch(dataframe['RNAMES_ID']), index=dataframe.index, dtype=object)
+    dataframe = dataframe.drop(columns='RNAMES_ID')
+    dataframe.insert(position, 'RNAMES', values)
+    return dataframe
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+# Column dtypes of the intermediate frames (caller/consensus calls, pair
+# classes, the shared-read table). Repeated strings become categoricals, whose
+# categories are kept sorted so sort_values/groupby order them exactly as they
+# would the strings; positions and lengths are 32-bit (END/SVLEN nullable) and
+# QUAL is float32. AF stays float64: it is written with two decimals, and in
+# float32 ratios such as 13/40 fall on the other side of the rounding boundary.
+# Columns still holding sentinels such as '.' are left as they are, and IDs,
+# ALT and RNAMES stay object. enforce_schema is cheap on a
+# frame that already conforms, so every stage calls it on what it returns.
+
+CATEGORY_COLUMNS = ('CHROM', 'CHROM2', 'SVTYPE', 'FILTER', 'TYPE', 'Sample')
+INT32_COLUMNS = ('POS', 'SUPPORT', 'NUM_CALLERS', 'GenotypeQuality', 'ReferenceReads', 'VariantReads',
+                 'Read_Count', 'SV_Count', 'RNAMES_ID')
+NULLABLE_INT32_COLUMNS = ('END', 'SVLEN')
+FLOAT32_COLUMNS = ('QUAL',)
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+def _is_number(values):
+    return pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+
+def _fits_int32(values):
+    """Integral values (NaN aside) within the int32 range."""
+    present = values.dropna()
+    if len(present) == 0:
+        return True
+    if pd.api.types.is_float_dtype(present.dtype) and not (present % 1 == 0).all():
+        return False
+    return INT32_MIN <= present.min() and present.max() <= INT32_MAX
+
+def _as_category(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        if values.cat.categories.is_monotonic_increasing:
+            return values
+        return values.cat.reorder_categories(sorted(values.cat.categories))
+    if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        return values     # mixed types (tuples, numbers) have no meaningful sort order
+    return values.astype('category')
+
+def enforce_schema(dataframe):
+    """Cast the known columns of dataframe in place to the compact dtypes; returns it."""
+    for column in CATEGORY_COLUMNS:
+        if column in dataframe.columns:
+            dataframe[column] = _as_category(dataframe[column])
+
+    for column in INT32_COLUMNS:
+        if column in dataframe.columns and _is_number(dataframe[column]):
+            values = dataframe[column]
+            if values.dtype != np.int32 and _fits_int32(values):
+                dataframe[column] = values.astype(np.int32 if values.notna().all() else 'Int32')
+
+    for column in NULLABLE_INT32_COLUMNS:
+        if column in dataframe.columns and _is_number(dataframe[column]):
+            values = dataframe[column]
+            if values.dtype != 'Int32' and _fits_int32(values):
+                dataframe[column] = values.astype('Int32')
+
+    for column in FLOAT32_COLUMNS:
+        if column in dataframe.columns and _is_number(dataframe[column]):
+            if dataframe[column].dtype != np.float32:
+                dataframe[column] = dataframe[column].astype(np.float32)
+    return dataframe
+
+def concat_frames(frames, **kwargs):
+    """
+    pd.concat that keeps categorical columns categorical: their categories are
+    unioned first (pd.concat falls back to object when categories differ).
+    """
+    frames = [frame for frame in frames if frame is not None]
+    for column in CATEGORY_COLUMNS:
+        present = [frame[column] for frame in frames if column in frame.columns]
+        if not present or not all(isinstance(values.dtype, pd.CategoricalDtype) for values in present):
+            continue
+        categories = sorted(set().union(*(values.cat.categories for values in present)))
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)})
+                  if column in frame.columns else frame for frame in frames]
+    return enforce_schema(pd.concat(frames, **kwargs))
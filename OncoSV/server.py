@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import itertools
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# `OncoSV serve`: a long-running job server for orchestration that would
+# otherwise cold-start OncoSV per sample. Jobs are CLI argument lists
+# (consensus, pair, complexSV, pipeline) posted as JSON over loopback HTTP or
+# a Unix socket:
+#
+#   POST /jobs        {"argv": ["pair", "-t", ...]}  -> 202 {"id": ..., "status": "queued", ...}
+#   GET  /jobs        every job
+#   GET  /jobs/<id>   one job: status queued/running/done/failed, error, log
+#   GET  /health      worker count and jobs per status
+#
+# Jobs are validated with the CLI parser and queued to a bounded pool of
+# worker processes (--workers; at most --max-queued jobs wait, further
+# submissions get 503). Workers import the subcommands once and keep a frame
+# cache (parallel_ingest.enable_frame_cache), so normals and panels shared by
+# many tumours are parsed once per worker. Each job runs like a batch stage:
+# its output goes to a log file under --log-dir. Paths in argv are resolved
+# by the server, so submit absolute paths.
+
+SERVED_COMMANDS = ('consensus', 'pair', 'complexSV', 'pipeline')
+
+def _start_worker(cache_size):
+    """Worker initializer: import the subcommands and enable the frame cache."""
+    from . import main_complexSV, main_consensus, main_pipeline, main_somatic  # noqa: F401
+    from .parallel_ingest import enable_frame_cache
+    enable_frame_cache(cache_size)
+
+class QueueFull(Exception):
+    pass
+
+class JobQueue:
+    """Submitted jobs and the worker pool that runs them."""
+
+    def __init__(self, workers=1, max_queued=100, log_dir='oncosv_serve_logs', cache_size=8):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.log_dir = os.path.abspath(log_dir)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(cache_size,))
+        self.jobs = {}
+        self.futures = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def _status(self, job_id):
+        job = self.jobs[job_id]
+        if job['status'] == 'queued' and self.futures[job_id].running():
+            job['status'] = 'running'
+        return dict(job)
+
+    def _counts(self):
+        statuses = [self._status(job_id)['status'] for job_id in self.jobs]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
+
+    def counts(self):
+        """Number of jobs per status."""
+        with self.lock:
+            return self._counts()
+
+    def submit(self, argv):
+        """Queue a CLI invocation; raises ValueError for an invalid one and QueueFull when the queue is full."""
+        from .cli import build_parser
+        from .main_batch import run_task
+        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+            raise ValueError('"argv" must be a list of strings')
+        if not argv or argv[0] not in SERVED_COMMANDS:
+            raise ValueError(f"Served commands: {', '.join(SERVED_COMMANDS)}")
+        usage = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(usage):
+                build_parser().parse_args(argv)
+        except SystemExit:
+            raise ValueError(usage.getvalue().strip().splitlines()[-1])
+
+        with self.lock:
+            if self._counts()['queued'] >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} jobs already queued")
+            job_id = str(next(self.ids))
+            job = {'id': job_id, 'argv': argv, 'status': 'queued', 'error': None, 'submitted': time.time(),
+                   'finished': None, 'log': os.path.join(self.log_dir, f'job_{job_id}_{argv[0]}.log')}
+            self.jobs[job_id] = job
+            self.futures[job_id] = future = self.executor.submit(run_task, argv, job['log'])
+        future.add_done_callback(lambda future: self._finished(job_id, future))
+        return dict(job)
+
+    def _finished(self, job_id, future):
+        try:
+            error = future.result()
+        except Exception as exc:     # worker process died
+            error = f"{type(exc).__name__}: {exc}"
+        with self.lock:
+            job = self.jobs[job_id]
+            job['status'] = 'done' if error is None else 'failed'
+            job['error'] = error
+            job['finished'] = time.time()
+        print(f"Job {job_id} ({job['argv'][0]}): {job['status']}" + (f" ({error})" if error else ''))
+
+    def get(self, job_id):
+        with self.lock:
+            return self._status(job_id) if job_id in self.jobs else None
+
+    def all(self):
+        with self.lock:
+            return [self._status(job_id) for job_id in self.jobs]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'OncoSV'
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        queue = self.server.job_queue
+        path = self.path.rstrip('/')
+        if path == '/health':
+            self._reply(200, {'status': 'ok', 'workers': queue.workers, 'jobs': queue.counts()})
+        elif path == '/jobs':
+            self._reply(200, queue.all())
+        elif path.startswith('/jobs/'):
+            job = queue.get(path[len('/jobs/'):])
+            self._reply(200, job) if job else self._reply(404, {'error': 'no such job'})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.job_queue.submit(request.get('argv') if isinstance(request, dict) else None)
+        except (ValueError, json.JSONDecodeError) as error:
+            self._reply(400, {'error': str(error)})
+        except QueueFull as error:
+            self._reply(503, {'error': str(error)})
+        else:
+            self._reply(202, job)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+def make_server(args, job_queue):
+    """An HTTP server on --socket, or on 127.0.0.1:--port."""
+    socket_path = getattr(args, 'socket', None)
+    if socket_path:
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise ValueError(f"{socket_path} exists and is not a socket")
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, JobRequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), JobRequestHandler)
+        server.daemon_threads = True
+        address = f"http://127.0.0.1:{server.server_address[1]}"
+    server.job_queue = job_queue
+    return server, address
+
+def run_serve(args):
+    os.makedirs(args.log_dir, exist_ok=True)
+    job_queue = JobQueue(args.workers, args.max_queued, args.log_dir, args.cache_size)
+    server, address = make_server(args, job_queue)
+    print(f"OncoSV serving on {address} with {args.workers} worker(s); logs in {args.log_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.server_close()
+        job_queue.shutdown()
+        if getattr(args, 'socket', None) and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+from collections import Counter
+from .contigs import PRIMARY_CHROMS
+from .header_combine import _open_vcf
+from .prepare_vcf_output_file import write_vcf_file
+
+# Chromosome sharding: `consensus --shard` and `pair --shard` run on a subset
+# of chromosomes (-x) and record their outputs in a small JSON manifest;
+# `merge` joins the shards of one sample into a single VCF per output.
+#
+# A record belongs to the shard of its CHROM. A breakend whose mate lies in
+# another shard is kept by its own shard only (consensus shards accept mates on
+# any chromosome), so merged outputs hold every call exactly once.
+#
+# Consensus shards cluster a breakend only with the calls on its own CHROM,
+# as a whole-genome run does; consensus_calling sorts each contig stably, so
+# POS ties are seeded in the same order however many contigs the run holds. Pair shards parse the tumour and the normal on
+# every contig and match the shard's tumour calls against all normal calls, so
+# a germline breakend called from the other side in the normal (tumour
+# chr1->chr5, normal chr5->chr1) is still found. Normal evidence goes to the
+# shard of the first tumour call matching it, and a normal call matched from
+# another shard is not mosaic in its own, so merged pair outputs hold the
+# whole-genome calls. The one difference: when the tumour calls a germline
+# breakend from both sides and the sides fall in different shards, the two
+# tumour records get separate germline IDs instead of a shared one.
+#
+# `merge --verify-against` compares the merged records with a whole-genome
+# run's outputs, ignoring the renumbered IDs, and fails on any difference.
+#
+# IDs restart in every shard, so merge renumbers them: consensusSV.<TYPE>.<n>
+# and somatic/germline.<TYPE>.<n> get new numbers in order of first appearance
+# in the merged output, shared across the pair outputs so germline tumour and
+# normal-evidence records stay linked.
+
+SHARD_MANIFEST_VERSION = 1
+
+ID_PATTERNS = {
+    'consensus': re.compile(r'(?<=ConsensusSV_ID=consensusSV\.)([^.;\t]+)\.(\d+)'),
+    'pair': re.compile(r'(?<=Variant_ID=)((?:somatic|germline)\.[^.;\t]+)\.(\d+)'),
+}
+# ConsensusSV_ID/Variant_ID numbers, which differ between merged shards and a whole-genome run
+ID_NUMBER = re.compile(r'((?:ConsensusSV_ID|Variant_ID)=[^;\t]+)\.\d+')
+
+def write_shard_manifest(manifest_path, command, chroms, outputs):
+    """Record a shard's chromosomes and outputs (paths relative to the manifest)."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = {
+        'version': SHARD_MANIFEST_VERSION,
+        'command': command,
+        'chroms': list(chroms),
+        'outputs': {kind: os.path.relpath(os.path.abspath(path), base_dir) for kind, path in outputs.items()},
+    }
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+def read_shard_manifest(manifest_path):
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    if manifest.get('version') != SHARD_MANIFEST_VERSION:
+        raise ValueError(f"Unsupported shard manifest version in {manifest_path}")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest['outputs'] = {kind: os.path.join(base_dir, path) for kind, path in manifest['outputs'].items()}
+    manifest['path'] = manifest_path
+    return manifest
+
+def chrom_rank(chrom):
+    """Sort key putting the primary chromosomes first, in karyotype order."""
+    if chrom in PRIMARY_CHROMS:
+        return (0, PRIMARY_CHROMS.index(chrom), '')
+    return (1, 0, chrom)
+
+def order_shards(manifests):
+    """Check that the shards are compatible and disjoint, and sort them by chromosome."""
+    commands = {manifest['command'] for manifest in manifests}
+    if len(commands) != 1:
+        raise ValueError(f"Cannot merge shards of different commands: {', '.join(sorted(commands))}")
+    kinds = {tuple(manifest['outputs']) for manifest in manifests}
+    if len(kinds) != 1:
+        raise ValueError("Shards were written with different outputs (e.g. --only-somatic on some of them)")
+
+    owner = {}
+    for manifest in manifests:
+        for chrom in manifest['chroms']:
+            if chrom in owner:
+                raise ValueError(f"{chrom} is in both {owner[chrom]} and {manifest['path']}")
+            owner[chrom] = manifest['path']
+    return sorted(manifests, key=lambda manifest: min(chrom_rank(chrom) for chrom in manifest['chroms']))
+
+def read_vcf_text(file_path):
+    """Header lines (without newline) and newline-terminated data lines of a VCF."""
+    header, records = [], []
+    with _open_vcf(file_path) as file:
+        for line in file:
+            if line.startswith('#'):
+                header.append(line.rstrip('\n'))
+            elif line.strip():
+                records.append(line if line.endswith('\n') else line + '\n')
+    return header, records
+
+def merge_headers(headers):
+    """
+    The first header, with any contig/FILTER/... meta-lines the other shards
+    add inserted after the last line of the same key.
+    """
+    merged = list(headers[0])
+    for header in headers[1:]:
+        for line in header:
+            if line in merged or not line.startswith('##'):
+                continue
+            key = line.split('=', 1)[0] + '='
+            same_key = [i for i, existing in enumerate(merged) if existing.startswith(key)]
+            position = same_key[-1] + 1 if same_key else len(merged) - 1
+            merged.insert(position, line)
+    return merged
+
+def sort_records(records):
+    """
+    (shard index, line) pairs grouped by chromosome (karyotype order) and
+    sorted by POS, as tabix requires; ties keep their shard order.
+    """
+    def key(record):
+        chrom, pos = record[1].split('\t', 2)[:2]
+        return chrom_rank(chrom), int(pos)
+    return sorted(records, key=key)
+
+class IdRenumberer:
+    """New ID numbers by first appearance, keyed by (shard, old number)."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.numbers = {}
+
+    def renumber(self, shard_index, line):
+        def replace(match):
+            key = (shard_index, match.group(2))
+            if key not in self.numbers:
+                self.numbers[key] = len(self.numbers) + 1
+            return f"{match.group(1)}.{self.numbers[key]}"
+        return self.pattern.sub(replace, line, count=1)
+
+def merged_output_filename(command, kind, shard_output, out, compress):
+    """Consensus shards merge into the file `out`; pair shards into the directory `out`."""
+    if command == 'consensus':
+        filename = out
+    else:
+        filename = os.path.join(out, os.path.basename(shard_output))
+    if filename.endswith('.gz'):
+        filename = filename[:-3]
+    if not filename.endswith('.vcf'):
+        filename += '.vcf'
+    return filename + '.gz' if compress else filename
+
+def merge_shards(manifest_paths, out, compress=True, threads=1):
+    """Merge shard outputs; returns {kind: (output filename, record count)}."""
+    manifests = order_shards([read_shard_manifest(path) for path in manifest_paths])
+    command = manifests[0]['command']
+    renumberer = IdRenumberer(ID_PATTERNS[command])
+
+    merged = {}
+    for kind in manifests[0]['outputs']:
+        headers, records = [], []
+        for shard_index, manifest in enumerate(manifests):
+            header, shard_records = read_vcf_text(manifest['outputs'][kind])
+            headers.append(header)
+            records.extend((shard_index, line) for line in shard_records)
+        lines = [renumberer.renumber(shard_index, line) for shard_index, line in sort_records(records)]
+
+        output_filename = merged_output_filename(command, kind, manifests[0]['outputs'][kind], out, compress)
+        if os.path.dirname(output_filename):
+            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+        write_vcf_file(output_filename, merge_headers(headers), lines, compress, threads)
+        merged[kind] = (output_filename, len(lines))
+    return merged
+
+def whole_genome_output(command, output_filename, reference):
+    """The whole-genome file matching a merged output: reference itself (consensus) or its namesake in it (pair)."""
+    if command == 'consensus':
+        return reference
+    name = os.path.basename(output_filename)
+    name = name[:-3] if name.endswith('.gz') else name
+    for candidate in (name, name + '.gz'):
+        if os.path.exists(os.path.join(reference, candidate)):
+            return os.path.join(reference, candidate)
+    raise ValueError(f"No {name}(.gz) in {reference} to compare {output_filename} with")
+
+def compare_records(merged_file, reference_file):
+    """(missing, extra): records of reference_file absent from merged_file and vice versa, IDs without numbers."""
+    def records(file_path):
+        return Counter(ID_NUMBER.sub(r'\1', line.rstrip('\n')) for line in read_vcf_text(file_path)[1])
+    merged, reference = records(merged_file), records(reference_file)
+    return list((reference - merged).elements()), list((merged - reference).elements())
+
+def verify_merge(command, merged, reference):
+    """Raise ValueError unless every merged output holds the records of the whole-genome run at reference."""
+    differing = []
+    for output_filename, _ in merged.values():
+        reference_file = whole_genome_output(command, output_filename, reference)
+        missing, extra = compare_records(output_filename, reference_file)
+        if missing or extra:
+            differing.append(output_filename)
+            print(f"{output_filename}: {len(missing)} record(s) only in {reference_file}, {len(extra)} only in the shards")
+            for line in (missing + extra)[:5]:
+                print('  ' + '\t'.join(line.split('\t')[:5]))
+        else:
+            print(f"{output_filename}: same records as {reference_file}")
+    if differing:
+        raise ValueError(f"Merged shards differ from the whole-genome run in {len(differing)} output(s)")
+
+def run_merge(args):
+    print(f"Merging {len(args.shards)} shard(s)...")
+    merged = merge_shards(args.shards, args.out, compress=not args.uncompressed, threads=args.threads)
+    for output_filename, n_records in merged.values():
+        print(f"{n_records} records written to {output_filename}")
+    if getattr(args, 'verify_against', None):
+        command = read_shard_manifest(args.shards[0])['command']
+        verify_merge(command, merged, args.verify_against)
+    print("Shard merge completed")
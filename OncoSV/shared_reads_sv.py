@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
+import numpy as np
 import pandas as pd
 import re
 from collections import defaultdict
+from .read_name_store import attach_read_names
+from .schema import enforce_schema
 
 def convert_to_list(x):
     if isinstance(x, str):
@@ -81,7 +84,7 @@ def format_af_value(af):
         if isinstance(af, tuple) and af:
             value = float(af[0])  # Convert to float to handle cases where it might not be a proper float.
             return f"{value:.4f}"
-        elif isinstance(af, float):  # Direct float handling
+        elif isinstance(af, (float, np.floating)):  # Direct float handling
             return f"{af:.4f}"
         elif isinstance(af, str) and af.replace('.', '', 1).isdigit():  # Check if 'af' is a numeric string.
             return f"{float(af):.4f}"
@@ -90,7 +93,13 @@ def format_af_value(af):
         return "0.0000"  # Provide a default format if 'af' is incorrect.
     return "0.0000" 
 
-def process_shared_reads(dataframe):
+# Columns of process_shared_reads, also when no read supports two SVs
+SHARED_READ_COLUMNS = ['Read', 'ID', 'ConsensusSV_ID', 'CHROM', 'CHROM2', 'POS', 'END', 'POS_BKPT', 'END_BKPT',
+                       'AF', 'Sample']
+
+def process_shared_reads(dataframe, read_names=None):
+    # RNAMES held in a ReadNameStore are only loaded here
+    dataframe = attach_read_names(dataframe, read_names, as_tuples=True)
     dataframe['RNAMES'] = dataframe['RNAMES'].apply(convert_to_list)
     shared_read_mapping = find_shared_reads(dataframe)
     output_data = []
@@ -112,7 +121,7 @@ def process_shared_reads(dataframe):
                 'AF': af_values,
                 'Sample': ",".join(set(details['Samples']))
             })
-    return pd.DataFrame(output_data)
+    return enforce_schema(pd.DataFrame(output_data, columns=SHARED_READ_COLUMNS))
 
 def summarize_sv_types(df):
     def get_csv_type(sv_ids):
@@ -161,16 +170,21 @@ def process_sv_data_with_sv_count(data):
     # Add the CSV_Type column
     read_counts = summarize_sv_types(read_counts)
 
-    return read_counts
+    return enforce_schema(read_counts)
+
+# <SV label>-pos|end-<contig>:<coordinate>; contig names may contain '-' and ':'
+BREAKPOINT = re.compile(r'^(.+?)-(pos|end)-(.+):(\d+)$')
+# '_' joins breakpoints but may also occur in contig names (chrUn_...)
+BREAKPOINT_SEPARATOR = re.compile(r'_(?=[A-Z]+\d+-(?:pos|end)-)')
 
 def extract_chr_and_coordinate(bp):
-    match = re.search(r'(chr[\dXY]+):(\d+)', bp)
-    return (match.group(1), int(match.group(2))) if match else (None, None)
+    match = BREAKPOINT.match(bp)
+    return (match.group(3), int(match.group(4))) if match else (None, None)
 
 def process_breakpoints(df):
     def process_row(pos_bkpt, end_bkpt):
-        pos_list = [f"{bp.split('-')[0]}-pos-{bp.split('-')[1]}" for bp in pos_bkpt.split(';')]
-        end_list = [f"{bp.split('-')[0]}-end-{bp.split('-')[1]}" for bp in end_bkpt.split(';')]
+        pos_list = ["{}-pos-{}".format(*bp.split('-', 1)) for bp in pos_bkpt.split(';')]
+        end_list = ["{}-end-{}".format(*bp.split('-', 1)) for bp in end_bkpt.split(';')]
 
         pos_dict = defaultdict(list)
         end_dict = defaultdict(list)
@@ -194,7 +208,8 @@ def process_breakpoints(df):
 
         return ";".join(final_order)
 
-    df['final_combination'] = df.apply(lambda row: process_row(row['POS_BKPT'], row['END_BKPT']), axis=1)
+    df['final_combination'] = [process_row(pos_bkpt, end_bkpt)
+                               for pos_bkpt, end_bkpt in zip(df['POS_BKPT'], df['END_BKPT'])]
     return df
 
 def check_overlapping_sv(final_combination):
@@ -202,15 +217,16 @@ def check_overlapping_sv(final_combination):
     overlap_results = []
 
     for combination in chr_combinations:
-        breakpoints = combination.split('_')
+        breakpoints = BREAKPOINT_SEPARATOR.split(combination)
         open_sv = []
         overlaps = []
 
         for bp in breakpoints:
-            sv = bp.split('-')[0]
-            if 'pos' in bp:
+            match = BREAKPOINT.match(bp)
+            sv, side = match.group(1), match.group(2)
+            if side == 'pos':
                 open_sv.append(sv)
-            elif 'end' in bp:
+            elif side == 'end':
                 if sv in open_sv:
                     open_sv.remove(sv)
             if len(open_sv) > 1:
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import uuid
+
+from .bgzf_tabix_writer import BGZFTabixWriter
+
+# Synthetic Sniffles2/cuteSV/SVIM-style VCFs for benchmarks and manual checks:
+# a random truth set is "called" by each caller with positional jitter and
+# dropout, so consensus, pair and complexSV all have realistic work to do.
+
+# GRCh38 primary assembly lengths, used for the simulated ##contig lines
+GRCH38_CONTIGS = {
+    'chr1': 248956422, 'chr2': 242193529, 'chr3': 198295559, 'chr4': 190214555,
+    'chr5': 181538259, 'chr6': 170805979, 'chr7': 159345973, 'chr8': 145138636,
+    'chr9': 138394717, 'chr10': 133797422, 'chr11': 135086622, 'chr12': 133275309,
+    'chr13': 114364328, 'chr14': 107043718, 'chr15': 101991189, 'chr16': 90338345,
+    'chr17': 83257441, 'chr18': 80373285, 'chr19': 58617616, 'chr20': 64444167,
+    'chr21': 46709983, 'chr22': 50818468, 'chrX': 156040895, 'chrY': 57227415
+}
+
+DEFAULT_TYPE_MIX = {'DEL': 0.40, 'INS': 0.35, 'DUP': 0.10, 'INV': 0.05}
+
+CALLER_IDS = {'sniffles': 'Sniffles2', 'cutesv': 'cuteSV', 'svim': 'svim'}
+
+
+def simulate_truth_set(n_svs, contigs=None, type_mix=None, bnd_fraction=0.1, rnames_depth=10,
+                       shared_read_fraction=0.2, seed=0):
+    """
+    Draw a list of SV dicts (CHROM, POS, SVTYPE, SVLEN, END, CHR2, READS).
+    A fraction of SVs borrow reads from their predecessor so that complexSV
+    finds shared-read networks.
+    """
+    rng = random.Random(seed)
+    contigs = contigs or GRCH38_CONTIGS
+    type_mix = type_mix or DEFAULT_TYPE_MIX
+    names = list(contigs)
+    weights = [contigs[c] for c in names]
+    svtypes = list(type_mix)
+    type_weights = [type_mix[t] for t in svtypes]
+
+    svs = []
+    for _ in range(n_svs):
+        chrom = rng.choices(names, weights)[0]
+        pos = rng.randint(10000, contigs[chrom] - 2000000)
+        reads = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(max(1, int(rng.gauss(rnames_depth, rnames_depth / 4))))]
+        if svs and rng.random() < shared_read_fraction:
+            previous = svs[-1]['READS']
+            reads = reads[:len(reads) // 2] + previous[:len(previous) // 2]
+
+        if rng.random() < bnd_fraction:
+            chrom2 = rng.choice(names)
+            end = rng.randint(10000, contigs[chrom2] - 10000)
+            svs.append({'CHROM': chrom, 'POS': pos, 'SVTYPE': 'BND', 'SVLEN': 0,
+                        'CHR2': chrom2, 'END': end, 'READS': reads})
+            continue
+
+        svtype = rng.choices(svtypes, type_weights)[0]
+        svlen = int(min(rng.lognormvariate(6.5, 1.5), 900000)) + 50
+        end = pos + 1 if svtype == 'INS' else pos + svlen
+        svs.append({'CHROM': chrom, 'POS': pos, 'SVTYPE': svtype, 'SVLEN': svlen,
+                    'CHR2': chrom, 'END': end, 'READS': reads})
+    return svs
+
+
+def simulate_tumour_normal(n_svs, overlap_rate=0.5, seed=0, **kwargs):
+    """Split a truth set into (tumour, normal) SV lists sharing `overlap_rate` germline calls."""
+    rng = random.Random(seed + 1)
+    germline = simulate_truth_set(n_svs, seed=seed, **kwargs)
+    somatic = simulate_truth_set(n_svs, seed=seed + 2, **kwargs)
+    n_shared = int(n_svs * overlap_rate)
+    tumour = germline[:n_shared] + somatic[:n_svs - n_shared]
+    normal = germline[:n_shared] + germline[n_shared:] + [sv for sv in somatic[n_svs - n_shared:] if rng.random() < 0.1]
+    return tumour, normal
+
+
+def _header_lines(caller, sample_id, contigs):
+    lines = ['##fileformat=VCFv4.2', f'##source={CALLER_IDS[caller]}-simulated']
+    lines.extend(f'##contig=<ID={c},length={l}>' for c, l in contigs.items())
+    lines.extend([
+        '##ALT=<ID=INS,Description="Insertion">',
+        '##ALT=<ID=DEL,Description="Deletion">',
+        '##ALT=<ID=DUP,Description="Duplication">',
+        '##ALT=<ID=INV,Description="Inversion">',
+        '##FILTER=<ID=PASS,Description="All filters passed">',
+        '##FILTER=<ID=GT,Description="Genotype filter">',
+        '##INFO=<ID=PRECISE,Number=0,Type=Flag,Description="Precise structural variant">',
+        '##INFO=<ID=IMPRECISE,Number=0,Type=Flag,Description="Imprecise structural variant">',
+        '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">',
+        '##INFO=<ID=SVLEN,Number=1,Type=Integer,Description="Length of structural variant">',
+        '##INFO=<ID=END,Number=1,Type=Integer,Description="End position of structural variant">',
+        '##INFO=<ID=CHR2,Number=1,Type=String,Description="Mate chromosome for BND SVs">',
+        '##INFO=<ID=SUPPORT,Number=1,Type=Integer,Description="Number of reads supporting this variant">',
+        '##INFO=<ID=RNAMES,Number=.,Type=String,Description="Names of supporting reads">',
+        '##INFO=<ID=AF,Number=1,Type=Float,Description="Allele Frequency">',
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+        '##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype quality">',
+    ])
+    if caller == 'svim':
+        lines.extend([
+            '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read depth">',
+            '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Read depth for each allele">',
+        ])
+    else:
+        lines.extend([
+            '##FORMAT=<ID=DR,Number=1,Type=Integer,Description="Number of reference reads">',
+            '##FORMAT=<ID=DV,Number=1,Type=Integer,Description="Number of variant reads">',
+        ])
+    lines.append(f'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample_id}')
+    return lines
+
+
+def _record_line(sv, caller, number, rng, jitter):
+    pos = max(1, sv['POS'] + rng.randint(-jitter, jitter))
+    svtype = sv['SVTYPE']
+    variant_reads = len(sv['READS'])
+    reference_reads = rng.randint(0, 3 * variant_reads)
+    qual = rng.randint(5, 60)
+    info = ['PRECISE' if rng.random() < 0.8 else 'IMPRECISE', f'SVTYPE={svtype}']
+
+    if svtype == 'BND':
+        alt = f"N[{sv['CHR2']}:{sv['END']}["
+        info.append(f"CHR2={sv['CHR2']}")
+    else:
+        alt = f'<{svtype}>'
+        svlen = sv['SVLEN'] + rng.randint(-jitter, jitter)
+        end = pos + 1 if svtype == 'INS' else pos + svlen
+        info.extend([f"SVLEN={-svlen if svtype == 'DEL' else svlen}", f'END={end}'])
+
+    info.append(f'SUPPORT={variant_reads}')
+    if caller != 'svim':
+        info.append('RNAMES=' + ','.join(sv['READS']))
+        info.append(f'AF={variant_reads / (variant_reads + reference_reads):.3f}')
+
+    gt = '1/1' if reference_reads < variant_reads / 4 else '0/1'
+    if caller == 'svim':
+        fmt, sample = 'GT:DP:AD', f'{gt}:{variant_reads + reference_reads}:{reference_reads},{variant_reads}'
+    else:
+        fmt, sample = 'GT:GQ:DR:DV', f'{gt}:{qual}:{reference_reads}:{variant_reads}'
+
+    record_id = f"{CALLER_IDS[caller]}.{svtype}.{number}"
+    return sv['CHROM'], pos, '\t'.join([sv['CHROM'], str(pos), record_id, 'N', alt, str(qual), 'PASS', ';'.join(info), fmt, sample])
+
+
+def write_caller_vcf(svs, caller, output_filename, sample_id='Sample', contigs=None,
+                     detection_rate=0.9, jitter=10, seed=0, compress=None):
+    """
+    Write one caller's view of `svs` as a sorted VCF (bgzipped and indexed when
+    the file name ends with .gz).
+    """
+    rng = random.Random(seed)
+    contigs = contigs or GRCH38_CONTIGS
+    order = {c: i for i, c in enumerate(contigs)}
+    records = [
+        _record_line(sv, caller, n, rng, jitter)
+        for n, sv in enumerate(svs)
+        if rng.random() < detection_rate
+    ]
+    records.sort(key=lambda r: (order[r[0]], r[1]))
+
+    compress = output_filename.endswith('.gz') if compress is None else compress
+    header = '\n'.join(_header_lines(caller, sample_id, contigs)) + '\n'
+    lines = [line + '\n' for _, _, line in records]
+    if compress:
+        with BGZFTabixWriter(output_filename) as writer:
+            writer.write(header)
+            writer.write_records(lines)
+    else:
+        with open(output_filename, 'w') as file:
+            file.write(header)
+            file.writelines(lines)
+    return output_filename
+
+
+def write_sample_vcfs(svs, out_dir, prefix, compress=True, seed=0, **kwargs):
+    """Write Sniffles2, cuteSV and SVIM VCFs for one sample; returns {caller: path}."""
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = '.vcf.gz' if compress else '.vcf'
+    return {
+        caller: write_caller_vcf(svs, caller, os.path.join(out_dir, f'{prefix}.{caller}{suffix}'), seed=seed + i, **kwargs)
+        for i, caller in enumerate(CALLER_IDS)
+    }
@@ -24,6 +24,9 @@ setup(
         'pysam>=0.22.0',
         'networkx>=2.4',
     ],
+    extras_require={
+        'parquet': ['pyarrow>=14.0.0'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',